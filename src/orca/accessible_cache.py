@@ -0,0 +1,243 @@
+# Orca
+#
+# Copyright 2019. Orca Team.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., Franklin Street, Fifth Floor,
+# Boston MA  02110-1301 USA.
+
+"""Caches properties of accessible objects. Rather than being flushed
+wholesale, cached properties are dropped selectively as the AT-SPI events
+describing changes to them arrive. Extents are the exception: toolkits do
+not reliably tell us when objects move, e.g. as the result of scrolling,
+so they are only kept until the next event is processed."""
+
+__id__        = "$Id$"
+__version__   = "$Revision$"
+__date__      = "$Date$"
+__copyright__ = "Copyright (c) 2019. Orca Team."
+__license__   = "LGPL"
+
+import pyatspi
+
+from . import debug
+
+# Used as the list of properties to drop when everything about the
+# event source should be dropped.
+#
+ALL = None
+
+class AccessibleCache:
+
+    # The maximum number of objects for which we keep properties.
+    MAX_OBJECTS = 10000
+
+    # Event type (or event type prefix) -> properties which such events make
+    # stale for the event source. The most specific matching entry is used.
+    # The object attributes, e.g. those reflecting aria attributes in web
+    # content, tend to change along with the state or children of the
+    # object, so those events drop the cached attributes as well.
+    INVALIDATIONS = {
+        'object:state-changed': ('state', 'attributes'),
+        'object:state-changed:defunct': ALL,
+        'object:property-change': ('attributes',),
+        'object:property-change:accessible-name': ('name',),
+        'object:property-change:accessible-role': ('role', 'interfaces'),
+        'object:property-change:accessible-parent': (),
+        'object:attributes-changed': ('attributes',),
+        'object:children-changed': ('childCount', 'hyperlinks', 'attributes'),
+        'object:text-changed': ('name', 'hyperlinks'),
+    }
+
+    # Events which we need to hear about even if no script is interested
+    # in them, since they are how we learn that cached properties changed.
+    # These are the specific types which the default script listens for,
+    # so that the cache does not add to the events every application sends
+    # us, plus defunct which says that an object is gone and
+    # attributes-changed which says that e.g. aria-setsize changed. States
+    # we do not hear about are not reliably current in the cached state set.
+    LISTENED_EVENTS = ['document:load-complete',
+                       'document:load-stopped',
+                       'document:reload',
+                       'object:state-changed:active',
+                       'object:state-changed:busy',
+                       'object:state-changed:checked',
+                       'object:state-changed:defunct',
+                       'object:state-changed:expanded',
+                       'object:state-changed:focused',
+                       'object:state-changed:indeterminate',
+                       'object:state-changed:pressed',
+                       'object:state-changed:selected',
+                       'object:state-changed:sensitive',
+                       'object:state-changed:showing',
+                       'object:property-change:accessible-name',
+                       'object:property-change:accessible-value',
+                       'object:attributes-changed',
+                       'object:children-changed',
+                       'object:text-changed:delete',
+                       'object:text-changed:insert']
+
+    def __init__(self):
+        self._properties = {}
+        self._invalidationsByType = {}
+        self._hits = {}
+        self._misses = {}
+
+    def getListeners(self):
+        """Returns the accessible-event listeners for the cache."""
+
+        return {eventType: self.invalidate for eventType in self.LISTENED_EVENTS}
+
+    def clear(self):
+        """Drops all the cached properties."""
+
+        self._properties = {}
+
+    def clearAttributes(self):
+        """Drops the cached object attributes of all objects."""
+
+        for cached in self._properties.values():
+            cached.pop('attributes', None)
+
+    def _getInvalidations(self, eventType):
+        if eventType in self._invalidationsByType:
+            return self._invalidationsByType[eventType]
+
+        matches = [key for key in self.INVALIDATIONS if eventType.startswith(key)]
+        if matches:
+            rv = self.INVALIDATIONS[max(matches, key=len)]
+        else:
+            rv = ()
+
+        self._invalidationsByType[eventType] = rv
+        return rv
+
+    def invalidate(self, event):
+        """Drops the cached properties which event says have changed."""
+
+        if event.type.startswith('document:'):
+            self.clear()
+            return
+
+        if event.type.startswith('object:children-changed:remove'):
+            self._drop(event.any_data, ALL)
+
+        self._drop(event.source, self._getInvalidations(event.type))
+
+    def _drop(self, obj, properties):
+        try:
+            key = hash(obj)
+        except:
+            return
+
+        if properties is ALL:
+            self._properties.pop(key, None)
+            return
+
+        cached = self._properties.get(key)
+        if not cached:
+            return
+
+        for prop in properties:
+            cached.pop(prop, None)
+
+    def _get(self, store, obj, prop, getter):
+        """Returns the cached value of prop for obj, calling getter and caching
+        its result if there is none. Exceptions from getter are not cached."""
+
+        key = hash(obj)
+        cached = store.get(key)
+        if cached is not None and prop in cached:
+            self._hits[prop] = self._hits.get(prop, 0) + 1
+            return cached[prop]
+
+        self._misses[prop] = self._misses.get(prop, 0) + 1
+        value = getter()
+        if cached is None:
+            if len(store) >= self.MAX_OBJECTS:
+                store.pop(next(iter(store)))
+            cached = store[key] = {}
+        cached[prop] = value
+        return value
+
+    def getRole(self, obj):
+        return self._get(self._properties, obj, 'role', obj.getRole)
+
+    def getState(self, obj):
+        return self._get(self._properties, obj, 'state', obj.getState)
+
+    def getName(self, obj):
+        return self._get(self._properties, obj, 'name', lambda: obj.name)
+
+    def getChildCount(self, obj):
+        return self._get(self._properties, obj, 'childCount', lambda: obj.childCount)
+
+    def getInterfaces(self, obj):
+        getter = lambda: pyatspi.utils.listInterfaces(obj)
+        return self._get(self._properties, obj, 'interfaces', getter)
+
+    def getAttributes(self, obj):
+        """Returns a dictionary of the object attributes of obj. The returned
+        dictionary is shared and must not be modified."""
+
+        getter = lambda: dict([attr.split(':', 1) for attr in obj.getAttributes()])
+        return self._get(self._properties, obj, 'attributes', getter)
+
+    def getHyperlinks(self, obj):
+        """Returns None if obj does not implement the hypertext interface.
+        Otherwise returns a (startOffsets, hyperlinks, rangesByChild) tuple,
+        where hyperlinks is a list of (startOffset, endOffset, child) tuples
+        sorted by offset, startOffsets holds the start offset of each, and
+        rangesByChild maps hash(child) to its (startOffset, endOffset). All
+        of them are shared and must not be modified."""
+
+        def getter():
+            try:
+                hypertext = obj.queryHypertext()
+            except NotImplementedError:
+                return None
+
+            hyperlinks = []
+            for i in range(hypertext.getNLinks()):
+                hyperlink = hypertext.getLink(i)
+                if hyperlink:
+                    hyperlinks.append((hyperlink.startIndex,
+                                       hyperlink.endIndex,
+                                       hyperlink.getObject(0)))
+
+            hyperlinks.sort(key=lambda x: x[0])
+            startOffsets = [x[0] for x in hyperlinks]
+            rangesByChild = {hash(x[2]): (x[0], x[1]) for x in hyperlinks}
+            return startOffsets, hyperlinks, rangesByChild
+
+        return self._get(self._properties, obj, 'hyperlinks', getter)
+
+    def getStatistics(self):
+        """Returns a dictionary of property -> (hits, misses)."""
+
+        props = set(self._hits).union(self._misses)
+        return {prop: (self._hits.get(prop, 0), self._misses.get(prop, 0)) \
+                for prop in props}
+
+    def printStatistics(self, level=debug.LEVEL_INFO):
+        for prop, (hits, misses) in sorted(self.getStatistics().items(), key=str):
+            total = hits + misses
+            msg = 'ACCESSIBLE CACHE: %s: %i hits, %i misses (%.1f%%)' \
+                  % (prop, hits, misses, 100.0 * hits / total)
+            debug.println(level, msg, True)
+
+_cache = AccessibleCache()
+
+def getCache():
+    return _cache
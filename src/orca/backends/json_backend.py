@@ -27,12 +27,20 @@ __date__      = "$Date$"
 __copyright__ = "Copyright (c) 2010-2011 Consorcio Fernando de los Rios."
 __license__   = "LGPL"
 
+from gi.repository import GLib
 from json import load, dump
+import copy
 import os
 from orca import settings, acss
 
 class Backend:
 
+    # How long, in milliseconds, we wait before writing changed settings to
+    # disk, so that several changes made together result in a single write.
+    # Settings the user explicitly saves are written at once, since Orca may
+    # be killed, e.g. when hung or replaced, before the delay has passed.
+    WRITE_DELAY = 500
+
     def __init__(self, prefsDir):
         """ Initialize the JSON Backend.
         """ 
@@ -49,6 +57,84 @@ class Backend:
                                             }
                                 }
 
+        # fileName -> ((mtime, size), prefs) for the files we have parsed,
+        # and fileName -> prefs for the files we have yet to write.
+        self._files = {}
+        self._pendingWrites = {}
+        self._flushId = 0
+
+    def _getSignature(self, fileName):
+        try:
+            stat = os.stat(fileName)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self, fileName):
+        """ Returns a copy of the parsed contents of fileName, or None if it
+            does not exist. The file is only parsed again if it changed on
+            disk. Changes to the returned prefs must be written back with
+            _write. """
+        if fileName in self._pendingWrites:
+            return copy.deepcopy(self._pendingWrites[fileName])
+
+        signature = self._getSignature(fileName)
+        if signature is None:
+            self._files.pop(fileName, None)
+            return None
+
+        cached = self._files.get(fileName)
+        if cached and cached[0] == signature:
+            return copy.deepcopy(cached[1])
+
+        with open(fileName, 'r') as settingsFile:
+            prefs = load(settingsFile)
+
+        self._files[fileName] = signature, prefs
+        return copy.deepcopy(prefs)
+
+    def _write(self, fileName, prefs):
+        """ Schedules prefs, which must not be modified afterwards, to be
+            written to fileName. """
+        self._pendingWrites[fileName] = prefs
+        if not self._flushId:
+            self._flushId = GLib.timeout_add(self.WRITE_DELAY, self._onFlushTimeout)
+
+    def _onFlushTimeout(self):
+        self._flushId = 0
+        self.flush()
+        return False
+
+    def flush(self):
+        """ Writes all pending changes to disk. Each file is written to a
+            temporary file which then replaces it, so that a crash never
+            leaves a partially-written settings file behind. """
+        if self._flushId:
+            GLib.source_remove(self._flushId)
+            self._flushId = 0
+
+        # If a file cannot be written, its changes are dropped so that what
+        # we read back is what is on disk. The other files are still written.
+        error = None
+        while self._pendingWrites:
+            fileName = next(iter(self._pendingWrites))
+            prefs = self._pendingWrites.pop(fileName)
+            tempName = "%s.tmp" % fileName
+            try:
+                with open(tempName, 'w') as settingsFile:
+                    dump(prefs, settingsFile, indent=4)
+                    settingsFile.flush()
+                    os.fsync(settingsFile.fileno())
+                os.replace(tempName, fileName)
+            except Exception as e:
+                error = error or e
+                continue
+            self._files[fileName] = self._getSignature(fileName), prefs
+
+        if error:
+            raise error
+
     def saveDefaultSettings(self, general, pronunciations, keybindings):
         """ Save default settings for all the properties from
             orca.settings. """
@@ -62,18 +148,13 @@ class Backend:
         self.pronunciations = pronunciations
         self.keybindings = keybindings
 
-        settingsFile = open(self.settingsFile, 'w')
-        dump(prefs, settingsFile, indent=4)
-        settingsFile.close()
+        self._write(self.settingsFile, copy.deepcopy(prefs))
 
     def getAppSettings(self, appName):
         fileName = os.path.join(self.appPrefsDir, "%s.conf" % appName)
-        if os.path.exists(fileName):
-            settingsFile = open(fileName, 'r')
-            prefs = load(settingsFile)
-            settingsFile.close()
-        else:
-            prefs = {}
+        prefs = self._read(fileName)
+        if prefs is None:
+            return {}
 
         return prefs
 
@@ -86,9 +167,8 @@ class Backend:
         prefs['profiles'] = profiles
 
         fileName = os.path.join(self.appPrefsDir, "%s.conf" % appName)
-        settingsFile = open(fileName, 'w')
-        dump(prefs, settingsFile, indent=4)
-        settingsFile.close()
+        self._write(fileName, copy.deepcopy(prefs))
+        self.flush()
 
     def saveProfileSettings(self, profile, general,
                                   pronunciations, keybindings):
@@ -100,21 +180,18 @@ class Backend:
         general['pronunciations'] = pronunciations
         general['keybindings'] = keybindings
 
-        with open(self.settingsFile, 'r+') as settingsFile:
-            prefs = load(settingsFile)
-            prefs['profiles'][profile] = general
-            settingsFile.seek(0)
-            settingsFile.truncate()
-            dump(prefs, settingsFile, indent=4)
+        prefs = self._read(self.settingsFile)
+        prefs['profiles'][profile] = copy.deepcopy(general)
+        self._write(self.settingsFile, prefs)
+        self.flush()
 
     def _getSettings(self):
         """ Load from config file all settings """
-        settingsFile = open(self.settingsFile)
         try:
-            prefs = load(settingsFile)
+            prefs = self._read(self.settingsFile)
         except ValueError:
             return
-        self.general = prefs['general'].copy()
+        self.general = copy.deepcopy(prefs['general'])
         self.pronunciations = prefs['pronunciations']
         self.keybindings = prefs['keybindings']
         self.profiles = prefs['profiles'].copy()
@@ -128,7 +205,7 @@ class Backend:
                                              ['Default', 'default'])
         if profile is None:
             profile = defaultProfile[1]
-        profileSettings = self.profiles[profile].copy()
+        profileSettings = copy.deepcopy(self.profiles[profile])
         for key, value in profileSettings.items():
             if key == 'voices':
                 for voiceType, voiceDef in value.items():
@@ -146,35 +223,33 @@ class Backend:
             override with profile values. """
         self._getSettings()
         pronunciations = self.pronunciations.copy()
-        profileSettings = self.profiles[profile].copy()
+        profileSettings = self.profiles[profile]
         if 'pronunciations' in profileSettings:
             pronunciations = profileSettings['pronunciations']
-        return pronunciations
+        return copy.deepcopy(pronunciations)
 
     def getKeybindings(self, profile='default'):
         """ Get keybindings settings from default settings and
             override with profile values. """
         self._getSettings()
         keybindings = self.keybindings.copy()
-        profileSettings = self.profiles[profile].copy()
+        profileSettings = self.profiles[profile]
         if 'keybindings' in profileSettings:
             keybindings = profileSettings['keybindings']
-        return keybindings
+        return copy.deepcopy(keybindings)
 
     def isFirstStart(self):
         """ Check if we're in first start. """
  
-        return not os.path.exists(self.settingsFile)
+        return self.settingsFile not in self._pendingWrites \
+            and not os.path.exists(self.settingsFile)
 
     def _setProfileKey(self, key, value):
         self.general[key] = value
 
-        with open(self.settingsFile, 'r+') as settingsFile:
-            prefs = load(settingsFile)
-            prefs['general'][key] = value
-            settingsFile.seek(0)
-            settingsFile.truncate()
-            dump(prefs, settingsFile, indent=4)
+        prefs = self._read(self.settingsFile)
+        prefs['general'][key] = value
+        self._write(self.settingsFile, prefs)
 
     def setFirstStart(self, value=False):
         """Set firstStart. This user-configurable settting is primarily
@@ -206,10 +281,8 @@ class Backend:
         if profile in self.profiles:
             removeProfileFrom(self.profiles)
 
-        with open(self.settingsFile, 'r+') as settingsFile:
-            prefs = load(settingsFile)
-            if profile in prefs['profiles']:
-                removeProfileFrom(prefs['profiles'])
-                settingsFile.seek(0)
-                settingsFile.truncate()
-                dump(prefs, settingsFile, indent=4)
+        prefs = self._read(self.settingsFile)
+        if profile in prefs['profiles']:
+            removeProfileFrom(prefs['profiles'])
+            self._write(self.settingsFile, prefs)
+            self.flush()
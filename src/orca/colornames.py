@@ -25,6 +25,8 @@ __date__      = "$Date$"
 __copyright__ = "Copyright (c) 2014 Igalia, S.L."
 __license__   = "LGPL"
 
+import functools
+
 from .orca_i18n import C_
 
 cssNames = {}
@@ -724,6 +726,19 @@ cssNames["#ffff00"] = C_("color name", "yellow")
 # http://en.wikipedia.org/wiki/Web_colors#X11_color_names.
 cssNames["#9acd32"] = C_("color name", "yellow green")
 
+# The (red, green, blue, hex string) of each of the cssNames, built on first
+# use so that the hex strings are not parsed for every lookup.
+_cssColors = None
+
+def _getCSSColors():
+    global _cssColors
+    if _cssColors is None:
+        _cssColors = [(int(key[1:3], 16), int(key[3:5], 16), int(key[5:7], 16), key)
+                      for key in cssNames]
+
+    return _cssColors
+
+@functools.lru_cache(maxsize=256)
 def rgbToName(red, green, blue):
     """Returns the localized name for the RGB value."""
 
@@ -732,23 +747,27 @@ def rgbToName(red, green, blue):
     if cssName:
         return cssName
 
-    # Find the closest match.
-    colors = {}
-    for key, value in cssNames.items():
-        r, g, b = [int(s, 16) for s in (key[1:3], key[3:5], key[5:7])]
-        rd = abs(r - red) ** 2
-        gd = abs(g - green) ** 2
-        bd = abs(b - blue) ** 2
-        colors[(rd + gd + bd)] = key
+    # Find the closest match, and the runner-up at the next larger distance.
+    # Among colors at the same distance, the last one wins.
+    d1 = d2 = None
+    match = runnerUp = None
+    for r, g, b, key in _getCSSColors():
+        d = (r - red) ** 2 + (g - green) ** 2 + (b - blue) ** 2
+        if d1 is None or d < d1:
+            d2, runnerUp = d1, match
+            d1, match = d, key
+        elif d == d1:
+            match = key
+        elif d2 is None or d < d2:
+            d2, runnerUp = d, key
+        elif d == d2:
+            runnerUp = key
 
     # Hold black and white to higher standards than the other close colors.
-    d1 = min(colors.keys())
-    match = colors.pop(d1)
     if not match in ["#000000", "#ffffff"]:
         return cssNames.get(match)
 
-    d2 = min(colors.keys())
     if d2 - d1 < d1:
-        match = colors.pop(d2)
+        match = runnerUp
 
     return cssNames.get(match)
@@ -98,6 +98,17 @@ LEVEL_ALL = 0
 
 debugLevel = LEVEL_SEVERE
 
+# Per-subsystem debug levels which take precedence over debugLevel. The
+# subsystem of a message is the prefix before the first colon, e.g. 'WEB'
+# for 'WEB: Clearing all cached info'. Thus to only get the output of the
+# event manager and the web script, one might set:
+#
+# debug.debugLevel = debug.LEVEL_OFF
+# debug.subsystemLevels = {'EVENT MANAGER': debug.LEVEL_ALL,
+#                          'WEB': debug.LEVEL_ALL}
+#
+subsystemLevels = {}
+
 # The debug file.  If this is not set, then all debug output is done
 # via stdout.  If this is set, then all debug output is sent to the
 # file.  This can be useful for debugging because one can pass in a
@@ -194,6 +205,17 @@ def printStack(level):
         traceback.print_stack(None, 100, debugFile)
         println(level)
 
+def isEnabled(level, subsystem=None):
+    """Returns True if output of the given level from the given subsystem
+    would be printed. Useful for skipping work done only for debugging.
+
+    Arguments:
+    - level: the accepted debug level
+    - subsystem: the subsystem, e.g. 'EVENT MANAGER' (see subsystemLevels)
+    """
+
+    return level >= subsystemLevels.get(subsystem, debugLevel)
+
 def println(level, text="", timestamp=False):
     """Prints the text to stderr unless debug is enabled.
 
@@ -205,28 +227,78 @@ def println(level, text="", timestamp=False):
     - text: the text to print (default is a blank line)
     """
 
-    if level >= debugLevel:
-        text = text.replace("\ufffc", "[OBJ]")
-        if timestamp:
-            text = "%s - %s" % (time.strftime("%H:%M:%S"), text)
-        if debugFile:
-            try:
-                debugFile.writelines([text, "\n"])
-            except TypeError:
-                text = "TypeError when trying to write text"
-                debugFile.writelines([text, "\n"])
-            except:
-                text = "Exception when trying to write text"
-                debugFile.writelines([text, "\n"])
-        else:
-            try:
-                sys.stderr.writelines([text, "\n"])
-            except TypeError:
-                text = "TypeError when trying to write text"
-                sys.stderr.writelines([text, "\n"])
-            except:
-                text = "Exception when trying to write text"
-                sys.stderr.writelines([text, "\n"])
+    if subsystemLevels:
+        if not isEnabled(level, text.split(":", 1)[0]):
+            return
+    elif level < debugLevel:
+        return
+
+    _write(text, timestamp)
+    if level >= LEVEL_SEVERE:
+        flush()
+
+def printMessage(level, subsystem, text, *args, timestamp=True):
+    """Prints "subsystem: text % args" if the level is enabled for the
+    subsystem. Unlike with println, the arguments are only formatted, and
+    those which are callables only called for their value, if the message
+    is printed. Messages whose arguments are costly to get or to convert
+    to strings (e.g. accessible objects) can thus be output from code which
+    is run often without slowing it down when debugging is off.
+
+    Arguments:
+    - level: the accepted debug level
+    - subsystem: the subsystem, e.g. 'EVENT MANAGER' (see subsystemLevels)
+    - text: the text to print, with %-style conversions for the args
+    - args: the values, or callables returning the values, to format
+    - timestamp: whether to prefix the message with the time
+    """
+
+    if level < subsystemLevels.get(subsystem, debugLevel):
+        return
+
+    if args:
+        try:
+            text = text % tuple(arg() if callable(arg) else arg for arg in args)
+        except:
+            text = "%s (exception formatting arguments)" % text
+
+    _write("%s: %s" % (subsystem, text), timestamp)
+    if level >= LEVEL_SEVERE:
+        flush()
+
+def flush():
+    """Writes out the debug output which debugFile may have buffered, e.g.
+    before Orca goes away without shutting down. Severe messages are always
+    followed by a flush, since they are often the last thing Orca outputs."""
+
+    if debugFile:
+        try:
+            debugFile.flush()
+        except:
+            pass
+
+def _write(text, timestamp):
+    text = text.replace("\ufffc", "[OBJ]")
+    if timestamp:
+        text = "%s - %s" % (time.strftime("%H:%M:%S"), text)
+    if debugFile:
+        try:
+            debugFile.writelines([text, "\n"])
+        except TypeError:
+            text = "TypeError when trying to write text"
+            debugFile.writelines([text, "\n"])
+        except:
+            text = "Exception when trying to write text"
+            debugFile.writelines([text, "\n"])
+    else:
+        try:
+            sys.stderr.writelines([text, "\n"])
+        except TypeError:
+            text = "TypeError when trying to write text"
+            sys.stderr.writelines([text, "\n"])
+        except:
+            text = "Exception when trying to write text"
+            sys.stderr.writelines([text, "\n"])
 
 def printResult(level, result=None):
     """Prints the return result, along with information about the
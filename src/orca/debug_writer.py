@@ -0,0 +1,187 @@
+# Orca
+#
+# Copyright 2019. Orca Team.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., Franklin Street, Fifth Floor,
+# Boston MA  02110-1301 USA.
+
+"""Provides a file-like object for debug output which writes it to disk
+from a separate thread. Writing the debug output of a busy session from
+the main loop as it is generated slows Orca down and changes the timing
+of what is being debugged."""
+
+__id__        = "$Id$"
+__version__   = "$Revision$"
+__date__      = "$Date$"
+__copyright__ = "Copyright (c) 2019. Orca Team."
+__license__   = "LGPL"
+
+import atexit
+import collections
+import faulthandler
+import json
+import os
+import threading
+import time
+
+class DebugWriter:
+    """Can be used as debug.debugFile. Output is buffered in memory and
+    written out in batches by a background thread, so writing to it never
+    waits for the disk. If the writer thread falls behind, the oldest
+    buffered output is discarded and the number of discarded entries is
+    noted in the log.
+
+    If fileName ends with '.jsonl', each line of output is written as a
+    JSON object holding the monotonic time at which it was written and its
+    text. Otherwise the output is written as is."""
+
+    # The maximum number of writes which are buffered.
+    MAX_ENTRIES = 50000
+
+    # The number of seconds between writes to disk.
+    FLUSH_INTERVAL = 0.5
+
+    # The size in bytes, and age in seconds, at which the file is rotated.
+    # A value of 0 means no limit.
+    MAX_BYTES = 50 * 1024 * 1024
+    MAX_AGE = 0
+
+    # The number of rotated files which are kept, as fileName.1, .2, etc.
+    BACKUP_COUNT = 5
+
+    def __init__(self, fileName):
+        self.name = fileName
+        self._useJSON = fileName.endswith('.jsonl')
+        self._buffer = collections.deque(maxlen=self.MAX_ENTRIES)
+        self._dropped = 0
+        self._partialLine = None
+        self._lock = threading.Lock()
+        self._wakeUp = threading.Event()
+        self._closed = False
+
+        self._file = open(fileName, 'w')
+        self._size = 0
+        self._openTime = time.monotonic()
+
+        self._thread = threading.Thread(target=self._run, name='DebugWriter')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, text):
+        if len(self._buffer) == self.MAX_ENTRIES:
+            self._dropped += 1
+        self._buffer.append((time.monotonic(), text))
+        if len(self._buffer) > self.MAX_ENTRIES // 2:
+            self._wakeUp.set()
+
+    def writelines(self, lines):
+        self.write(''.join(lines))
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def flush(self):
+        """Writes the buffered output to disk. Unlike write, this blocks."""
+
+        with self._lock:
+            self._writeBuffered()
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        self._wakeUp.set()
+        self._thread.join(5)
+        with self._lock:
+            self._writeBuffered()
+            self._file.close()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeUp.wait(self.FLUSH_INTERVAL)
+            self._wakeUp.clear()
+            with self._lock:
+                if self._closed:
+                    break
+                self._writeBuffered()
+
+    def _writeBuffered(self):
+        # Output written while we are at it is left for the next batch.
+        chunks = []
+        for i in range(len(self._buffer)):
+            timestamp, text = self._buffer.popleft()
+            if self._useJSON:
+                chunks.append(self._toJSON(timestamp, text))
+            else:
+                chunks.append(text)
+
+        if self._dropped:
+            text = 'DEBUG WRITER: %i entries were discarded\n' % self._dropped
+            self._dropped = 0
+            if self._useJSON:
+                text = self._toJSON(time.monotonic(), text)
+            chunks.insert(0, text)
+
+        output = ''.join(chunks)
+        if not output:
+            return
+
+        try:
+            self._file.write(output)
+            self._file.flush()
+            # In bytes, which is not len(output) for non-ASCII text.
+            self._size = self._file.tell()
+        except:
+            return
+
+        if self.MAX_BYTES and self._size >= self.MAX_BYTES \
+           or self.MAX_AGE and time.monotonic() - self._openTime >= self.MAX_AGE:
+            self._rotate()
+
+    def _toJSON(self, timestamp, text):
+        """Returns the JSON lines for the complete lines of text. Text after
+        the last newline is held until the rest of its line is written."""
+
+        if self._partialLine:
+            timestamp, start = self._partialLine
+            text = start + text
+            self._partialLine = None
+
+        lines = text.split('\n')
+        if lines[-1]:
+            self._partialLine = timestamp, lines[-1]
+
+        records = [json.dumps({'time': timestamp, 'text': line}) for line in lines[:-1]]
+        return ''.join('%s\n' % record for record in records)
+
+    def _rotate(self):
+        try:
+            self._file.close()
+            for i in range(self.BACKUP_COUNT - 1, 0, -1):
+                source = '%s.%i' % (self.name, i)
+                if os.path.exists(source):
+                    os.replace(source, '%s.%i' % (self.name, i + 1))
+            if self.BACKUP_COUNT:
+                os.replace(self.name, '%s.1' % self.name)
+        finally:
+            self._file = open(self.name, 'w')
+            self._size = 0
+            self._openTime = time.monotonic()
+
+        # Otherwise fatal errors would be reported in the rotated file.
+        if faulthandler.is_enabled():
+            faulthandler.enable(file=self._file, all_threads=False)
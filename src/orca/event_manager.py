@@ -25,20 +25,203 @@ __copyright__ = "Copyright (c) 2011. Orca Team."
 __license__   = "LGPL"
 
 from gi.repository import GLib
+import collections
 import pyatspi
 import queue
 import threading
 import time
 
+from . import accessible_cache
 from . import debug
+from . import flat_review
 from . import input_event
 from . import messages
 from . import orca_state
 from . import script_manager
 from . import settings
+from . import table_cache
 
+_accessibleCache = accessible_cache.getCache()
+_zoneCache = flat_review.getZoneCache()
+_tableCache = table_cache.getCache()
 _scriptManager = script_manager.getManager()
 
+# Event priorities. Lower values are dequeued first.
+#
+PRIORITY_INPUT = 0
+PRIORITY_FOCUS = 1
+PRIORITY_ACTIVE_APP = 2
+PRIORITY_DEFAULT = 3
+
+_eventTypeLineages = {}
+
+def _getEventTypeLineage(eventType):
+    """Returns a tuple containing eventType and each of its colon-delimited
+    prefixes, from the most to the least specific. For instance,
+    'object:state-changed:focused' results in ('object:state-changed:focused',
+    'object:state-changed', 'object')."""
+
+    lineage = _eventTypeLineages.get(eventType)
+    if lineage is None:
+        segments = eventType.rstrip(':').split(':')
+        lineage = tuple(':'.join(segments[:i]) for i in range(len(segments), 0, -1))
+        _eventTypeLineages[eventType] = lineage
+
+    return lineage
+
+class IgnoreRule:
+    """Describes when an event should be ignored based on the role and state
+    of its source. All of the given conditions must hold for the rule to
+    apply. A rule without conditions applies to every event of its type."""
+
+    def __init__(self, reason, roles=None, excludedRoles=None,
+                 states=None, excludedStates=None):
+        self.reason = reason
+        self.roles = frozenset(roles or [])
+        self.excludedRoles = frozenset(excludedRoles or [])
+        self.states = frozenset(states or [])
+        self.excludedStates = frozenset(excludedStates or [])
+        self.needsRole = bool(self.roles or self.excludedRoles)
+        self.needsState = bool(self.states or self.excludedStates)
+
+    def __repr__(self):
+        return '<IgnoreRule: %s>' % self.reason
+
+    def applies(self, role, state):
+        """Returns True if the rule applies given the source's role and state.
+        Either may be None if the rule does not need it."""
+
+        if self.roles and role not in self.roles:
+            return False
+        if self.excludedRoles and role in self.excludedRoles:
+            return False
+        for s in self.states:
+            if not state.contains(s):
+                return False
+        for s in self.excludedStates:
+            if state.contains(s):
+                return False
+
+        return True
+
+_ignoreEventType = IgnoreRule('event type is ignored')
+
+# Event types for which we do not ask the script manager to sanity check the
+# script it finds for the event.
+_sanityCheckSkipped = frozenset([
+    "object:children-changed",
+    "object:column-reordered",
+    "object:row-reordered",
+    "object:property-change",
+    "object:selection-changed",
+    "object:state-changed:checked",
+    "object:state-changed:expanded",
+    "object:state-changed:indeterminate",
+    "object:state-changed:pressed",
+    "object:state-changed:selected",
+    "object:state-changed:sensitive",
+    "object:state-changed:showing",
+    "object:text-changed",
+])
+
+class EventQueue:
+    """A multi-level queue of (event, timestamp) items. Items are dequeued
+    from the most important non-empty level, in FIFO order within a level.
+    To prevent starvation, an item which has waited longer than the
+    starvation timeout is dequeued ahead of more important items.
+
+    Items put at or below firstOrderedLevel with the same source key, e.g.
+    the events of one application, are dequeued in the order in which they
+    were put: such an item is not given a more important level than the
+    items from its source which are still queued. Scripts rely on this order,
+    e.g. on a text-changed event being handled before the caret-moved event
+    which follows it. Items put at a more important level, e.g. focus
+    changes, are not held behind the items from their source; flush() can
+    be used to drop those which they make stale. This queue is not thread
+    safe; callers are expected to hold a lock."""
+
+    def __init__(self, levels, starvationTimeout=1.0, firstOrderedLevel=0):
+        self._levels = [collections.deque() for i in range(levels)]
+        self._starvationTimeout = starvationTimeout
+        self._firstOrderedLevel = firstOrderedLevel
+        self._pendingLevels = {}
+        self._sequence = 0
+
+    def setStarvationTimeout(self, seconds):
+        self._starvationTimeout = seconds
+
+    def put(self, item, priority, sourceKey=None):
+        priority = max(0, min(priority, len(self._levels) - 1))
+        if sourceKey is not None and priority >= self._firstOrderedLevel:
+            pending = self._pendingLevels.setdefault(sourceKey, [0] * len(self._levels))
+            for level in range(len(pending) - 1, priority, -1):
+                if pending[level]:
+                    priority = level
+                    break
+            pending[priority] += 1
+
+        self._sequence += 1
+        self._levels[priority].append((self._sequence, sourceKey, priority, item))
+
+    def get_nowait(self):
+        """Removes and returns the next item, raising queue.Empty if there
+        are no items."""
+
+        nonEmpty = [level for level in self._levels if level]
+        if not nonEmpty:
+            raise queue.Empty
+
+        level = nonEmpty[0]
+        if self._starvationTimeout and len(nonEmpty) > 1:
+            now = time.time()
+            starved = [candidate for candidate in nonEmpty[1:]
+                       if now - candidate[0][3][1] > self._starvationTimeout]
+            if starved:
+                # The oldest item goes first, even if it is not starved.
+                level = min([nonEmpty[0]] + starved, key=lambda level: level[0][0])
+
+        sequence, sourceKey, priority, item = level.popleft()
+        self._removePending(sourceKey, priority)
+        return item
+
+    def _removePending(self, sourceKey, priority):
+        if sourceKey is None or priority < self._firstOrderedLevel:
+            return
+
+        pending = self._pendingLevels[sourceKey]
+        pending[priority] -= 1
+        if not any(pending):
+            del self._pendingLevels[sourceKey]
+
+    def flush(self, sourceKey, predicate):
+        """Removes the items from sourceKey at or below firstOrderedLevel for
+        which predicate returns True, and returns them."""
+
+        if sourceKey not in self._pendingLevels:
+            return []
+
+        flushed = []
+        for priority in range(self._firstOrderedLevel, len(self._levels)):
+            kept = collections.deque()
+            for entry in self._levels[priority]:
+                if entry[1] == sourceKey and predicate(entry[3]):
+                    flushed.append(entry[3])
+                    self._removePending(sourceKey, priority)
+                else:
+                    kept.append(entry)
+            self._levels[priority] = kept
+
+        return flushed
+
+    def empty(self):
+        return not any(self._levels)
+
+    def full(self):
+        return False
+
+    def qsize(self):
+        return sum(map(len, self._levels))
+
 class EventManager:
 
     EMBEDDED_OBJECT_CHARACTER = '\ufffc'
@@ -53,21 +236,104 @@ class EventManager:
         self._active = False
         self._enqueueCount = 0
         self._dequeueCount = 0
-        self._eventQueue     = queue.Queue(0)
+        self._eventQueue     = EventQueue(PRIORITY_DEFAULT + 1,
+                                          firstOrderedLevel=PRIORITY_ACTIVE_APP)
         self._gidleId        = 0
         self._gidleLock      = threading.Lock()
         self._gilSleepTime = 0.00001
         self._synchronousToolkits = ['VCL']
-        self._ignoredEvents = ['object:bounds-changed',
+
+        # Event type -> list of IgnoreRule. The rules applying to an event are
+        # those registered for its type and for each of its prefixes. They are
+        # gathered once per event type in _ignoreRulesCache.
+        self._ignoreRules = {}
+        self._ignoreRulesCache = {}
+        self.ignoreEventTypes(['object:bounds-changed',
                                'object:state-changed:defunct',
-                               'object:property-change:accessible-parent']
+                               'object:property-change:accessible-parent'])
+        self.registerIgnoreRule(
+            'object:property-change:accessible-name',
+            IgnoreRule('event type is ignored due to role',
+                       roles=[pyatspi.ROLE_CANVAS,
+                              pyatspi.ROLE_ICON,
+                              pyatspi.ROLE_MENU_ITEM]))
+        self.registerIgnoreRule(
+            'object:property-change:accessible-value',
+            IgnoreRule('event type is ignored due to role and state',
+                       roles=[pyatspi.ROLE_SPLIT_PANE],
+                       excludedStates=[pyatspi.STATE_FOCUSED]))
+        self.registerIgnoreRule(
+            'object:state-changed:sensitive',
+            IgnoreRule('event type is ignored due to role',
+                       roles=[pyatspi.ROLE_MENU_ITEM,
+                              pyatspi.ROLE_FILLER,
+                              pyatspi.ROLE_CHECK_MENU_ITEM,
+                              pyatspi.ROLE_RADIO_MENU_ITEM]))
+        self.registerIgnoreRule(
+            'object:state-changed:showing',
+            IgnoreRule('event type is ignored due to role',
+                       excludedRoles=[pyatspi.ROLE_ALERT,
+                                      pyatspi.ROLE_ANIMATION,
+                                      pyatspi.ROLE_INFO_BAR,
+                                      pyatspi.ROLE_MENU,
+                                      pyatspi.ROLE_NOTIFICATION,
+                                      pyatspi.ROLE_PANEL,
+                                      pyatspi.ROLE_STATUS_BAR,
+                                      pyatspi.ROLE_TOOL_TIP]))
+        menuRule = IgnoreRule('event type is ignored due to role',
+                              roles=[pyatspi.ROLE_MENU,
+                                     pyatspi.ROLE_LAYERED_PANE,
+                                     pyatspi.ROLE_MENU_ITEM])
+        self.registerIgnoreRule('object:children-changed:add', menuRule)
+        self.registerIgnoreRule('object:active-descendant-changed', menuRule)
+
         self._parentsOfDefunctDescendants = []
+
+        # Event types for which a newer event of the same type from the same
+        # source makes an older, still-queued event redundant. If the newer
+        # event arrived within _coalescingWindow seconds of the older one,
+        # the older one is dropped when it reaches the head of the queue.
+        # Queued events of these types are also dropped when a focus change
+        # from the same application is queued, since it goes ahead of them.
+        self._coalescedEvents = ('object:text-caret-moved',
+                                 'object:text-selection-changed',
+                                 'object:text-attributes-changed',
+                                 'object:selection-changed',
+                                 'object:active-descendant-changed',
+                                 'object:children-changed',
+                                 'object:property-change',
+                                 'object:state-changed',
+                                 'object:visible-data-changed')
+        self._coalescingWindow = 0.5
+        self._newestEvents = {}
+        self._collapsedEventCounts = {}
+
+        # The priority of each event type. Keys are matched from the most to
+        # the least specific, e.g. 'object:state-changed:focused' before
+        # 'object:state-changed' before 'object'. Events at PRIORITY_ACTIVE_APP
+        # which are not from the active application get PRIORITY_DEFAULT.
+        self._eventPriorities = {
+            'window': PRIORITY_FOCUS,
+            'focus': PRIORITY_FOCUS,
+            'object:state-changed:focused': PRIORITY_FOCUS,
+            'object:state-changed:active': PRIORITY_FOCUS,
+            'object:active-descendant-changed': PRIORITY_ACTIVE_APP,
+            'object:text-caret-moved': PRIORITY_ACTIVE_APP,
+            'object:text-changed': PRIORITY_ACTIVE_APP,
+            'object:text-selection-changed': PRIORITY_ACTIVE_APP,
+        }
         debug.println(debug.LEVEL_INFO, 'Event manager initialized', True)
 
     def activate(self):
         """Called when this presentation manager is activated."""
 
         debug.println(debug.LEVEL_INFO, 'EVENT MANAGER: Activating', True)
+
+        # Listeners are called in the order in which they were registered.
+        # The caches are registered first so that they have dropped what an
+        # event made stale before _enqueue looks at the event's source.
+        self.registerModuleListeners(_accessibleCache.getListeners())
+        self.registerModuleListeners(_zoneCache.getListeners())
         self._registerListener("window:activate")
         self._registerListener("window:deactivate")
         self._registerListener("object:children-changed")
@@ -85,33 +351,179 @@ class EventManager:
             self.registry.deregisterEventListener(self._enqueue, eventType)
         self._scriptListenerCounts = {}
         self.deregisterKeystrokeListener(self._processKeyboardEvent)
+        self.deregisterModuleListeners(_accessibleCache.getListeners())
+        self.deregisterModuleListeners(_zoneCache.getListeners())
+        _accessibleCache.printStatistics()
+        _accessibleCache.clear()
+        _zoneCache.clear()
+        _tableCache.clear()
         debug.println(debug.LEVEL_INFO, 'EVENT MANAGER: Deactivated', True)
 
     def ignoreEventTypes(self, eventTypeList):
         for eventType in eventTypeList:
-            if not eventType in self._ignoredEvents:
-                self._ignoredEvents.append(eventType)
+            self.registerIgnoreRule(eventType, _ignoreEventType)
 
     def unignoreEventTypes(self, eventTypeList):
         for eventType in eventTypeList:
-            if eventType in self._ignoredEvents:
-                self._ignoredEvents.remove(eventType)
+            self.deregisterIgnoreRule(eventType, _ignoreEventType)
+
+    def registerIgnoreRule(self, eventType, rule):
+        """Adds rule, an IgnoreRule, to the rules for events whose type is or
+        begins with eventType."""
+
+        rules = self._ignoreRules.setdefault(eventType.rstrip(':'), [])
+        if rule not in rules:
+            rules.append(rule)
+            self._ignoreRulesCache = {}
+
+    def deregisterIgnoreRule(self, eventType, rule):
+        """Removes rule, an IgnoreRule, from the rules for eventType."""
+
+        rules = self._ignoreRules.get(eventType.rstrip(':'), [])
+        if rule in rules:
+            rules.remove(rule)
+            self._ignoreRulesCache = {}
+
+    def _getIgnoreRules(self, eventType):
+        """Returns the list of IgnoreRule which apply to eventType."""
+
+        rules = self._ignoreRulesCache.get(eventType)
+        if rules is None:
+            rules = []
+            for key in _getEventTypeLineage(eventType):
+                rules.extend(self._ignoreRules.get(key, []))
+            self._ignoreRulesCache[eventType] = rules
+
+        return rules
+
+    def setCoalescingWindow(self, seconds):
+        """Sets the maximum age difference, in seconds, between an event and
+        the newer event which makes it redundant. Zero disables coalescing."""
+
+        self._coalescingWindow = seconds
+
+    def getCollapsedEventCounts(self):
+        """Returns a dictionary of event type -> number of queued events of
+        that type which were dropped because a newer event, or a focus change
+        from the same application, superseded them."""
+
+        return self._collapsedEventCounts.copy()
+
+    def resetCollapsedEventCounts(self):
+        self._collapsedEventCounts = {}
+
+    def setEventPriority(self, eventType, priority):
+        """Sets the priority with which events whose type is or begins with
+        eventType are dequeued. Priority is one of the PRIORITY_* values."""
+
+        self._eventPriorities[eventType] = priority
+
+    def setStarvationTimeout(self, seconds):
+        """Sets how long, in seconds, an event can wait behind more important
+        events before it is dequeued anyway. Zero disables the protection."""
+
+        self._eventQueue.setStarvationTimeout(seconds)
+
+    def _getPriority(self, event, app=None):
+        """Returns the priority with which the given event, from app, is
+        dequeued."""
+
+        if isinstance(event, (input_event.KeyboardEvent, input_event.BrailleEvent)):
+            return PRIORITY_INPUT
+
+        priority = None
+        for eventType in _getEventTypeLineage(event.type):
+            priority = self._eventPriorities.get(eventType)
+            if priority is not None:
+                break
+
+        if priority is None:
+            return PRIORITY_DEFAULT
+
+        if priority == PRIORITY_ACTIVE_APP:
+            script = orca_state.activeScript
+            if not (script and app and script.app == app):
+                return PRIORITY_DEFAULT
+
+        return priority
+
+    def _getCoalescingKey(self, event):
+        """Returns the key identifying the events which would make the given
+        event redundant, or None if the event is never collapsed."""
+
+        if not self._coalescingWindow:
+            return None
+
+        if not event.type.startswith(self._coalescedEvents):
+            return None
+
+        # Each added or removed child is distinct information, e.g. for live
+        # regions, so only repeated notifications for the same child collapse.
+        if event.type.startswith('object:children-changed'):
+            return event.type, event.source, event.any_data
+
+        return event.type, event.source
+
+    def _flushStaleEvents(self, sourceKey):
+        """Drops the queued events from sourceKey which a focus change, now
+        dequeued ahead of them, has made stale, e.g. the children-changed
+        events of a busy page. Must be called with the queue lock held."""
+
+        if not self._coalescingWindow:
+            return
+
+        isStale = lambda item: item[0].type.startswith(self._coalescedEvents)
+        flushed = self._eventQueue.flush(sourceKey, isStale)
+        for event, timestamp in flushed:
+            count = self._collapsedEventCounts.get(event.type, 0)
+            self._collapsedEventCounts[event.type] = count + 1
+            key = self._getCoalescingKey(event)
+            if key is not None and self._newestEvents.get(key, (None, 0))[0] is event:
+                del self._newestEvents[key]
+
+        if flushed and debug.debugEventQueue:
+            msg = 'EVENT MANAGER: Dropped %i events made stale by a focus change' \
+                % len(flushed)
+            debug.println(debug.LEVEL_ALL, msg, True)
+
+    def _isSuperseded(self, event, timestamp):
+        """Returns True if a newer, still-queued event makes this one redundant.
+        Must be called with the queue lock held."""
+
+        key = self._getCoalescingKey(event)
+        if key is None:
+            return False
+
+        newestEvent, newestTime = self._newestEvents.get(key, (None, 0))
+        if newestEvent is None:
+            return False
+
+        if newestEvent is event:
+            del self._newestEvents[key]
+            return False
+
+        if newestTime - timestamp > self._coalescingWindow:
+            return False
+
+        count = self._collapsedEventCounts.get(event.type, 0)
+        self._collapsedEventCounts[event.type] = count + 1
+        return True
 
     def _ignore(self, event):
         """Returns True if this event should be ignored."""
 
         debug.println(debug.LEVEL_INFO, '')
-        msg = 'EVENT MANAGER: %s for %s in %s (%s, %s, %s)' % \
-              (event.type, event.source, event.host_application,
-               event.detail1,event.detail2, event.any_data)
-        debug.println(debug.LEVEL_INFO, msg, True)
+        debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER', '%s for %s in %s (%s, %s, %s)',
+                           event.type, event.source, event.host_application,
+                           event.detail1, event.detail2, event.any_data)
 
         if not self._active:
             msg = 'EVENT MANAGER: Ignoring because event manager is not active'
             debug.println(debug.LEVEL_INFO, msg, True)
             return True
 
-        if list(filter(event.type.startswith, self._ignoredEvents)):
+        rules = self._getIgnoreRules(event.type)
+        if _ignoreEventType in rules:
             msg = 'EVENT MANAGER: Ignoring because event type is ignored'
             debug.println(debug.LEVEL_INFO, msg, True)
             return True
@@ -148,6 +560,11 @@ class EventManager:
                 debug.println(debug.LEVEL_INFO, msg, True)
                 return True
 
+        isChildEvent = event.type.startswith(('object:children-changed:add',
+                                              'object:active-descendant-changed'))
+        needsRole = isChildEvent or any(rule.needsRole for rule in rules)
+
+        role = None
         try:
             # TODO - JD: For now we won't ask for the name. Simply asking for the name should
             # not break anything, and should be a reliable way to quickly identify defunct
@@ -155,8 +572,9 @@ class EventManager:
             # presenting Eclipse (and possibly other) applications. This might be an AT-SPI2
             # issue, but until we know for certain....
             #name = event.source.name
-            state = event.source.getState()
-            role = event.source.getRole()
+            state = _accessibleCache.getState(event.source)
+            if needsRole:
+                role = _accessibleCache.getRole(event.source)
         except:
             msg = 'ERROR: Event is from potentially-defunct source'
             debug.println(debug.LEVEL_INFO, msg, True)
@@ -166,39 +584,13 @@ class EventManager:
             debug.println(debug.LEVEL_INFO, msg, True)
             return True
 
-        if event.type.startswith('object:property-change:accessible-name'):
-            if role in [pyatspi.ROLE_CANVAS,
-                        pyatspi.ROLE_ICON,
-                        pyatspi.ROLE_MENU_ITEM]:
-                msg = 'EVENT MANAGER: Ignoring event type due to role'
-                debug.println(debug.LEVEL_INFO, msg, True)
-                return True
-        elif event.type.startswith('object:property-change:accessible-value'):
-            if role == pyatspi.ROLE_SPLIT_PANE and not state.contains(pyatspi.STATE_FOCUSED):
-                msg = 'EVENT MANAGER: Ignoring event type due to role and state'
-                debug.println(debug.LEVEL_INFO, msg, True)
-                return True
-        elif event.type.startswith('object:state-changed:sensitive'):
-            if role in [pyatspi.ROLE_MENU_ITEM,
-                        pyatspi.ROLE_FILLER,
-                        pyatspi.ROLE_CHECK_MENU_ITEM,
-                        pyatspi.ROLE_RADIO_MENU_ITEM]:
-                msg = 'EVENT MANAGER: Ignoring event type due to role'
-                debug.println(debug.LEVEL_INFO, msg, True)
-                return True
-        elif event.type.startswith('object:state-changed:showing'):
-            if role not in [pyatspi.ROLE_ALERT,
-                            pyatspi.ROLE_ANIMATION,
-                            pyatspi.ROLE_INFO_BAR,
-                            pyatspi.ROLE_MENU,
-                            pyatspi.ROLE_NOTIFICATION,
-                            pyatspi.ROLE_PANEL,
-                            pyatspi.ROLE_STATUS_BAR,
-                            pyatspi.ROLE_TOOL_TIP]:
-                msg = 'EVENT MANAGER: Ignoring event type due to role'
-                debug.println(debug.LEVEL_INFO, msg, True)
+        for rule in rules:
+            if rule.applies(role, state):
+                debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER',
+                                   'Ignoring because %s', rule.reason)
                 return True
-        elif event.type.startswith('object:selection-changed'):
+
+        if event.type.startswith('object:selection-changed'):
             if event.source in self._parentsOfDefunctDescendants:
                 msg = 'EVENT MANAGER: Ignoring event from parent of defunct descendants'
                 debug.println(debug.LEVEL_INFO, msg, True)
@@ -211,14 +603,7 @@ class EventManager:
                 debug.println(debug.LEVEL_INFO, msg, True)
                 return True
 
-        if event.type.startswith('object:children-changed:add') \
-           or event.type.startswith('object:active-descendant-changed'):
-            if role in [pyatspi.ROLE_MENU,
-                        pyatspi.ROLE_LAYERED_PANE,
-                        pyatspi.ROLE_MENU_ITEM]:
-                msg = 'EVENT MANAGER: Ignoring event type due to role'
-                debug.println(debug.LEVEL_INFO, msg, True)
-                return True
+        if isChildEvent:
             if not event.any_data:
                 msg = 'ERROR: Event any_data lacks child/descendant'
                 debug.println(debug.LEVEL_INFO, msg, True)
@@ -257,7 +642,7 @@ class EventManager:
         debug.println(debug.LEVEL_INFO, msg, True)
         return False
 
-    def _addToQueue(self, event, asyncMode):
+    def _addToQueue(self, event, asyncMode, app=None):
         debugging = debug.debugEventQueue
         if debugging:
             debug.println(debug.LEVEL_ALL, "           acquiring lock...")
@@ -269,7 +654,20 @@ class EventManager:
             debug.println(debug.LEVEL_ALL, "           (full=%s)" \
                           % self._eventQueue.full())
 
-        self._eventQueue.put(event)
+        timestamp = time.time()
+        if not isinstance(event, input_event.InputEvent):
+            key = self._getCoalescingKey(event)
+            if key is not None:
+                self._newestEvents[key] = event, timestamp
+
+        try:
+            sourceKey = hash(app) if app else None
+        except:
+            sourceKey = None
+        priority = self._getPriority(event, app)
+        self._eventQueue.put((event, timestamp), priority, sourceKey)
+        if priority == PRIORITY_FOCUS and sourceKey is not None:
+            self._flushStaleEvents(sourceKey)
         if debugging:
             debug.println(debug.LEVEL_ALL, "           ...put complete")
 
@@ -321,6 +719,10 @@ class EventManager:
         inputEvents = (input_event.KeyboardEvent, input_event.BrailleEvent)
         isObjectEvent = not isinstance(e, inputEvents)
 
+        # Before any script, which may be synchronous, looks at the table.
+        if isObjectEvent:
+            _tableCache.invalidate(e)
+
         try:
             ignore = isObjectEvent and self._ignore(e)
         except:
@@ -335,6 +737,7 @@ class EventManager:
         self._queuePrintln(e)
 
         asyncMode = self._asyncMode
+        app = None
         if isObjectEvent:
             app = e.source.getApplication()
             try:
@@ -347,7 +750,7 @@ class EventManager:
             script = _scriptManager.getScript(app, e.source)
             script.eventCache[e.type] = (e, time.time())
 
-        self._addToQueue(e, asyncMode)
+        self._addToQueue(e, asyncMode, app)
         if not asyncMode:
             self._dequeue()
 
@@ -382,12 +785,22 @@ class EventManager:
             self._dequeueCount += 1
 
         try:
-            event = self._eventQueue.get_nowait()
-            self._queuePrintln(event, isEnqueue=False)
             inputEvents = (input_event.KeyboardEvent, input_event.BrailleEvent)
-            if isinstance(event, inputEvents):
+            with self._gidleLock:
+                event, timestamp = self._eventQueue.get_nowait()
+                superseded = not isinstance(event, inputEvents) \
+                    and self._isSuperseded(event, timestamp)
+
+            if superseded:
+                if debug.debugEventQueue:
+                    msg = 'EVENT MANAGER: Dropping %s superseded by newer event' \
+                        % event.type
+                    debug.println(debug.LEVEL_ALL, msg, True)
+            elif isinstance(event, inputEvents):
+                self._queuePrintln(event, isEnqueue=False)
                 self._processInputEvent(event)
             else:
+                self._queuePrintln(event, isEnqueue=False)
                 debug.objEvent = event
                 debugging = not debug.eventDebugFilter \
                             or debug.eventDebugFilter.match(event.type)
@@ -581,28 +994,12 @@ class EventManager:
             msg = 'WARNING: Exception when getting script for event.'
             debug.println(debug.LEVEL_WARNING, msg, True)
         else:
-            skipCheck = [
-                "object:children-changed",
-                "object:column-reordered",
-                "object:row-reordered",
-                "object:property-change",
-                "object:selection-changed"
-                "object:state-changed:checked",
-                "object:state-changed:expanded",
-                "object:state-changed:indeterminate",
-                "object:state-changed:pressed",
-                "object:state-changed:selected",
-                "object:state-changed:sensitive",
-                "object:state-changed:showing",
-                "object:text-changed",
-            ]
-            check = not list(filter(lambda x: event.type.startswith(x), skipCheck))
-            msg = 'EVENT MANAGER: Getting script for %s (check: %s)' % (app, check)
-            debug.println(debug.LEVEL_INFO, msg, True)
+            check = _sanityCheckSkipped.isdisjoint(_getEventTypeLineage(event.type))
+            debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER',
+                               'Getting script for %s (check: %s)', app, check)
             script = _scriptManager.getScript(app, event.source, sanityCheck=check)
 
-        msg = 'EVENT MANAGER: Script is %s' % script
-        debug.println(debug.LEVEL_INFO, msg, True)
+        debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER', 'Script is %s', script)
         return script
 
     def _isActivatableEvent(self, event, script=None):
@@ -690,6 +1087,11 @@ class EventManager:
         if eType.startswith("window:") and not eType.endswith("create"):
             _scriptManager.reclaimScripts()
 
+        # The tables in the window being left are unlikely to be read again
+        # soon, and the table cache listens for changes only while it has some.
+        if eType.startswith("window:deactivate"):
+            _tableCache.clear()
+
         if eType.startswith("object:state-changed:active"):
             try:
                 role = event.source.getRole()
@@ -712,16 +1114,16 @@ class EventManager:
             return
 
         if state and state.contains(pyatspi.STATE_DEFUNCT):
-            msg = 'EVENT MANAGER: Ignoring defunct object: %s' % event.source
-            debug.println(debug.LEVEL_INFO, msg, True)
+            debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER',
+                               'Ignoring defunct object: %s', event.source)
             if eType.startswith("window:deactivate"):
                 orca_state.locusOfFocus = None
                 orca_state.activeWindow = None
             return
 
         if state and state.contains(pyatspi.STATE_ICONIFIED):
-            msg = 'EVENT MANAGER: Ignoring iconified object: %s' % event.source
-            debug.println(debug.LEVEL_INFO, msg, True)
+            debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER',
+                               'Ignoring iconified object: %s', event.source)
             return
 
         if eType.startswith('object:selection-changed') \
@@ -741,8 +1143,8 @@ class EventManager:
             return
 
         setNewActiveScript, reason = self._isActivatableEvent(event, script)
-        msg = 'EVENT MANAGER: Change active script: %s (%s)' % (setNewActiveScript, reason)
-        debug.println(debug.LEVEL_INFO, msg, True)
+        debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER',
+                           'Change active script: %s (%s)', setNewActiveScript, reason)
 
         if setNewActiveScript:
             try:
@@ -765,17 +1167,17 @@ class EventManager:
             debug.println(debug.LEVEL_INFO, msg, True)
             debug.printException(debug.LEVEL_INFO)
 
-        msg = 'EVENT MANAGER: locusOfFocus: %s activeScript: %s' % \
-              (orca_state.locusOfFocus, orca_state.activeScript)
-        debug.println(debug.LEVEL_INFO, msg, True)
+        debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER',
+                           'locusOfFocus: %s activeScript: %s',
+                           orca_state.locusOfFocus, orca_state.activeScript)
 
-        if not orca_state.activeScript:
+        if not orca_state.activeScript \
+           or not debug.isEnabled(debug.LEVEL_INFO, 'EVENT MANAGER'):
             return
 
         attributes = orca_state.activeScript.getTransferableAttributes()
         for key, value in attributes.items():
-            msg = 'EVENT MANAGER: %s: %s' % (key, value)
-            debug.println(debug.LEVEL_INFO, msg, True)
+            debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER', '%s: %s', key, value)
 
     def _processKeyboardEvent(self, event):
         keyboardEvent = input_event.KeyboardEvent(event)
@@ -27,6 +27,9 @@ __copyright__ = "Copyright (c) 2005-2008 Sun Microsystems Inc." \
                 "Copyright (c) 2016 Igalia, S.L."
 __license__   = "LGPL"
 
+import array
+import bisect
+import collections.abc
 import pyatspi
 import re
 
@@ -36,12 +39,27 @@ from . import eventsynthesizer
 from . import messages
 from . import orca_state
 from . import settings
+from . import spatial_index
 
 EMBEDDED_OBJECT_CHARACTER = '\ufffc'
 
+def _getRightEdges(items):
+    """Returns the running maximum of the right edges of items, which are
+    sorted from left to right, so that it can be bisected."""
+
+    edges = []
+    for item in items:
+        edge = item.x + item.width
+        edges.append(max(edges[-1], edge) if edges else edge)
+
+    return edges
+
 class Char:
     """A character's worth of presentable information."""
 
+    __slots__ = ['word', 'index', 'startOffset', 'endOffset', 'string',
+                 'x', 'y', 'width', 'height']
+
     def __init__(self, word, index, startOffset, string, x, y, width, height):
         """Creates a new char.
 
@@ -63,9 +81,31 @@ class Char:
         self.height = height
 
 
+class Chars(collections.abc.Sequence):
+    """The chars of a Word. Only their extents are kept, by the Word; each
+    Char is created when it is asked for."""
+
+    __slots__ = ['word']
+
+    def __init__(self, word):
+        self.word = word
+
+    def __len__(self):
+        return self.word.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.word.getChar(i) for i in range(*index.indices(len(self)))]
+
+        return self.word.getChar(index)
+
+
 class Word:
     """A single chunk (word or object) of presentable information."""
 
+    __slots__ = ['zone', 'index', 'startOffset', 'string', 'length', 'endOffset',
+                 'x', 'y', 'width', 'height', '_charExtents']
+
     def __init__(self, zone, index, startOffset, string, x, y, width, height):
         """Creates a new Word.
 
@@ -87,29 +127,53 @@ class Word:
         self.y = y
         self.width = width
         self.height = height
-        self.chars = []
+        self._charExtents = None
 
-    def __getattribute__(self, attr):
-        if attr != "chars":
-            return super().__getattribute__(attr)
+    def _getCharExtents(self):
+        """Returns the x, y, width, height of each char, one after another,
+        or an empty tuple if the chars share the extents of this Word. They
+        are only asked for once, when the chars are first needed."""
 
-        # TODO - JD: For now, don't fake character and word extents.
-        # The main goal is to improve reviewability.
-        extents = self.x, self.y, self.width, self.height
+        if self._charExtents is not None:
+            return self._charExtents
 
         try:
             text = self.zone.accessible.queryText()
         except:
             text = None
 
-        chars = []
-        for i, char in enumerate(self.string):
+        # TODO - JD: For now, don't fake character and word extents.
+        # The main goal is to improve reviewability.
+        if not text:
+            self._charExtents = ()
+            return self._charExtents
+
+        extents = array.array('i')
+        for i in range(len(self.string)):
             start = i + self.startOffset
-            if text:
-                extents = text.getRangeExtents(start, start+1, pyatspi.DESKTOP_COORDS)
-            chars.append(Char(self, i, start, char, *extents))
+            extents.extend(text.getRangeExtents(start, start+1, pyatspi.DESKTOP_COORDS))
 
-        return chars
+        self._charExtents = extents
+        return extents
+
+    def getChar(self, index):
+        """Returns a new Char for the char at index in this Word."""
+
+        string = self.string[index]
+        if index < 0:
+            index += self.length
+
+        extents = self._getCharExtents()
+        if extents:
+            x, y, width, height = extents[index*4:index*4+4]
+        else:
+            x, y, width, height = self.x, self.y, self.width, self.height
+
+        return Char(self, index, index + self.startOffset, string, x, y, width, height)
+
+    @property
+    def chars(self):
+        return Chars(self)
 
     def getRelativeOffset(self, offset):
         """Returns the char offset with respect to this word or -1."""
@@ -123,6 +187,10 @@ class Word:
 class Zone:
     """Represents text that is a portion of a single horizontal line."""
 
+    __slots__ = ['accessible', 'startOffset', '_string', 'length', 'x', 'y',
+                 'width', 'height', 'role', '_words', '_wordEdges', 'line',
+                 'index', 'brailleRegion']
+
     WORDS_RE = re.compile(r"(\S+\s*)", re.UNICODE)
 
     def __init__(self, accessible, string, x, y, width, height, role=None):
@@ -144,30 +212,39 @@ class Zone:
         self.width = width
         self.height = height
         self.role = role or accessible.getRole()
-        self._words = []
-
-    def __getattribute__(self, attr):
-        """To ensure we update the content."""
+        self._words = None
+        self._wordEdges = None
+        self.line = None
+        self.index = 0
+        self.brailleRegion = None
+
+    @property
+    def string(self):
+        return self._string
+
+    @property
+    def words(self):
+        if not self._shouldFakeText():
+            return self._words or []
 
-        if attr not in ["words", "string"]:
-            return super().__getattribute__(attr)
+        if self._words is None:
+            # TODO - JD: For now, don't fake character and word extents.
+            # The main goal is to improve reviewability.
+            extents = self.x, self.y, self.width, self.height
+            self._words = [Word(self, i, word.start(), word.group(), *extents) \
+                           for i, word in enumerate(re.finditer(self.WORDS_RE, self._string))]
 
-        if attr == "string":
-            return self._string
+        return self._words
 
-        if not self._shouldFakeText():
-            return self._words
+    def getWordIndexAfter(self, x):
+        """Returns the index of the first word whose right edge is beyond x,
+        or the number of words if there is none."""
 
-        # TODO - JD: For now, don't fake character and word extents.
-        # The main goal is to improve reviewability.
-        extents = self.x, self.y, self.width, self.height
+        words = self.words
+        if self._wordEdges is None:
+            self._wordEdges = _getRightEdges(words)
 
-        words = []
-        for i, word in enumerate(re.finditer(self.WORDS_RE, self._string)):
-            words.append(Word(self, i, word.start(), word.group(), *extents))
-
-        self._words = words
-        return words
+        return bisect.bisect_right(self._wordEdges, x)
 
     def _shouldFakeText(self):
         """Returns True if we should try to fake the text interface"""
@@ -249,6 +326,8 @@ class Zone:
 class TextZone(Zone):
     """A Zone whose purpose is to display text of an object."""
 
+    __slots__ = ['endOffset', '_itext']
+
     def __init__(self, accessible, startOffset, string, x, y, width, height, role=None):
         super().__init__(accessible, string, x, y, width, height, role)
 
@@ -256,22 +335,36 @@ class TextZone(Zone):
         self.endOffset = self.startOffset + len(string)
         self._itext = self.accessible.queryText()
 
-    def __getattribute__(self, attr):
+    def _update(self):
         """To ensure we update the content."""
 
-        if not attr in ["words", "string"]:
-            return super().__getattribute__(attr)
-
         string = self._itext.getText(self.startOffset, self.endOffset)
+        if string == self._string and self._words is not None:
+            return
+
+        self._string = string
+        self._words = None
+        self._wordEdges = None
+        if self._shouldFakeText():
+            return
+
         words = []
         for i, word in enumerate(re.finditer(self.WORDS_RE, string)):
             start, end = map(lambda x: x + self.startOffset, word.span())
             extents = self._itext.getRangeExtents(start, end, pyatspi.DESKTOP_COORDS)
             words.append(Word(self, i, start, word.group(), *extents))
 
-        self._string = string
         self._words = words
-        return super().__getattribute__(attr)
+
+    @property
+    def string(self):
+        self._update()
+        return self._string
+
+    @property
+    def words(self):
+        self._update()
+        return super().words
 
     def hasCaret(self):
         """Returns True if this Zone contains the caret."""
@@ -294,20 +387,21 @@ class TextZone(Zone):
 class StateZone(Zone):
     """A Zone whose purpose is to display the state of an object."""
 
+    __slots__ = []
+
     def __init__(self, accessible, x, y, width, height, role=None):
         super().__init__(accessible, "", x, y, width, height, role)
 
-    def __getattribute__(self, attr):
-        """To ensure we update the state."""
+    # To ensure we update the state.
+    @property
+    def string(self):
+        return self._getString(orca_state.activeScript.speechGenerator)
 
-        if attr not in ["string", "brailleString"]:
-            return super().__getattribute__(attr)
-
-        if attr == "string":
-            generator = orca_state.activeScript.speechGenerator
-        else:
-            generator = orca_state.activeScript.brailleGenerator
+    @property
+    def brailleString(self):
+        return self._getString(orca_state.activeScript.brailleGenerator)
 
+    def _getString(self, generator):
         result = generator.getStateIndicator(self.accessible, role=self.role)
         if result:
             return result[0]
@@ -318,20 +412,21 @@ class StateZone(Zone):
 class ValueZone(Zone):
     """A Zone whose purpose is to display the value of an object."""
 
+    __slots__ = []
+
     def __init__(self, accessible, x, y, width, height, role=None):
         super().__init__(accessible, "", x, y, width, height, role)
 
-    def __getattribute__(self, attr):
-        """To ensure we update the value."""
-
-        if attr not in ["string", "brailleString"]:
-            return super().__getattribute__(attr)
+    # To ensure we update the value.
+    @property
+    def string(self):
+        return self._getString(orca_state.activeScript.speechGenerator)
 
-        if attr == "string":
-            generator = orca_state.activeScript.speechGenerator
-        else:
-            generator = orca_state.activeScript.brailleGenerator
+    @property
+    def brailleString(self):
+        return self._getString(orca_state.activeScript.brailleGenerator)
 
+    def _getString(self, generator):
         result = ""
 
         # TODO - JD: This cobbling together beats what we had, but the
@@ -347,6 +442,8 @@ class ValueZone(Zone):
 class Line:
     """A Line is a single line across a window and is composed of Zones."""
 
+    __slots__ = ['index', 'zones', 'brailleRegions', '_zoneEdges']
+
     def __init__(self,
                  index,
                  zones):
@@ -359,24 +456,36 @@ class Line:
         self.index = index
         self.zones = zones
         self.brailleRegions = None
+        self._zoneEdges = None
+
+    @property
+    def string(self):
+        return " ".join([zone.string for zone in self.zones])
 
-    def __getattribute__(self, attr):
-        if attr == "string":
-            return " ".join([zone.string for zone in self.zones])
+    @property
+    def x(self):
+        return min([zone.x for zone in self.zones])
 
-        if attr == "x":
-            return min([zone.x for zone in self.zones])
+    @property
+    def y(self):
+        return min([zone.y for zone in self.zones])
 
-        if attr == "y":
-            return min([zone.y for zone in self.zones])
+    @property
+    def width(self):
+        return sum([zone.width for zone in self.zones])
 
-        if attr == "width":
-            return sum([zone.width for zone in self.zones])
+    @property
+    def height(self):
+        return max([zone.height for zone in self.zones])
 
-        if attr == "height":
-            return max([zone.height for zone in self.zones])
+    def getZoneIndexAfter(self, x):
+        """Returns the index of the first zone whose right edge is beyond x,
+        or the number of zones if there is none."""
 
-        return super().__getattribute__(attr)
+        if self._zoneEdges is None:
+            self._zoneEdges = _getRightEdges(self.zones)
+
+        return bisect.bisect_right(self._zoneEdges, x)
 
     def getBrailleRegions(self):
         # [[[WDW - We'll always compute the braille regions.  This
@@ -441,6 +550,101 @@ class Line:
 
         return self.brailleRegions
 
+class ZoneCache:
+    """Keeps the zones of the objects which were showing when the flat review
+    context for a window was last created, so that they can be reused the
+    next time one is created for that window. Getting the zones is costly,
+    especially for text, which requires extents for each line. Cached zones
+    are dropped when we are told that the object's content changed or find
+    that the object or its text have moved."""
+
+    # The maximum number of windows for which we keep zones.
+    MAX_WINDOWS = 5
+
+    LISTENED_EVENTS = ['object:children-changed',
+                       'object:text-changed',
+                       'object:property-change:accessible-name',
+                       'object:property-change:accessible-role']
+
+    def __init__(self):
+        self._windows = {}
+
+    def getListeners(self):
+        """Returns the accessible-event listeners for the cache."""
+
+        return {eventType: self.invalidate for eventType in self.LISTENED_EVENTS}
+
+    def clear(self):
+        self._windows = {}
+
+    def invalidate(self, event):
+        """Drops the zones of the event source."""
+
+        try:
+            key = hash(event.source)
+        except:
+            return
+
+        for window in self._windows.values():
+            window.pop(key, None)
+
+    @staticmethod
+    def _getSignature(accessible, cliprect, zones):
+        """Returns what must be unchanged for the zones to still be valid:
+        the extents of the object and, since text can scroll within the
+        object, the current extents of the text of its first TextZone."""
+
+        extents = accessible.queryComponent().getExtents(pyatspi.DESKTOP_COORDS)
+        textExtents = None
+        for zone in zones:
+            if isinstance(zone, TextZone):
+                textExtents = tuple(zone._itext.getRangeExtents(
+                    zone.startOffset, zone.endOffset, pyatspi.DESKTOP_COORDS))
+                break
+
+        return tuple(extents), tuple(cliprect), textExtents
+
+    def startWindow(self, topLevel):
+        """Returns the zones of topLevel, which will hold only those which
+        are reused or added while creating the new context."""
+
+        key = hash(topLevel)
+        previous = self._windows.pop(key, {})
+        while len(self._windows) >= self.MAX_WINDOWS:
+            self._windows.pop(next(iter(self._windows)))
+
+        self._windows[key] = {}
+        return previous, self._windows[key]
+
+    def getZones(self, accessible, cliprect, window, getter):
+        """Returns the zones of accessible, reusing those in window if still
+        valid, otherwise calling getter. The result is stored in window."""
+
+        previous, current = window
+        try:
+            key = hash(accessible)
+        except:
+            return getter()
+
+        entry = previous.get(key)
+        if entry:
+            signature, zones = entry
+            try:
+                valid = signature == self._getSignature(accessible, cliprect, zones)
+            except:
+                valid = False
+            if valid:
+                current[key] = entry
+                return zones
+
+        zones = getter()
+        try:
+            current[key] = self._getSignature(accessible, cliprect, zones), zones
+        except:
+            pass
+
+        return zones
+
 class Context:
     """Contains the flat review regions for the current top-level object."""
 
@@ -469,6 +673,7 @@ class Context:
         self.focusZone = None
         self.container = None
         self.focusObj = orca_state.locusOfFocus
+        self._zonesIndex = None
         self.topLevel = script.utilities.topLevelObject(self.focusObj)
         self.bounds = 0, 0, 0, 0
 
@@ -487,6 +692,7 @@ class Context:
 
         self.container = container or self.topLevel
 
+        self._window = _zoneCache.startWindow(self.topLevel)
         self.zones, self.focusZone = self.getShowingZones(self.container)
         self.lines = self.clusterZonesByLine(self.zones)
         if not (self.lines and self.focusZone):
@@ -811,6 +1017,13 @@ class Context:
 
         return zones
 
+    def _getZones(self, accessible, cliprect):
+        """Returns the zones for accessible, reusing those from the previous
+        context for the window if they are still valid."""
+
+        getter = lambda: self.getZonesFromAccessible(accessible, cliprect)
+        return _zoneCache.getZones(accessible, cliprect, self._window, getter)
+
     def _isOrIsIn(self, child, parent):
         if not (child and parent):
             return False
@@ -832,11 +1045,11 @@ class Context:
 
         allZones, focusZone = [], None
         for o in objs:
-            zones = self.getZonesFromAccessible(o, boundingbox)
+            zones = self._getZones(o, boundingbox)
             if not zones:
                 descendant = self.script.utilities.realActiveDescendant(o)
                 if descendant:
-                    zones = self.getZonesFromAccessible(descendant, boundingbox)
+                    zones = self._getZones(descendant, boundingbox)
 
             if not zones:
                 continue
@@ -880,6 +1093,67 @@ class Context:
         debug.println(debug.LEVEL_INFO, msg, True)
         return lines
 
+    def _getZonesIndex(self):
+        if self._zonesIndex is None:
+            self._zonesIndex = spatial_index.SpatialIndex(self.zones)
+
+        return self._zonesIndex
+
+    def getZonesAtPoint(self, x, y):
+        """Returns the zones whose extents contain the point x, y."""
+
+        return self._getZonesIndex().getItemsAtPoint(x, y)
+
+    def getZoneAtPoint(self, x, y):
+        """Returns the smallest zone whose extents contain the point x, y,
+        or None if there is no such zone."""
+
+        zones = self.getZonesAtPoint(x, y)
+        if not zones:
+            return None
+
+        return min(zones, key=lambda zone: zone.width * zone.height)
+
+    def getWordsInColumns(self, x, width):
+        """Returns the words which intersect the columns from x to x + width,
+        sorted by their zone's line and then from left to right."""
+
+        zones = self._getZonesIndex().getItemsInColumns(x, width)
+        zones.sort(key=lambda zone: (zone.line.index if zone.line else -1, zone.x))
+
+        words = []
+        for zone in zones:
+            for word in zone.words:
+                if word.x + word.width > x and word.x <= x + width:
+                    words.append(word)
+
+        return words
+
+    def _goToColumn(self, x):
+        """Moves to the first char on the current line which is at or beyond
+        x, or to the last char of the line if there is none. Zones without
+        words are treated as a single char."""
+
+        line = self.lines[self.lineIndex]
+        zones = line.zones
+        start = line.getZoneIndexAfter(x)
+        for zoneIndex in range(min(start, len(zones) - 1), len(zones)):
+            zone = zones[zoneIndex]
+            self.zoneIndex, self.wordIndex, self.charIndex = zoneIndex, 0, 0
+            words = zone.words
+            if not words:
+                if zone.x >= x:
+                    return
+                continue
+
+            start = zone.getWordIndexAfter(x)
+            for wordIndex in range(min(start, len(words) - 1), len(words)):
+                self.wordIndex, self.charIndex = wordIndex, 0
+                for charIndex, char in enumerate(words[wordIndex].chars):
+                    self.charIndex = charIndex
+                    if char.x >= x:
+                        return
+
     def getCurrent(self, flatReviewType=ZONE):
         """Returns the current string, offset, and extent information."""
 
@@ -1379,13 +1653,7 @@ class Context:
 
             moved = self.goPrevious(Context.LINE, wrap)
             if moved:
-                while True:
-                    [string, bx, by, bwidth, bheight] = \
-                             self.getCurrent(Context.CHAR)
-                    if (bx + width) >= middleTargetX:
-                        break
-                    elif not self.goNext(Context.CHAR, Context.WRAP_NONE):
-                        break
+                self._goToColumn(middleTargetX - width)
 
             # Moving around might have reset the current targetCharInfo,
             # so we reset it to our saved value.
@@ -1426,13 +1694,7 @@ class Context:
 
             moved = self.goNext(Context.LINE, wrap)
             if moved:
-                while True:
-                    [string, bx, by, bwidth, bheight] = \
-                             self.getCurrent(Context.CHAR)
-                    if (bx + width) >= middleTargetX:
-                        break
-                    elif not self.goNext(Context.CHAR, Context.WRAP_NONE):
-                        break
+                self._goToColumn(middleTargetX - width)
 
             # Moving around might have reset the current targetCharInfo,
             # so we reset it to our saved value.
@@ -1444,3 +1706,8 @@ class Context:
             raise Exception("Invalid type: %d" % flatReviewType)
 
         return moved
+
+_zoneCache = ZoneCache()
+
+def getZoneCache():
+    return _zoneCache
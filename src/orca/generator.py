@@ -27,29 +27,89 @@ __copyright__ = "Copyright (c) 2009 Sun Microsystems Inc." \
                 "Copyright (c) 2015-2016 Igalia, S.L."
 __license__   = "LGPL"
 
+import builtins
 import collections
 import pyatspi
-import sys
 import time
-import traceback
 from gi.repository import Atspi, Atk
 
+from . import accessible_cache
 from . import braille
 from . import debug
 from . import messages
 from . import object_properties
 from . import settings
 from . import settings_manager
+from . import table_cache
 
-def _formatExceptionInfo(maxTBlevel=5):
-    cla, exc, trbk = sys.exc_info()
-    excName = cla.__name__
-    try:
-        excArgs = exc.args
-    except KeyError:
-        excArgs = "<no args>"
-    excTb = traceback.format_tb(trbk, maxTBlevel)
-    return (excName, excArgs, excTb)
+# Formatting strings compiled into code objects, keyed by the string.
+#
+_compiledFormats = {}
+
+def _compileFormat(formatting):
+    """Returns the code object for the given formatting string, compiling
+    it the first time the string is seen."""
+
+    code = _compiledFormats.get(formatting)
+    if code is None:
+        code = compile(formatting, '<formatting>', 'eval')
+        _compiledFormats[formatting] = code
+
+    return code
+
+class _GeneratorResults(dict):
+    """The namespace in which a compiled formatting string is evaluated.
+    Looking up the name of a generator which has not been called yet calls
+    it and keeps its result, so each generator referenced by the formatting
+    string is called at most once, and only if evaluation reaches it. The
+    'and' and 'or' operators in the string thus short-circuit generation.
+
+    Results are also kept in memo, keyed by (obj, name, args), so that the
+    same generator called for the same object and arguments while producing
+    one presentation is only run once."""
+
+    def __init__(self, methodsDict, globalsDict, obj, args, memo):
+        dict.__init__(self)
+        self._methodsDict = methodsDict
+        self._globalsDict = globalsDict
+        self._obj = obj
+        self._args = args
+        self._memo = memo
+
+    def __missing__(self, name):
+        # Names which are not generators, or which the generator has made
+        # available as globals, are resolved from the globals.
+        if name not in self._methodsDict or name in self._globalsDict:
+            raise KeyError(name)
+
+        try:
+            key = (self._obj, name, tuple(sorted(self._args.items())))
+            hash(key)
+        except TypeError:
+            key = None
+
+        if key is not None and key in self._memo:
+            result = self._memo[key]
+            debug.println(debug.LEVEL_ALL,
+                          "           CACHED RESULT  ---->  %s=%s" \
+                          % (name, repr(result)))
+        else:
+            currentTime = time.time()
+            result = self._methodsDict[name](self._obj, **self._args)
+            duration = "%.4f" % (time.time() - currentTime)
+            debug.println(debug.LEVEL_ALL,
+                          "           GENERATION TIME: %s  ---->  %s=%s" \
+                          % (duration, name, repr(result)))
+            if key is not None:
+                self._memo[key] = result
+
+        # Callers are free to modify what generate() returns, which can be
+        # this very list, so the memoized one must not be handed out.
+        if isinstance(result, list):
+            result = result[:]
+
+        self[name] = result
+        return result
 
 # [[[WDW - general note -- for all the _generate* methods, it would be great if
 # we could return an empty array if we can determine the method does not
@@ -60,7 +120,9 @@ def _formatExceptionInfo(maxTBlevel=5):
 #
 METHOD_PREFIX = "_generate"
 
+_accessibleCache = accessible_cache.getCache()
 _settingsManager = settings_manager.getManager()
+_tableCache = table_cache.getCache()
 
 class Generator:
     """Takes accessible objects and generates a presentation for those
@@ -74,9 +136,15 @@ class Generator:
         # pylint: disable-msg=W0108
 
         self._mode = mode
+        self._debugSubsystem = '%s GENERATOR' % mode.upper()
         self._script = script
         self._activeProgressBars = {}
         self._methodsDict = {}
+
+        # Generator results memoized while producing one presentation,
+        # i.e. from the outermost call to generate() until it returns.
+        self._presentationMemo = {}
+        self._presentationDepth = 0
         for method in \
             [z for z in [getattr(self, y).__get__(self, self.__class__) for y in [x for x in dir(self) if x.startswith(METHOD_PREFIX)]] if isinstance(z, collections.Callable)]:
             name = method.__name__[len(METHOD_PREFIX):]
@@ -95,14 +163,10 @@ class Generator:
 
         # Verify the formatting strings are OK.  This is only
         # for verification and does not effect the function of
-        # Orca at all.
+        # Orca at all.  Compiling them here also means they are
+        # already compiled the first time they are used.
 
-        # Populate the entire globals with empty arrays
-        # for the results of all the legal method names.
-        #
         globalsDict = {}
-        for key in self._methodsDict.keys():
-            globalsDict[key] = []
         self._addGlobals(globalsDict)
 
         for roleKey in self._script.formatting[self._mode]:
@@ -117,21 +181,18 @@ class Generator:
                         # It's legal to have an empty string.
                         #
                         continue
-                    while True:
-                        try:
-                            eval(evalString, globalsDict)
-                            break
-                        except NameError:
-                            info = _formatExceptionInfo()
-                            arg = info[1][0]
-                            arg = arg.replace("name '", "")
-                            arg = arg.replace("' is not defined", "")
-                            if arg not in self._methodsDict:
-                                debug.printException(debug.LEVEL_SEVERE)
-                            globalsDict[arg] = []
-                        except:
-                            debug.printException(debug.LEVEL_SEVERE)
-                            break
+                    try:
+                        code = _compileFormat(evalString)
+                    except:
+                        debug.printException(debug.LEVEL_SEVERE)
+                        continue
+                    for name in code.co_names:
+                        if name not in self._methodsDict \
+                           and name not in globalsDict \
+                           and not hasattr(builtins, name):
+                            msg = '%s GENERATOR: Unknown name %s in %s' \
+                                  % (self._mode.upper(), name, evalString)
+                            debug.println(debug.LEVEL_SEVERE, msg, True)
 
     def _overrideRole(self, newRole, args):
         """Convenience method to allow you to temporarily override the role in
@@ -204,12 +265,9 @@ class Generator:
             #
             args['role'] = globalsDict['role']
 
-            # We loop through the format string, catching each error
-            # as we go.  Each error should always be a NameError,
-            # where the name is the name of one of our generator
-            # functions.  When we encounter this, we call the function
-            # and get its results, placing them in the globals for the
-            # the call to eval.
+            # The format string is compiled once and evaluated in a
+            # namespace which calls each of our generator functions the
+            # first time evaluation needs its result.
             #
             args['mode'] = self._mode
             if not args.get('formatType', None):
@@ -233,39 +291,29 @@ class Generator:
             else:
                 firstTimeCalled = False
 
-            msg = '%s GENERATOR: Starting generation for %s' % (self._mode.upper(), obj)
-            debug.println(debug.LEVEL_INFO, msg, True)
+            debug.printMessage(debug.LEVEL_INFO, self._debugSubsystem,
+                               'Starting generation for %s', obj)
 
             assert(formatting)
-            while True:
-                currentTime = time.time()
-                try:
-                    result = eval(formatting, globalsDict)
-                    break
-                except NameError:
-                    result = []
-                    info = _formatExceptionInfo()
-                    arg = info[1][0]
-                    arg = arg.replace("name '", "")
-                    arg = arg.replace("' is not defined", "")
-                    if arg not in self._methodsDict:
-                        debug.printException(debug.LEVEL_SEVERE)
-                        break
-                    globalsDict[arg] = self._methodsDict[arg](obj, **args)
-                    duration = "%.4f" % (time.time() - currentTime)
-                    debug.println(debug.LEVEL_ALL,
-                                  "           GENERATION TIME: %s  ---->  %s=%s" \
-                                  % (duration, arg, repr(globalsDict[arg])))
+            results = _GeneratorResults(self._methodsDict, globalsDict,
+                                        obj, args, self._presentationMemo)
+            self._presentationDepth += 1
+            try:
+                result = eval(_compileFormat(formatting), globalsDict, results)
+            finally:
+                self._presentationDepth -= 1
+                if not self._presentationDepth:
+                    self._presentationMemo = {}
 
         except:
             debug.printException(debug.LEVEL_SEVERE)
             result = []
 
-        duration = "%.4f" % (time.time() - startTime)
-        debug.println(debug.LEVEL_ALL, "           COMPLETION TIME: %s" % duration)
-        debug.println(debug.LEVEL_ALL, "%s GENERATOR: Results:" % self._mode.upper(), True)
-        for element in result:
-            debug.println(debug.LEVEL_ALL, "           %s" % element)
+        if debug.isEnabled(debug.LEVEL_ALL, self._debugSubsystem):
+            elements = "".join("\n           %s" % element for element in result)
+            debug.printMessage(debug.LEVEL_ALL, self._debugSubsystem,
+                               'Results (completion time: %.4f):%s',
+                               time.time() - startTime, elements)
 
         if args.get('isProgressBarUpdate') and result:
             self.setProgressBarUpdateTimeAndValue(obj)
@@ -897,6 +945,7 @@ class Generator:
         if (readFullRow or isDetailedWhereAmI) and parentTable \
            and (not self._script.utilities.isLayoutOnly(obj.parent)):
             parent = obj.parent
+            nRows, nColumns = _tableCache.getDimensions(parent)
             index = self._script.utilities.cellIndex(obj)
             row = parentTable.getRowAtIndex(index)
             column = parentTable.getColumnAtIndex(index)
@@ -908,7 +957,7 @@ class Generator:
             #
             presentAll = True
             if isDetailedWhereAmI:
-                if parentTable.nColumns <= 1:
+                if nColumns <= 1:
                     return result
             elif "lastRow" in self._script.pointOfReference \
                and "lastColumn" in self._script.pointOfReference:
@@ -917,20 +966,23 @@ class Generator:
                     (self._mode == 'braille') \
                     or \
                     ((pointOfReference["lastRow"] != row) \
-                     or ((row == 0 or row == parentTable.nRows-1) \
+                     or ((row == 0 or row == nRows-1) \
                          and pointOfReference["lastColumn"] == column))
             if presentAll:
                 args['readingRow'] = True
                 if self._script.utilities.isTableRow(obj):
                     cells = [x for x in obj]
                 else:
-                    cells = [parentTable.getAccessibleAt(row, i) \
-                                 for i in range(parentTable.nColumns)]
+                    cells = [_tableCache.getCellAt(parent, row, i) \
+                                 for i in range(nColumns)]
 
                 for cell in cells:
                     if not cell:
                         continue
-                    state = cell.getState()
+                    try:
+                        state = _accessibleCache.getState(cell)
+                    except:
+                        continue
                     showing = state.contains(pyatspi.STATE_SHOWING)
                     if showing:
                         cellResult = self._generateRealTableCell(cell, **args)
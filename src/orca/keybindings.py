@@ -28,7 +28,6 @@ __license__   = "LGPL"
 
 from gi.repository import Gdk
 
-import functools
 import pyatspi
 
 from . import debug
@@ -267,10 +266,32 @@ class KeyBinding:
 
 class KeyBindings:
     """Structure that maintains a set of KeyBinding instances.
+
+    In addition to the keyBindings list, the bindings are indexed by
+    keycode, by exact (keycode, modifiers, click count) match, by handler,
+    and by each of the hasKeyBinding search types. Because keycodes are
+    bound lazily, bindings are added to the keycode indexes the next time
+    a lookup needs them.
     """
 
+    # The attributes compared by each hasKeyBinding search type.
+    #
+    SEARCH_KEYS = {
+        "strict": lambda kb: (kb.handler.description, kb.keysymstring,
+                              kb.modifier_mask, kb.modifiers, kb.click_count),
+        "description": lambda kb: kb.handler.description,
+        "keys": lambda kb: (kb.keysymstring, kb.modifier_mask,
+                            kb.modifiers, kb.click_count),
+        "keysNoMask": lambda kb: (kb.keysymstring, kb.modifiers, kb.click_count),
+    }
+
     def __init__(self):
         self.keyBindings = []
+        self._unindexed = []
+        self._bindingsByKeycode = {}
+        self._exactMatches = {}
+        self._bindingsByHandler = {}
+        self._searchIndexes = {key: {} for key in self.SEARCH_KEYS}
 
     def __str__(self):
         result = "[\n"
@@ -283,12 +304,93 @@ class KeyBindings:
                        keyBinding.handler.description)
         result += "]"
         return result
-    
+
+    @staticmethod
+    def _getExactKey(keyBinding):
+        """Returns the (keycode, modifiers, click count) of key events which
+        match keyBinding exactly, or None if no event can."""
+
+        if keyBinding.modifiers != keyBinding.modifier_mask:
+            return None
+
+        return keyBinding.keycode, keyBinding.modifiers, keyBinding.click_count
+
+    def _indexBinding(self, keyBinding):
+        self._bindingsByHandler.setdefault(
+            getattr(keyBinding.handler, 'function', None), []).append(keyBinding)
+        for searchType, getKey in self.SEARCH_KEYS.items():
+            try:
+                key = getKey(keyBinding)
+            except AttributeError:
+                continue
+            index = self._searchIndexes[searchType]
+            index[key] = index.get(key, 0) + 1
+
+        self._unindexed.append(keyBinding)
+
+    def _unindexBinding(self, keyBinding):
+        bindings = self._bindingsByHandler.get(
+            getattr(keyBinding.handler, 'function', None), [])
+        if keyBinding in bindings:
+            bindings.remove(keyBinding)
+        for searchType, getKey in self.SEARCH_KEYS.items():
+            try:
+                key = getKey(keyBinding)
+            except AttributeError:
+                continue
+            index = self._searchIndexes[searchType]
+            index[key] = index.get(key, 0) - 1
+            if index[key] <= 0:
+                del index[key]
+
+        if keyBinding in self._unindexed:
+            self._unindexed.remove(keyBinding)
+            return
+
+        bindings = self._bindingsByKeycode.get(keyBinding.keycode, [])
+        if keyBinding in bindings:
+            bindings.remove(keyBinding)
+
+        exactKey = self._getExactKey(keyBinding)
+        if self._exactMatches.get(exactKey) is keyBinding:
+            del self._exactMatches[exactKey]
+            for kb in bindings:
+                if self._getExactKey(kb) == exactKey:
+                    self._exactMatches[exactKey] = kb
+                    break
+
+    def _updateKeycodeIndexes(self):
+        """Binds the keycodes of bindings added since the last lookup and
+        adds them to the keycode indexes."""
+
+        if not self._unindexed:
+            return
+
+        unbound = []
+        for keyBinding in self._unindexed:
+            if not keyBinding.keycode:
+                keyBinding.keycode = getKeycode(keyBinding.keysymstring)
+
+            # The keymap may not know the keysym yet. Try again next time.
+            if not keyBinding.keycode:
+                if keyBinding.keysymstring:
+                    unbound.append(keyBinding)
+                continue
+
+            self._bindingsByKeycode.setdefault(
+                keyBinding.keycode, []).append(keyBinding)
+            exactKey = self._getExactKey(keyBinding)
+            if exactKey:
+                self._exactMatches.setdefault(exactKey, keyBinding)
+
+        self._unindexed = unbound
+
     def add(self, keyBinding):
         """Adds the given KeyBinding instance to this set of keybindings.
         """
 
         self.keyBindings.append(keyBinding)
+        self._indexBinding(keyBinding)
 
     def remove(self, keyBinding):
         """Removes the given KeyBinding instance from this set of keybindings.
@@ -299,16 +401,15 @@ class KeyBindings:
         except:
             pass
         else:
+            self._unindexBinding(self.keyBindings[i])
             del self.keyBindings[i]
 
     def removeByHandler(self, handler):
         """Removes the given KeyBinding instance from this set of keybindings.
         """
-        i = len(self.keyBindings)
-        while i > 0:
-            if self.keyBindings[i - 1].handler == handler:
-                del self.keyBindings[i - 1]
-            i = i - 1
+
+        for keyBinding in self.getBindingsForHandler(handler):
+            self.remove(keyBinding)
 
     def hasKeyBinding (self, newKeyBinding, typeOfSearch="strict"):
         """Return True if keyBinding is already in self.keyBindings.
@@ -322,45 +423,11 @@ class KeyBindings:
               "keysNoMask":  matches the modifiers, key, and click count
         """
 
-        hasIt = False
+        getKey = self.SEARCH_KEYS.get(typeOfSearch)
+        if not getKey:
+            return False
 
-        for keyBinding in self.keyBindings:
-            if typeOfSearch == "strict":
-                if (keyBinding.handler.description \
-                    == newKeyBinding.handler.description) \
-                    and (keyBinding.keysymstring \
-                         == newKeyBinding.keysymstring) \
-                    and (keyBinding.modifier_mask \
-                         == newKeyBinding.modifier_mask) \
-                    and (keyBinding.modifiers \
-                         == newKeyBinding.modifiers) \
-                    and (keyBinding.click_count \
-                         == newKeyBinding.click_count):
-                    hasIt = True
-            elif typeOfSearch == "description":
-                if keyBinding.handler.description \
-                    == newKeyBinding.handler.description:
-                    hasIt = True
-            elif typeOfSearch == "keys":
-                if (keyBinding.keysymstring \
-                    == newKeyBinding.keysymstring) \
-                    and (keyBinding.modifier_mask \
-                         == newKeyBinding.modifier_mask) \
-                    and (keyBinding.modifiers \
-                         == newKeyBinding.modifiers) \
-                    and (keyBinding.click_count \
-                         == newKeyBinding.click_count):
-                    hasIt = True
-            elif typeOfSearch == "keysNoMask":
-                if (keyBinding.keysymstring \
-                    == newKeyBinding.keysymstring) \
-                    and (keyBinding.modifiers \
-                         == newKeyBinding.modifiers) \
-                    and (keyBinding.click_count \
-                         == newKeyBinding.click_count):
-                    hasIt = True
-
-        return hasIt
+        return getKey(newKeyBinding) in self._searchIndexes[typeOfSearch]
 
     def getBoundBindings(self, uniqueOnly=False):
         """Returns the KeyBinding instances which are bound to a keystroke.
@@ -380,26 +447,33 @@ class KeyBindings:
     def getBindingsForHandler(self, handler):
         """Returns the KeyBinding instances associated with handler."""
 
-        return [kb for kb in self.keyBindings if kb.handler == handler]
+        if not handler:
+            return []
+
+        bindings = self._bindingsByHandler.get(handler.function, [])
+        return [kb for kb in bindings if kb.handler == handler]
 
     def getInputHandler(self, keyboardEvent):
         """Returns the input handler of the key binding that matches the
         given keycode and modifiers, or None if no match exists.
         """
 
-        candidates = []
+        self._updateKeycodeIndexes()
+
         clickCount = keyboardEvent.getClickCount()
-        for keyBinding in self.keyBindings:
-            if keyBinding.matches(keyboardEvent.hw_code,
-                                  keyboardEvent.modifiers):
-                if keyBinding.modifier_mask == keyboardEvent.modifiers and \
-                   keyBinding.click_count == clickCount:
-                    return keyBinding.handler
-                # If there's no keysymstring, it's unbound and cannot be
-                # a match.
-                #
-                if keyBinding.keysymstring:
-                    candidates.append(keyBinding)
+        exactKey = keyboardEvent.hw_code, keyboardEvent.modifiers, clickCount
+        keyBinding = self._exactMatches.get(exactKey)
+        if keyBinding:
+            return keyBinding.handler
+
+        # If there's no keysymstring, it's unbound and cannot be a match.
+        #
+        candidates = []
+        for keyBinding in self._bindingsByKeycode.get(keyboardEvent.hw_code, []):
+            if keyBinding.keysymstring \
+               and keyBinding.matches(keyboardEvent.hw_code,
+                                      keyboardEvent.modifiers):
+                candidates.append(keyBinding)
 
         if keyboardEvent.modifiers & (1 << pyatspi.MODIFIER_NUMLOCK) \
             and keyboardEvent.keyval_name.startswith("KP"):
@@ -409,8 +483,7 @@ class KeyBindings:
         # the one whose click count is closest to, but does not exceed,
         # the actual click count.
         #
-        comparison = lambda x, y: y.click_count - x.click_count
-        candidates.sort(key=functools.cmp_to_key(comparison))
+        candidates.sort(key=lambda x: x.click_count, reverse=True)
         for candidate in candidates:
             if candidate.click_count <= clickCount:
                 return candidate.handler
@@ -44,6 +44,7 @@ class LabelInference:
         self._lineCache = {}
         self._extentsCache = {}
         self._isWidgetCache = {}
+        self._inBatch = False
 
     def infer(self, obj, focusedOnly=True):
         """Attempt to infer the functional/displayed label of obj.
@@ -96,9 +97,34 @@ class LabelInference:
             result, objects = self.inferFromTextLeft(obj, proximity=200)
             debug.println(debug.LEVEL_INFO, "INFER - Text Left with proximity of 200: %s" % result, True)
 
-        self.clearCache()
+        if not self._inBatch:
+            self.clearCache()
         return result, objects
 
+    def inferAll(self, objs):
+        """Attempt to infer the functional/displayed labels of objs in a
+        single pass. Widgets near one another, e.g. in the same form, tend to
+        share lines; what is learned about the lines and extents of the
+        content around one widget is kept until all have been looked at.
+
+        Arguments
+        - objs: the unlabeled widgets
+
+        Returns a dictionary of hash(obj) -> (label, objects), in which the
+        values are as returned by infer.
+        """
+
+        self._inBatch = True
+        results = {}
+        try:
+            for obj in objs:
+                results[hash(obj)] = self.infer(obj, False)
+        finally:
+            self._inBatch = False
+            self.clearCache()
+
+        return results
+
     def clearCache(self):
         """Dumps whatever we've stored for performance purposes."""
 
@@ -286,6 +312,12 @@ class LabelInference:
         rv = self._script.utilities.getLineContentsAtOffset(obj, start, True, False)
         self._lineCache[key] = rv
 
+        # The other widgets on this line are on this line as a whole, so we
+        # need not ask for it again should we be asked about them.
+        for content in rv:
+            if self._isWidget(content[0]):
+                self._lineCache.setdefault(hash(content[0]), rv)
+
         return rv
 
     def _getPreviousObject(self, obj):
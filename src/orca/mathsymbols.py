@@ -2219,6 +2219,7 @@ _all.update(_operators)
 _all.update(_shapes)
 _RE = None
 _RE_COMBINING = None
+_RE_SPEECH = None
 
 def __compileRE():
     global _RE
@@ -2290,26 +2291,53 @@ def _getSpokenName(symbol, includeStyle):
 def getCharacterName(symbol):
     return _getSpokenName(symbol, speakStyle != SPEAK_NEVER)
 
-def adjustForSpeech(string):
+def __compileRE_SPEECH():
+    global _RE_SPEECH
     if _RE is None:
         __compileRE()
 
     if _RE_COMBINING is None:
         __compileRE_COMBINING()
 
+    patterns = []
     if _RE_COMBINING is not None:
-        combiningPairs = set(re.findall(_RE_COMBINING, string))
-        for pair in combiningPairs:
-            name = _combining.get(pair[1])
-            if name:
-                string = re.sub(pair, " %s " % (name % pair[0]), string)
-
+        patterns.append('(?P<combining>%s)' % _RE_COMBINING.pattern)
     if _RE is not None:
-        chars = set(re.findall(_RE, string))
-        includeStyle = speakStyle == SPEAK_ALWAYS
-        for char in chars:
-            name = _getSpokenName(char, includeStyle)
-            if name:
-                string = re.sub(char, " %s " % name, string)
-
-    return string
+        patterns.append('(?P<symbol>%s)' % _RE.pattern)
+    if patterns:
+        _RE_SPEECH = re.compile('|'.join(patterns), re.UNICODE)
+
+def getCombiningCharacters():
+    """Returns a string of the combining characters which have names."""
+
+    return ''.join(_combining.keys())
+
+def adjustForSpeech(string):
+    if _RE_SPEECH is None:
+        __compileRE_SPEECH()
+
+    if _RE_SPEECH is None:
+        return string
+
+    includeStyle = speakStyle == SPEAK_ALWAYS
+
+    def _getSymbolName(symbol):
+        name = _getSpokenName(symbol, includeStyle)
+        if name:
+            return " %s " % name
+        return symbol
+
+    # The symbols in a combined pair are replaced too, like the other symbols.
+    def _replace(match):
+        if match.lastgroup == 'symbol':
+            return _getSymbolName(match.group())
+
+        pair = match.group()
+        name = _combining.get(pair[1])
+        if name:
+            pair = " %s " % (name % pair[0])
+        if _RE is None:
+            return pair
+        return re.sub(_RE, lambda m: _getSymbolName(m.group()), pair)
+
+    return re.sub(_RE_SPEECH, _replace, string)
@@ -278,6 +278,16 @@ CLI_DEBUG_FILE = _("Send debug output to the specified file")
 # using the '--debug-file' command line option.
 CLI_DEBUG_FILE_NAME = _("FILE")
 
+# Translators: This is the description of command line option
+# '--debug-subsystems' which allows the user to limit the debugging output
+# to that of the specified parts of Orca, e.g. "EVENT MANAGER,WEB". The
+# subsystem names should not be translated.
+CLI_DEBUG_SUBSYSTEMS = _("Limit debug output to the specified comma-separated subsystems")
+
+# Translators: This string indicates to the user what should be provided when
+# using the '--debug-subsystems' command line option.
+CLI_DEBUG_SUBSYSTEMS_NAME = _("SUBSYSTEMS")
+
 # Translators: This is the description of command line option '-t, --text-setup'
 # that will initially display a list of questions in text form, that the user
 # will need to answer, before Orca will startup. For this to happen properly,
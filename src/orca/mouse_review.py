@@ -33,6 +33,7 @@ import pyatspi
 import time
 
 from gi.repository import Gdk
+from gi.repository import GLib
 try:
     gi.require_version("Wnck", "3.0")
     from gi.repository import Wnck
@@ -111,7 +112,9 @@ class _ItemContext:
         self._obj = obj
         self._frame = frame
         self._script = script
+        self._isSingleObject = False
         self._string = self._getStringContext()
+        self._bounds = self._getBounds()
         self._time = time.time()
 
     def __eq__(self, other):
@@ -155,6 +158,7 @@ class _ItemContext:
             return _StringContext(self._obj)
 
         if self._treatAsSingleObject():
+            self._isSingleObject = True
             return _StringContext(self._obj, self._script)
 
         state = self._obj.getState()
@@ -170,6 +174,18 @@ class _ItemContext:
 
         return _StringContext(self._obj, self._script, string, start, end)
 
+    def _getBounds(self):
+        """Returns the extents of the object if the same thing is presented
+        wherever in it the pointer is, otherwise None."""
+
+        if not self._isSingleObject:
+            return None
+
+        try:
+            return tuple(self._obj.queryComponent().getExtents(pyatspi.DESKTOP_COORDS))
+        except:
+            return None
+
     def _getContainer(self):
         roles = [pyatspi.ROLE_DIALOG,
                  pyatspi.ROLE_FRAME,
@@ -191,6 +207,28 @@ class _ItemContext:
 
         return self._time
 
+    def containsPoint(self, x, y):
+        """Returns True if presenting the item at x, y would present this
+        context again."""
+
+        if not self._bounds:
+            return False
+
+        bX, bY, bWidth, bHeight = self._bounds
+        return bX <= x < bX + bWidth and bY <= y < bY + bHeight
+
+    def clearBounds(self):
+        """Stops treating points within the object as being in this context,
+        e.g. because something may now be on top of the object."""
+
+        self._bounds = None
+
+    def refresh(self):
+        """Updates the time of this context, e.g. because the pointer is still
+        over its object."""
+
+        self._time = time.time()
+
     def present(self, prior):
         """Presents this context to the user."""
 
@@ -219,12 +257,21 @@ class _ItemContext:
 class MouseReviewer:
     """Main class for the mouse-review feature."""
 
+    # The number of recently-found objects remembered for each window.
+    MAX_RECENT_OBJECTS = 20
+
     def __init__(self):
         self._active = _settingsManager.getSetting("enableMouseReview")
         self._currentMouseOver = _ItemContext()
         self._pointer = None
         self._windows = []
         self._handlerIds = {}
+        self._timeoutId = 0
+        self._motionPending = False
+        self._appsByPid = {}
+        self._framesByWindow = {}
+        self._recentObjects = {}
+        self._focus = None, None
 
         if not _mouseReviewCapable:
             msg = "MOUSE REVIEW ERROR: Wnck is not available"
@@ -248,7 +295,9 @@ class MouseReviewer:
     def _get_listeners(self):
         """Returns the accessible-event listeners for mouse review."""
 
-        return {"mouse:abs": self._listener}
+        return {"mouse:abs": self._listener,
+                "object:children-changed": self._on_tree_changed,
+                "object:state-changed:showing": self._on_tree_changed}
 
     def activate(self):
         """Activates mouse review."""
@@ -269,8 +318,20 @@ class MouseReviewer:
             value.disconnect(key)
         self._handlerIds = {}
 
+        if self._timeoutId:
+            GLib.source_remove(self._timeoutId)
+            self._timeoutId = 0
+        self._motionPending = False
+        self._clear_caches()
+
         self._active = False
 
+    def _clear_caches(self):
+        self._appsByPid = {}
+        self._framesByWindow = {}
+        self._recentObjects = {}
+        self._focus = None, None
+
     def getCurrentItem(self):
         """Returns the accessible object being reviewed."""
 
@@ -315,6 +376,25 @@ class MouseReviewer:
         stacked.reverse()
         self._windows = stacked
 
+        # What is at a given point may now be in a different window.
+        self._recentObjects = {}
+        self._currentMouseOver.clearBounds()
+
+    def _on_tree_changed(self, event):
+        """Callback for children-changed and showing events. Something may
+        now be on top of the objects found in the application's windows."""
+
+        if not self._recentObjects:
+            return
+
+        try:
+            app = event.host_application
+        except:
+            self._recentObjects = {}
+            return
+
+        self._recentObjects.pop(hash(app), None)
+
     def _contains_point(self, obj, x, y, coordType=None):
         if coordType is None:
             coordType = pyatspi.DESKTOP_COORDS
@@ -353,17 +433,47 @@ class MouseReviewer:
         if not window:
             return None
 
-        app = None
+        frame = self._framesByWindow.get(window.get_xid())
+        if frame and self._contains_point(frame, pX, pY):
+            return frame
+
         windowApp = window.get_application()
         if not windowApp:
             return None
 
-        pid = windowApp.get_pid()
+        frame = self._frame_at_point(window, windowApp.get_pid(), pX, pY)
+        if frame:
+            self._framesByWindow[window.get_xid()] = frame
+        else:
+            self._framesByWindow.pop(window.get_xid(), None)
+
+        return frame
+
+    def _application_for_pid(self, pid):
+        """Returns the accessible application whose process id is pid."""
+
+        app = self._appsByPid.get(pid)
+        try:
+            if app and app.get_process_id() == pid:
+                return app
+        except:
+            pass
+
+        self._appsByPid = {}
         for a in pyatspi.Registry.getDesktop(0):
-            if a.get_process_id() == pid:
-                app = a
-                break
+            try:
+                self._appsByPid[a.get_process_id()] = a
+            except:
+                msg = "MOUSE REVIEW: Exception getting process id of %s" % a
+                debug.println(debug.LEVEL_INFO, msg, True)
+
+        return self._appsByPid.get(pid)
+
+    def _frame_at_point(self, window, pid, pX, pY):
+        """Returns the accessible top-level of window at the specified
+        coordinates."""
 
+        app = self._application_for_pid(pid)
         if not app:
             return None
 
@@ -383,32 +493,89 @@ class MouseReviewer:
 
         return None
 
+    def _recent_object_at_point(self, app, frame, pX, pY):
+        """Returns the recently-found object in frame at the specified
+        coordinates, or None."""
+
+        recent = self._recentObjects.get(hash(app), {}).get(hash(frame), [])
+        for i, (extents, obj) in enumerate(recent):
+            x, y, width, height = extents
+            if not (x <= pX < x + width and y <= pY < y + height):
+                continue
+
+            # The object may have moved, e.g. as the result of scrolling.
+            if not self._contains_point(obj, pX, pY):
+                continue
+
+            recent.insert(0, recent.pop(i))
+            return obj
+
+        return None
+
+    def _remember_object(self, app, frame, obj):
+        """Remembers obj, found in frame, if nothing can be found within it."""
+
+        try:
+            if obj.childCount:
+                return
+            extents = tuple(obj.queryComponent().getExtents(pyatspi.DESKTOP_COORDS))
+        except:
+            return
+
+        recent = self._recentObjects.setdefault(hash(app), {}).setdefault(hash(frame), [])
+        recent.insert(0, (extents, obj))
+        del recent[self.MAX_RECENT_OBJECTS:]
+
     def _on_mouse_moved(self, event):
         """Callback for mouse:abs events."""
 
         screen, pX, pY = self._pointer.get_position()
-        window = self._accessible_window_at_point(pX, pY)
-        msg = "MOUSE REVIEW: Window at (%i, %i) is %s" % (pX, pY, window)
-        debug.println(debug.LEVEL_INFO, msg, True)
-        if not window:
-            return
-
         script = orca_state.activeScript
         if not script:
             return
 
+        # Popups such as menus and combo box lists can appear on top of the
+        # object without a change in the stacking of the windows, but they
+        # change the focus or the active window.
+        focus = orca_state.locusOfFocus, orca_state.activeWindow
+        if focus != self._focus:
+            self._focus = focus
+            self._currentMouseOver.clearBounds()
+
         isMenu = lambda x: x and x.getRole() == pyatspi.ROLE_MENU
         if isMenu(orca_state.locusOfFocus):
             menu = orca_state.locusOfFocus
         else:
             menu = pyatspi.findAncestor(orca_state.locusOfFocus, isMenu)
 
-        obj = script.utilities.descendantAtPoint(menu, pX, pY) \
-            or script.utilities.descendantAtPoint(window, pX, pY)
+        obj = script.utilities.descendantAtPoint(menu, pX, pY)
+        if not obj and self._currentMouseOver.containsPoint(pX, pY):
+            msg = "MOUSE REVIEW: (%i, %i) is still in %s" \
+                  % (pX, pY, self._currentMouseOver.getObject())
+            debug.println(debug.LEVEL_INFO, msg, True)
+            self._currentMouseOver.refresh()
+            return
+
+        window = self._accessible_window_at_point(pX, pY)
+        msg = "MOUSE REVIEW: Window at (%i, %i) is %s" % (pX, pY, window)
+        debug.println(debug.LEVEL_INFO, msg, True)
+        if not window:
+            return
+
+        app = window.getApplication()
+        if not obj:
+            obj = self._recent_object_at_point(app, window, pX, pY)
+            if obj:
+                msg = "MOUSE REVIEW: Recently-found object at (%i, %i) is %s" \
+                      % (pX, pY, obj)
+                debug.println(debug.LEVEL_INFO, msg, True)
+            else:
+                obj = script.utilities.descendantAtPoint(window, pX, pY)
+                self._remember_object(app, window, obj)
         msg = "MOUSE REVIEW: Object at (%i, %i) is %s" % (pX, pY, obj)
         debug.println(debug.LEVEL_INFO, msg, True)
 
-        script = _scriptManager.getScript(window.getApplication(), obj)
+        script = _scriptManager.getScript(app, obj)
         new = _ItemContext(pX, pY, obj, window, script)
         new.present(self._currentMouseOver)
         self._currentMouseOver = new
@@ -421,11 +588,38 @@ class MouseReviewer:
         debug.println(debug.LEVEL_INFO, msg, False)
 
         if event.type.startswith("mouse:abs"):
-            self._on_mouse_moved(event)
+            self._throttle(event)
 
         msg = "TOTAL PROCESSING TIME: %.4f\n" % (time.time() - startTime)
         msg += "^^^^^ PROCESS OBJECT EVENT %s ^^^^^\n" % event.type
         debug.println(debug.LEVEL_INFO, msg, False)
 
+    def _throttle(self, event):
+        """Handles pointer motion at most once per mouseReviewInterval. Since
+        the pointer position is read when the motion is handled, motion which
+        happens in between is coalesced into the latest position."""
+
+        if self._timeoutId:
+            self._motionPending = True
+            return
+
+        self._on_mouse_moved(event)
+        interval = _settingsManager.getSetting("mouseReviewInterval")
+        if interval:
+            self._timeoutId = GLib.timeout_add(int(interval * 1000), self._on_timeout, event)
+
+    def _on_timeout(self, event):
+        if not self._motionPending:
+            self._timeoutId = 0
+            return False
+
+        self._motionPending = False
+        try:
+            self._on_mouse_moved(event)
+        except:
+            debug.printException(debug.LEVEL_INFO)
+
+        return True
+
 
 reviewer = MouseReviewer()
@@ -567,6 +567,8 @@ def die(exitCode=1):
     pid = os.getpid()
     if exitCode == EXIT_CODE_HANG:
         # Someting is hung and we wish to abort.
+        _flushSettings()
+        debug.flush()
         os.kill(pid, signal.SIGKILL)
         return
 
@@ -580,6 +582,7 @@ def timeout(signum=None, frame=None):
     debug.println(debug.LEVEL_SEVERE, msg, True)
     debug.printStack(debug.LEVEL_ALL)
     debug.examineProcesses()
+    debug.flush()
     die(EXIT_CODE_HANG)
 
 def shutdown(script=None, inputEvent=None):
@@ -606,6 +609,7 @@ def shutdown(script=None, inputEvent=None):
 
     _scriptManager.deactivate()
     _eventManager.deactivate()
+    _settingsManager.flush()
 
     # Shutdown all the other support.
     #
@@ -670,8 +674,19 @@ def shutdownOnSignal(signum, frame):
     if not cleanExit:
         die(EXIT_CODE_HANG)
 
+def _flushSettings():
+    """Writes settings changes which have yet to be saved to disk, if that
+    is possible, before Orca goes away without shutting down."""
+
+    try:
+        _settingsManager.flush()
+    except:
+        debug.printException(debug.LEVEL_SEVERE)
+
 def crashOnSignal(signum, frame):
     signal.signal(signum, signal.SIG_DFL)
+    debug.flush()
+    _flushSettings()
     _restoreXmodmap(_orcaModifiers)
     os.kill(os.getpid(), signum)
 
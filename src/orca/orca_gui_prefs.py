@@ -1743,7 +1743,7 @@ class OrcaSetupGUI(orca_gtkbuilder.GtkBuilderWrapper):
     def getModelDict(self, model):
         """Get the list of values from a list[str,str] model
         """
-        pronunciation_dict.pronunciation_dict = {}
+        pronunciation_dict.clearPronunciations()
         currentIter = model.get_iter_first()
         while currentIter is not None:
             key, value = model.get(currentIter, ACTUAL, REPLACEMENT)
@@ -60,14 +60,34 @@ def setPronunciation(word, replacementString, pronunciations=None):
       into.
     """
 
+    global generation
+
     key = word.lower()
     if pronunciations is not None:
         pronunciations[key] = [ word, replacementString ]
     else:
         pronunciation_dict[key] = [ word, replacementString ]
 
+    generation += 1
+
+def clearPronunciations():
+    """Replaces pronunciation_dict with an empty dictionary."""
+
+    global pronunciation_dict, generation
+
+    pronunciation_dict = {}
+    generation += 1
+
+def getGeneration():
+    """Returns a number which changes whenever a pronunciation is set or
+    the dictionary is cleared, so that what was derived from the
+    pronunciations can be known to be stale."""
+
+    return generation
+
 # pronunciation_dict is a dictionary where the keys are words and the
 # values represent word the pronunciation of that word (in other words,
 # what the word sounds like).
 #
 pronunciation_dict = {}
+generation = 0
@@ -0,0 +1,239 @@
+# Orca
+#
+# Copyright 2019. Orca Team.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., Franklin Street, Fifth Floor,
+# Boston MA  02110-1301 USA.
+
+"""Produces the utterances of a SayAll ahead of speech. The speech servers
+only ask for the next utterance once the current one has been spoken, so
+any time spent producing it is heard as a gap. The prefetcher instead
+produces upcoming utterances while the main loop is idle."""
+
+__id__        = "$Id$"
+__version__   = "$Revision$"
+__date__      = "$Date$"
+__copyright__ = "Copyright (c) 2019. Orca Team."
+__license__   = "LGPL"
+
+from gi.repository import GLib
+
+import collections
+
+from . import debug
+
+class SayAllPrefetcher:
+    """Iterates over the [SayAllContext, acss] utterances produced by a
+    SayAll generator, keeping up to maxSize of them produced in advance.
+
+    The generator may also yield callables. These are run just before the
+    next utterance is handed to speech, or when the generator is exhausted
+    if no utterance follows, so that side effects like scrolling happen in
+    step with speech rather than with production. A callable also marks the
+    start of a group of utterances (e.g. a line) for rewind and fastForward.
+
+    restart is called with the SayAllContext of an utterance and must return
+    a generator which produces the utterances from that point on. It is used
+    when the utterances produced in advance are found to be stale."""
+
+    def __init__(self, generator, restart=None, maxSize=10, maxHistory=50):
+        self._generator = generator
+        self._restart = restart
+        self._maxSize = maxSize
+        self._buffer = collections.deque()
+        self._history = collections.deque(maxlen=maxHistory)
+        self._actions = []
+        self._exhausted = False
+        self._idleId = 0
+        self._lastContext = None
+        self._resumeAfter = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._buffer:
+            self._produce()
+
+        if not self._buffer:
+            self._runActions(self._actions)
+            self._actions = []
+            raise StopIteration
+
+        entry = self._buffer.popleft()
+        self._runActions(entry[0])
+        self._history.append(entry)
+        self._lastContext = entry[1][0]
+        self._scheduleProduction()
+        return entry[1]
+
+    @staticmethod
+    def _runActions(actions):
+        for action in actions:
+            try:
+                action()
+            except:
+                debug.printException(debug.LEVEL_INFO)
+
+    def _produce(self):
+        """Adds the next utterance from the generator to the buffer, along
+        with the callables yielded before it. Returns False if there are no
+        more utterances."""
+
+        while not self._exhausted:
+            try:
+                item = next(self._generator)
+            except StopIteration:
+                self._exhausted = True
+                break
+
+            if callable(item):
+                self._actions.append(item)
+                continue
+
+            # After a restart at the utterance last spoken, that utterance
+            # is not spoken again.
+            resumeAfter, self._resumeAfter = self._resumeAfter, None
+            if resumeAfter and self._isSameContext(item[0], resumeAfter):
+                self._actions = []
+                continue
+
+            self._buffer.append((self._actions, item))
+            self._actions = []
+            return True
+
+        return False
+
+    @staticmethod
+    def _isSameContext(context, other):
+        return context.obj == other.obj and context.startOffset == other.startOffset
+
+    def _scheduleProduction(self):
+        if self._idleId or self._exhausted or len(self._buffer) >= self._maxSize:
+            return
+
+        self._idleId = GLib.idle_add(self._onIdle)
+
+    def _onIdle(self):
+        if self._produce() and len(self._buffer) < self._maxSize:
+            return True
+
+        self._idleId = 0
+        return False
+
+    def _stopProduction(self):
+        if self._idleId:
+            GLib.source_remove(self._idleId)
+            self._idleId = 0
+
+    def getContexts(self):
+        """Returns the SayAllContexts of the utterances produced in advance,
+        in the order in which they will be spoken."""
+
+        return [entry[1][0] for entry in self._buffer]
+
+    def cancel(self):
+        """Stops producing utterances and discards those produced."""
+
+        self._stopProduction()
+        self._generator.close()
+        self._exhausted = True
+        self._buffer.clear()
+        self._history.clear()
+        self._actions = []
+        self._resumeAfter = None
+
+    def invalidate(self):
+        """Discards the utterances produced in advance beyond the end of the
+        current group, since the content they were produced from changed.
+        If the start of no later group has been produced, all of them are
+        discarded and production restarts at the next utterance, or after
+        the one last spoken if none is left."""
+
+        self._stopProduction()
+        self._history.clear()
+        if self._restart is None:
+            return
+
+        # The remainder of the group being spoken is kept.
+        groupStart = None
+        for i, entry in enumerate(self._buffer):
+            if entry[0]:
+                groupStart = i
+                break
+
+        if groupStart is not None:
+            context = self._buffer[groupStart][1][0]
+        elif self._buffer:
+            groupStart = 0
+            context = self._buffer[0][1][0]
+        elif self._lastContext:
+            groupStart = 0
+            context = self._lastContext
+            self._resumeAfter = context
+        else:
+            return
+
+        msg = "SAY ALL PREFETCHER: Restarting at %s, %i" \
+              % (context.obj, context.startOffset)
+        debug.println(debug.LEVEL_INFO, msg, True)
+
+        while len(self._buffer) > groupStart:
+            self._buffer.pop()
+
+        self._generator.close()
+        self._generator = self._restart(context)
+        self._exhausted = False
+        self._actions = []
+        self._scheduleProduction()
+
+    def fastForward(self, isTarget):
+        """Discards upcoming utterances until one for which isTarget, called
+        with its SayAllContext and whether it begins a group, returns True.
+        Returns that SayAllContext, or None, leaving the utterances alone,
+        if there is no such utterance."""
+
+        i = 0
+        while True:
+            if i == len(self._buffer) and not self._produce():
+                return None
+
+            actions, (context, acss) = self._buffer[i]
+            if isTarget(context, bool(actions)):
+                break
+            i += 1
+
+        for x in range(i):
+            self._history.append(self._buffer.popleft())
+
+        return context
+
+    def rewind(self, isTarget):
+        """Returns the most recently spoken utterances to the front of the
+        buffer, the most recent first, until one for which isTarget, called
+        with its SayAllContext and whether it begins a group, returns True.
+        Returns that SayAllContext, or None, leaving the utterances alone,
+        if there is no such utterance."""
+
+        for i, (actions, (context, acss)) in enumerate(reversed(self._history)):
+            if isTarget(context, bool(actions)):
+                break
+        else:
+            return None
+
+        for x in range(i + 1):
+            self._buffer.appendleft(self._history.pop())
+
+        return context
@@ -89,6 +89,8 @@ class Script:
         self.name += " (module=" + self.__module__ + ")"
 
         self.listeners = self.getListeners()
+        self._listenerTrie = self._compileListeners(self.listeners)
+        self._listenersByEventType = {}
 
         # By default, handle events for non-active applications.
         #
@@ -280,6 +282,43 @@ class Script:
     #def __del__(self):
     #    debug.println(debug.LEVEL_FINE, "DELETE SCRIPT: %s" % self.name)
 
+    @staticmethod
+    def _compileListeners(listeners):
+        """Returns a trie of the listeners, keyed by the colon-delimited
+        segments of the event types. Each node is a [listener, children]
+        pair, the listener being None if there is none for that type."""
+
+        trie = [None, {}]
+        for eventType, listener in listeners.items():
+            node = trie
+            for segment in eventType.rstrip(':').split(':'):
+                node = node[1].setdefault(segment, [None, {}])
+            node[0] = listener
+
+        return trie
+
+    def _getListenersForEventType(self, eventType):
+        """Returns the listeners for eventType, i.e. those for eventType and
+        for each of its colon-delimited prefixes, the most specific first.
+        For instance, the listener for "object:state-changed:" is among
+        those for "object:state-changed:focused"."""
+
+        listeners = self._listenersByEventType.get(eventType)
+        if listeners is not None:
+            return listeners
+
+        listeners = []
+        node = self._listenerTrie
+        for segment in eventType.rstrip(':').split(':'):
+            node = node[1].get(segment)
+            if node is None:
+                break
+            if node[0]:
+                listeners.insert(0, node[0])
+
+        self._listenersByEventType[eventType] = listeners
+        return listeners
+
     def processObjectEvent(self, event):
         """Processes all AT-SPI object events of interest to this
         script.  The interest in events is specified via the
@@ -319,19 +358,8 @@ class Script:
         #
         self.generatorCache = {}
 
-        # This calls the first listener it finds whose key *begins with* or is
-        # the same as the event.type.  The reason we do this is that the event
-        # type in the listeners dictionary may not be as specific as the event
-        # type we received (e.g., the listeners dictionary might contain the
-        # key "object:state-changed:" and the event.type might be
-        # "object:state-changed:focused".  [[[TODO: WDW - the order of the
-        # keys is *not* deterministic, and is not guaranteed to be related
-        # to the order in which they were added.  So...we need to do something
-        # different here.  Logged as bugzilla bug 319781.]]]
-        #
-        for key in self.listeners.keys():
-            if event.type.startswith(key):
-                self.listeners[key](event)
+        for listener in self._getListenersForEventType(event.type):
+            listener(event)
 
     def skipObjectEvent(self, event):
         """Gives us, and scripts, the ability to decide an event isn't
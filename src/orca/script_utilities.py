@@ -53,9 +53,11 @@ from . import object_properties
 from . import pronunciation_dict
 from . import settings
 from . import settings_manager
+from . import table_cache
 from . import text_attribute_names
 
 _settingsManager = settings_manager.getManager()
+_tableCache = table_cache.getCache()
 
 #############################################################################
 #                                                                           #
@@ -80,6 +82,8 @@ class Utilities:
     WORDS_RE = re.compile(r"(\W+)", flags)
     SUPERSCRIPTS_RE = re.compile("[%s]+" % "".join(SUPERSCRIPT_DIGITS), flags)
     SUBSCRIPTS_RE = re.compile("[%s]+" % "".join(SUBSCRIPT_DIGITS), flags)
+    SCRIPTED_DIGITS_RE = re.compile("%s|%s" % (SUPERSCRIPTS_RE.pattern,
+                                                SUBSCRIPTS_RE.pattern), flags)
 
     # generatorCache
     #
@@ -3099,21 +3103,35 @@ class Utilities:
         dictionary.
         """
 
-        if settings.speakMultiCaseStringsAsWords:
-            line = self._processMultiCaseString(line)
-
         if self.speakMathSymbolNames():
             line = mathsymbols.adjustForSpeech(line)
 
-        if settings.speakNumbersAsDigits:
-            words = self.WORDS_RE.split(line)
-            line = ''.join(map(self._convertWordToDigits, words))
-
         if len(line) == 1:
             charname = chnames.getCharacterName(line)
             if charname != line:
                 return charname
 
+        return self.adjustWordsForPronunciation(line)
+
+    def adjustWordsForPronunciation(self, line):
+        """Adjust the words in the line for speech, according to the user's
+        settings for multi-case strings, numbers, and the pronunciation
+        dictionary. Unlike adjustForPronunciation, this leaves symbols, and
+        lines consisting of a single character, as they are.
+
+        Arguments:
+        - line: the string to adjust.
+
+        Returns: a new line with its words adjusted.
+        """
+
+        if settings.speakMultiCaseStringsAsWords:
+            line = self._processMultiCaseString(line)
+
+        if settings.speakNumbersAsDigits:
+            words = self.WORDS_RE.split(line)
+            line = ''.join(map(self._convertWordToDigits, words))
+
         if not settings.usePronunciationDictionary:
             return line
 
@@ -3174,20 +3192,16 @@ class Utilities:
         Returns: a new string which contains actual digits.
         """
 
-        subscripted = set(re.findall(self.SUBSCRIPTS_RE, string))
-        superscripted = set(re.findall(self.SUPERSCRIPTS_RE, string))
-
-        for number in superscripted:
-            new = [str(self.SUPERSCRIPT_DIGITS.index(d)) for d in number]
-            newString = messages.DIGITS_SUPERSCRIPT % "".join(new)
-            string = re.sub(number, newString, string)
+        def _replace(match):
+            number = match.group()
+            if number[0] in self.SUPERSCRIPT_DIGITS:
+                new = [str(self.SUPERSCRIPT_DIGITS.index(d)) for d in number]
+                return messages.DIGITS_SUPERSCRIPT % "".join(new)
 
-        for number in subscripted:
             new = [str(self.SUBSCRIPT_DIGITS.index(d)) for d in number]
-            newString = messages.DIGITS_SUBSCRIPT % "".join(new)
-            string = re.sub(number, newString, string)
+            return messages.DIGITS_SUBSCRIPT % "".join(new)
 
-        return string
+        return re.sub(self.SCRIPTED_DIGITS_RE, _replace, string)
 
     def indentationDescription(self, line):
         if _settingsManager.getSetting('onlySpeakDisplayedText') \
@@ -4132,6 +4146,16 @@ class Utilities:
 
         x, y, width, height = boundingbox
         cell = self.descendantAtPoint(obj, x, y + 1)
+
+        # What is shown is unchanged if the table and the cell in its top-left
+        # corner are where they were.
+        key = tuple(boundingbox), cell
+        rows = _tableCache.getVisibleRows(obj, key)
+        if rows is not None:
+            msg = "INFO: Visible rows of %s are cached: %s" % (obj, rows)
+            debug.println(debug.LEVEL_INFO, msg, True)
+            return rows
+
         row, col = self.coordinatesForCell(cell)
         startIndex = max(0, row)
         msg = "INFO: First cell: %s (row: %i)" % (cell, row)
@@ -4162,6 +4186,7 @@ class Utilities:
         if startIndex not in rows:
             rows.insert(0, startIndex)
 
+        _tableCache.setVisibleRows(obj, key, rows)
         return rows
 
     def getVisibleTableCells(self, obj):
@@ -4182,23 +4207,25 @@ class Utilities:
         if not rows:
             return []
 
+        cells = _tableCache.getVisibleCells(obj)
+        if cells is not None:
+            return list(cells)
+
         colStartIndex, colEndIndex = self._getTableRowRange(obj)
         if colStartIndex == colEndIndex:
             return []
 
         cells = []
         for col in range(colStartIndex, colEndIndex):
-            colHeader = table.getColumnHeader(col)
+            colHeader = _tableCache.getColumnHeader(obj, col)
             if colHeader:
                 cells.append(colHeader)
             for row in rows:
-                try:
-                    cell = table.getAccessibleAt(row, col)
-                except:
-                    continue
+                cell = _tableCache.getCellAt(obj, row, col)
                 if cell and self.isOnScreen(cell):
                     cells.append(cell)
 
+        _tableCache.setVisibleCells(obj, list(cells))
         return cells
 
     def _getTableRowRange(self, obj):
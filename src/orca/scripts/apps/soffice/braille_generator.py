@@ -63,7 +63,7 @@ class BrailleGenerator(braille_generator.BrailleGenerator):
         if not rowHeader:
             return []
 
-        text = self._script.utilities.displayedText(rowHeader)
+        text = self._script.utilities.dynamicHeaderText(rowHeader)
         if text:
             return [text]
 
@@ -82,7 +82,7 @@ class BrailleGenerator(braille_generator.BrailleGenerator):
         if not columnHeader:
             return []
 
-        text = self._script.utilities.displayedText(columnHeader)
+        text = self._script.utilities.dynamicHeaderText(columnHeader)
         if text:
             return [text]
 
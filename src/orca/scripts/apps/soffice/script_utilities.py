@@ -35,6 +35,99 @@ import orca.keybindings as keybindings
 import orca.messages as messages
 import orca.orca_state as orca_state
 import orca.script_utilities as script_utilities
+import orca.table_cache as table_cache
+
+# Selections in Calc can span millions of cells, e.g. after Ctrl+A. So that
+# presenting changes to them does not mean looking at each cell, rows and
+# columns are worked with as runs of (first, last) indices and cells as
+# rectangles of (top, left, bottom, right) coordinates.
+
+def _toRuns(indices):
+    """Returns the sorted, non-overlapping (first, last) runs of indices."""
+
+    runs = []
+    for i in sorted(indices):
+        if runs and i <= runs[-1][1] + 1:
+            runs[-1][1] = max(runs[-1][1], i)
+        else:
+            runs.append([i, i])
+
+    return [tuple(run) for run in runs]
+
+def _runsDifference(a, b):
+    """Returns the runs of the indices in runs a which are not in runs b."""
+
+    result = []
+    j = 0
+    for first, last in a:
+        while j < len(b) and b[j][1] < first:
+            j += 1
+        k = j
+        while first <= last:
+            if k == len(b) or b[k][0] > last:
+                result.append((first, last))
+                break
+            if b[k][0] > first:
+                result.append((first, b[k][0] - 1))
+            first = max(first, b[k][1] + 1)
+            k += 1
+
+    return result
+
+def _runsLength(runs):
+    return sum(last - first + 1 for first, last in runs)
+
+def _rectangleDifference(a, b):
+    """Returns the cells in rectangle a which are not in rectangle b, which
+    may be None, as a list of (firstRow, lastRow, columnRuns) bands."""
+
+    top, left, bottom, right = a
+    if b is None:
+        return [(top, bottom, [(left, right)])]
+
+    rows = _runsDifference([(top, bottom)], [(b[0], b[2])])
+    columns = _runsDifference([(left, right)], [(b[1], b[3])])
+    overlap = max(top, b[0]), min(bottom, b[2])
+    if not columns or overlap[0] > overlap[1]:
+        return [(first, last, [(left, right)]) for first, last in rows]
+
+    if columns == [(left, right)]:
+        return [(top, bottom, columns)]
+
+    bands = [(first, last, [(left, right)]) for first, last in rows]
+    bands.append((overlap[0], overlap[1], columns))
+    return sorted(bands)
+
+def _iterCells(bands, reverse=False):
+    """Yields the (row, column) of each cell in bands in row-major order."""
+
+    step = -1 if reverse else 1
+    for firstRow, lastRow, columns in bands[::step]:
+        rows = range(firstRow, lastRow + 1)[::step]
+        for row in rows:
+            for first, last in columns[::step]:
+                for column in range(first, last + 1)[::step]:
+                    yield row, column
+
+def _summarizeCells(bands, exclude):
+    """Returns the number of cells in bands other than exclude, along with
+    the first and last of them."""
+
+    count = sum((lastRow - firstRow + 1) * _runsLength(columns) \
+                for firstRow, lastRow, columns in bands)
+
+    row, column = exclude or (None, None)
+    for firstRow, lastRow, columns in bands:
+        if exclude and firstRow <= row <= lastRow \
+           and [x for x in columns if x[0] <= column <= x[1]]:
+            count -= 1
+
+    if not count:
+        return 0, None, None
+
+    first = next(x for x in _iterCells(bands) if x != exclude)
+    last = next(x for x in _iterCells(bands, True) if x != exclude)
+    return count, first, last
 
 #############################################################################
 #                                                                           #
@@ -44,6 +137,9 @@ import orca.script_utilities as script_utilities
 
 class Utilities(script_utilities.Utilities):
 
+    # The maximum number of cells whose tables are kept.
+    MAX_CELL_TABLES = 1000
+
     def __init__(self, script):
         """Creates an instance of the Utilities class.
 
@@ -53,10 +149,17 @@ class Utilities(script_utilities.Utilities):
 
         script_utilities.Utilities.__init__(self, script)
 
-        self._calcSelectedCells = []
+        self._calcSelectedCells = None
         self._calcSelectedRows = []
         self._calcSelectedColumns = []
 
+        # The table of each cell, whose coordinates are kept in the table
+        # cache, and the text of the dynamic headers presented for a single
+        # move, so that these are not looked up again for each generator.
+        self._cellTables = {}
+        self._dynamicHeaderTexts = {}
+        self._dynamicHeaderTextsScope = None
+
     #########################################################################
     #                                                                       #
     # Utilities for finding, identifying, and comparing accessibles         #
@@ -137,6 +240,32 @@ class Utilities(script_utilities.Utilities):
     def getRowColumnAndTable(self, cell):
         """Returns the (row, column, table) tuple for cell."""
 
+        cache = table_cache.getCache()
+        try:
+            key = hash(cell)
+        except:
+            key = None
+
+        # The table cache drops the coordinates when rows or columns are
+        # inserted or deleted.
+        table = self._cellTables.get(key)
+        if table is not None:
+            coordinates = cache.getCellCoordinates(table, cell)
+            if coordinates is not None:
+                return coordinates + (table,)
+
+        row, column, table = self._getRowColumnAndTable(cell)
+        if key is None or table is None:
+            return row, column, table
+
+        if len(self._cellTables) >= self.MAX_CELL_TABLES:
+            self._cellTables = {}
+
+        self._cellTables[key] = table
+        cache.setCellCoordinates(table, cell, row, column)
+        return row, column, table
+
+    def _getRowColumnAndTable(self, cell):
         if not (cell and cell.getRole() == pyatspi.ROLE_TABLE_CELL):
             return -1, -1, None
 
@@ -195,16 +324,39 @@ class Utilities(script_utilities.Utilities):
             getColHeader = \
                 getColHeader and objCol!= self._script.pointOfReference.get("lastColumn")
 
-        parentTable = table.queryTable()
+        cache = table_cache.getCache()
         rowHeader, colHeader = None, None
         if getColHeader:
-            colHeader = parentTable.getAccessibleAt(headersRow, objCol)
+            colHeader = cache.getCellAt(table, headersRow, objCol)
 
         if getRowHeader:
-            rowHeader = parentTable.getAccessibleAt(objRow, headersCol)
+            rowHeader = cache.getCellAt(table, objRow, headersCol)
 
         return rowHeader, colHeader
 
+    def dynamicHeaderText(self, header):
+        """Returns the displayed text of the dynamic header cell header."""
+
+        try:
+            key = hash(header)
+        except:
+            return self.displayedText(header)
+
+        # The text of a header can change without any event saying so, e.g.
+        # through recalculation. It is only reused by the generators while
+        # presenting the same cell for the same input event.
+        scope = orca_state.lastInputEvent, orca_state.locusOfFocus
+        if scope != self._dynamicHeaderTextsScope:
+            self._dynamicHeaderTexts = {}
+            self._dynamicHeaderTextsScope = scope
+
+        text = self._dynamicHeaderTexts.get(key)
+        if text is None:
+            text = self.displayedText(header)
+            self._dynamicHeaderTexts[key] = text
+
+        return text
+
     def isSameObject(self, obj1, obj2, comparePaths=False, ignoreNames=False):
         if obj1 == obj2:
             return True
@@ -830,38 +982,40 @@ class Utilities(script_utilities.Utilities):
         if firstCoords == (-1, -1) or lastCoords == (-1, -1):
             return True
 
-        current = []
-        for r in range(firstCoords[0], lastCoords[0]+1):
-            current.extend((r, c) for c in range(firstCoords[1], lastCoords[1]+1))
+        current = firstCoords + lastCoords
+        if current[0] > current[2] or current[1] > current[3]:
+            current = None
 
-        current = set(current)
-        previous = set(self._calcSelectedCells)
-        current.discard((-1, -1))
-        previous.discard((-1, -1))
+        previous = self._calcSelectedCells
+        unselected = selected = []
+        if previous:
+            unselected = _rectangleDifference(previous, current)
+        if current:
+            selected = _rectangleDifference(current, previous)
 
-        unselected = sorted(previous.difference(current))
-        selected = sorted(current.difference(previous))
         focusCoords = tuple(self.coordinatesForCell(orca_state.locusOfFocus))
-        if focusCoords in selected:
-            selected.remove(focusCoords)
+        nUnselected, firstUnselected, lastUnselected = \
+            _summarizeCells(unselected, None)
+        nSelected, firstSelected, lastSelected = \
+            _summarizeCells(selected, focusCoords)
 
-        self._calcSelectedCells = sorted(current)
+        self._calcSelectedCells = current
 
         msgs = []
-        if len(unselected) == 1:
-            cell = self._getCellNameForCoordinates(obj, *unselected[0], True)
+        if nUnselected == 1:
+            cell = self._getCellNameForCoordinates(obj, *firstUnselected, True)
             msgs.append(messages.CELL_UNSELECTED % cell)
-        elif len(unselected) > 1:
-            cell1 = self._getCellNameForCoordinates(obj, *unselected[0], True)
-            cell2 = self._getCellNameForCoordinates(obj, *unselected[-1], True)
+        elif nUnselected > 1:
+            cell1 = self._getCellNameForCoordinates(obj, *firstUnselected, True)
+            cell2 = self._getCellNameForCoordinates(obj, *lastUnselected, True)
             msgs.append(messages.CELL_RANGE_UNSELECTED % (cell1, cell2))
 
-        if len(selected) == 1:
-            cell = self._getCellNameForCoordinates(obj, *selected[0], True)
+        if nSelected == 1:
+            cell = self._getCellNameForCoordinates(obj, *firstSelected, True)
             msgs.append(messages.CELL_SELECTED % cell)
-        elif len(selected) > 1:
-            cell1 = self._getCellNameForCoordinates(obj, *selected[0], True)
-            cell2 = self._getCellNameForCoordinates(obj, *selected[-1], True)
+        elif nSelected > 1:
+            cell1 = self._getCellNameForCoordinates(obj, *firstSelected, True)
+            cell2 = self._getCellNameForCoordinates(obj, *lastSelected, True)
             msgs.append(messages.CELL_RANGE_SELECTED % (cell1, cell2))
 
         if msgs:
@@ -878,52 +1032,52 @@ class Utilities(script_utilities.Utilities):
             return True
 
         table = obj.queryTable()
-        cols = set(table.getSelectedColumns())
-        rows = set(table.getSelectedRows())
+        cols = _toRuns(table.getSelectedColumns())
+        rows = _toRuns(table.getSelectedRows())
 
-        selectedCols = sorted(cols.difference(set(self._calcSelectedColumns)))
-        unselectedCols = sorted(set(self._calcSelectedColumns).difference(cols))
-        convert = lambda x: self.columnConvert(x+1)
-        selectedCols = list(map(convert, selectedCols))
-        unselectedCols = list(map(convert, unselectedCols))
+        selectedCols = _runsDifference(cols, self._calcSelectedColumns)
+        unselectedCols = _runsDifference(self._calcSelectedColumns, cols)
+        selectedRows = _runsDifference(rows, self._calcSelectedRows)
+        unselectedRows = _runsDifference(self._calcSelectedRows, rows)
 
-        selectedRows = sorted(rows.difference(set(self._calcSelectedRows)))
-        unselectedRows = sorted(set(self._calcSelectedRows).difference(rows))
-        convert = lambda x: x + 1
-        selectedRows = list(map(convert, selectedRows))
-        unselectedRows = list(map(convert, unselectedRows))
+        self._calcSelectedColumns = cols
+        self._calcSelectedRows = rows
 
-        self._calcSelectedColumns = list(cols)
-        self._calcSelectedRows = list(rows)
-
-        if len(cols) == table.nColumns:
+        if _runsLength(cols) == table.nColumns:
             self._script.speakMessage(messages.DOCUMENT_SELECTED_ALL)
             return True
 
-        if not len(cols) and len(unselectedCols) == table.nColumns:
+        if not cols and _runsLength(unselectedCols) == table.nColumns:
             self._script.speakMessage(messages.DOCUMENT_UNSELECTED_ALL)
             return True
 
+        convertCol = lambda x: self.columnConvert(x+1)
+        convertRow = lambda x: x + 1
+
         msgs = []
-        if len(unselectedCols) == 1:
-            msgs.append(messages.TABLE_COLUMN_UNSELECTED % unselectedCols[0])
-        elif len(unselectedCols) > 1:
-            msgs.append(messages.TABLE_COLUMN_RANGE_UNSELECTED % (unselectedCols[0], unselectedCols[-1]))
-
-        if len(unselectedRows) == 1:
-            msgs.append(messages.TABLE_ROW_UNSELECTED % unselectedRows[0])
-        elif len(unselectedRows) > 1:
-            msgs.append(messages.TABLE_ROW_RANGE_UNSELECTED % (unselectedRows[0], unselectedRows[-1]))
-
-        if len(selectedCols) == 1:
-            msgs.append(messages.TABLE_COLUMN_SELECTED % selectedCols[0])
-        elif len(selectedCols) > 1:
-            msgs.append(messages.TABLE_COLUMN_RANGE_SELECTED % (selectedCols[0], selectedCols[-1]))
-
-        if len(selectedRows) == 1:
-            msgs.append(messages.TABLE_ROW_SELECTED % selectedRows[0])
-        elif len(selectedRows) > 1:
-            msgs.append(messages.TABLE_ROW_RANGE_SELECTED % (selectedRows[0], selectedRows[-1]))
+        if _runsLength(unselectedCols) == 1:
+            msgs.append(messages.TABLE_COLUMN_UNSELECTED % convertCol(unselectedCols[0][0]))
+        elif unselectedCols:
+            msgs.append(messages.TABLE_COLUMN_RANGE_UNSELECTED \
+                        % (convertCol(unselectedCols[0][0]), convertCol(unselectedCols[-1][1])))
+
+        if _runsLength(unselectedRows) == 1:
+            msgs.append(messages.TABLE_ROW_UNSELECTED % convertRow(unselectedRows[0][0]))
+        elif unselectedRows:
+            msgs.append(messages.TABLE_ROW_RANGE_UNSELECTED \
+                        % (convertRow(unselectedRows[0][0]), convertRow(unselectedRows[-1][1])))
+
+        if _runsLength(selectedCols) == 1:
+            msgs.append(messages.TABLE_COLUMN_SELECTED % convertCol(selectedCols[0][0]))
+        elif selectedCols:
+            msgs.append(messages.TABLE_COLUMN_RANGE_SELECTED \
+                        % (convertCol(selectedCols[0][0]), convertCol(selectedCols[-1][1])))
+
+        if _runsLength(selectedRows) == 1:
+            msgs.append(messages.TABLE_ROW_SELECTED % convertRow(selectedRows[0][0]))
+        elif selectedRows:
+            msgs.append(messages.TABLE_ROW_RANGE_SELECTED \
+                        % (convertRow(selectedRows[0][0]), convertRow(selectedRows[-1][1])))
 
         if msgs:
             self._script.presentationInterrupt()
@@ -296,7 +296,7 @@ class SpeechGenerator(speech_generator.SpeechGenerator):
             return super()._generateRowHeader(obj, **args)
 
         result = []
-        text = self._script.utilities.displayedText(rowHeader)
+        text = self._script.utilities.dynamicHeaderText(rowHeader)
         if text:
             result.append(text)
             result.extend(self.voice(speech_generator.DEFAULT))
@@ -318,7 +318,7 @@ class SpeechGenerator(speech_generator.SpeechGenerator):
             return super()._generateColumnHeader(obj, **args)
 
         result = []
-        text = self._script.utilities.displayedText(columnHeader)
+        text = self._script.utilities.dynamicHeaderText(columnHeader)
         if text:
             result.append(text)
             result.extend(self.voice(speech_generator.DEFAULT))
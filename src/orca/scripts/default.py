@@ -30,6 +30,7 @@ __copyright__ = "Copyright (c) 2004-2009 Sun Microsystems Inc." \
                 "Copyright (c) 2010 Joanmarie Diggs"
 __license__   = "LGPL"
 
+import functools
 import time
 
 import pyatspi
@@ -47,6 +48,7 @@ import orca.orca as orca
 import orca.orca_gui_commandlist as commandlist
 import orca.orca_state as orca_state
 import orca.phonnames as phonnames
+import orca.say_all_prefetcher as say_all_prefetcher
 import orca.script as script
 import orca.settings as settings
 import orca.settings_manager as settings_manager
@@ -122,6 +124,7 @@ class Script(script.Script):
         self._inSayAll = False
         self._sayAllIsInterrupted = False
         self._sayAllContexts = []
+        self._sayAllPrefetcher = None
 
         if app:
             app.setCacheMask(
@@ -722,6 +725,7 @@ class Script(script.Script):
 
         self._inSayAll = False
         self._sayAllIsInterrupted = False
+        self._cancelSayAllPrefetcher()
         self.pointOfReference = {}
 
     def registerEventListeners(self):
@@ -1782,11 +1786,25 @@ class Script(script.Script):
         else:
             if offset is None:
                 offset = text.caretOffset
-            speech.sayAll(self.textLines(obj, offset),
-                          self.__sayAllProgressCallback)
+            self._startSayAll(self.textLines(obj, offset),
+                              self.__sayAllProgressCallback)
 
         return True
 
+    def _startSayAll(self, generator, progressCallback, restart=None):
+        """Speaks the utterances produced by generator, e.g. textLines, having
+        them produced ahead of speech. See SayAllPrefetcher for restart."""
+
+        self._cancelSayAllPrefetcher()
+        self._sayAllPrefetcher = \
+            say_all_prefetcher.SayAllPrefetcher(generator, restart)
+        speech.sayAll(self._sayAllPrefetcher, progressCallback)
+
+    def _cancelSayAllPrefetcher(self):
+        if self._sayAllPrefetcher:
+            self._sayAllPrefetcher.cancel()
+            self._sayAllPrefetcher = None
+
     def toggleFlatReviewMode(self, inputEvent=None):
         """Toggles between flat review mode and focus tracking mode."""
 
@@ -2496,10 +2514,18 @@ class Script(script.Script):
             if entry and entry.getState().contains(pyatspi.STATE_FOCUSED):
                 return
  
+        # The ancestors of the locus of focus up to obj, gathered once rather
+        # than for each of what may be a great many selected children.
+        focusAncestors = []
+        ancestor = orca_state.locusOfFocus
+        while ancestor and ancestor != obj:
+            ancestor = ancestor.parent
+            if ancestor:
+                focusAncestors.append(ancestor)
         mouseReviewItem = mouse_review.reviewer.getCurrentItem()
         selectedChildren = self.utilities.selectedChildren(obj)
         for child in selectedChildren:
-            if pyatspi.findAncestor(orca_state.locusOfFocus, lambda x: x == child):
+            if child in focusAncestors:
                 msg = "DEFAULT: Child %s is ancestor of locusOfFocus" % child
                 debug.println(debug.LEVEL_INFO, msg, True)
                 self._saveFocusedObjectInfo(orca_state.locusOfFocus)
@@ -2966,6 +2992,12 @@ class Script(script.Script):
         if not _settingsManager.getSetting('rewindAndFastForwardInSayAll'):
             return False
 
+        if self._sayAllPrefetcher:
+            isTarget = lambda x, startsGroup: x is not context \
+                and x.endOffset - x.startOffset > minCharCount
+            if self._resumeSayAll(self._sayAllPrefetcher.rewind(isTarget)):
+                return True
+
         index = self._sayAllContexts.index(context)
         self._sayAllContexts = self._sayAllContexts[0:index]
         while self._sayAllContexts:
@@ -2988,6 +3020,11 @@ class Script(script.Script):
         if not _settingsManager.getSetting('rewindAndFastForwardInSayAll'):
             return False
 
+        if self._sayAllPrefetcher:
+            isTarget = lambda x, startsGroup: True
+            if self._resumeSayAll(self._sayAllPrefetcher.fastForward(isTarget)):
+                return True
+
         try:
             text = context.obj.queryText()
         except:
@@ -2999,6 +3036,24 @@ class Script(script.Script):
         self.sayAll(None, context.obj, context.endOffset)
         return True
 
+    def _resumeSayAll(self, context):
+        """Resumes the interrupted SayAll at context, which the prefetcher
+        has already been rewound or fast forwarded to."""
+
+        if not context:
+            return False
+
+        try:
+            text = context.obj.queryText()
+        except:
+            pass
+        else:
+            orca.setLocusOfFocus(None, context.obj, notifyScript=False)
+            text.setCaretOffset(context.startOffset)
+
+        speech.sayAll(self._sayAllPrefetcher, self.__sayAllProgressCallback)
+        return True
+
     def __sayAllProgressCallback(self, context, progressType):
         # [[[TODO: WDW - this needs work.  Need to be able to manage
         # the monitoring of progress and couple that with both updating
@@ -3029,6 +3084,7 @@ class Script(script.Script):
 
             self._inSayAll = False
             self._sayAllContexts = []
+            self._cancelSayAllPrefetcher()
             text.setCaretOffset(context.currentOffset)
         elif progressType == speechserver.SayAllContext.COMPLETED:
             orca.setLocusOfFocus(None, context.obj, notifyScript=False)
@@ -3494,7 +3550,9 @@ class Script(script.Script):
 
         Returns an iterator that produces elements of the form:
         [SayAllContext, acss], where SayAllContext has the text to be
-        spoken and acss is an ACSS instance for speaking the text.
+        spoken and acss is an ACSS instance for speaking the text. It
+        also produces callables, which must be called when speech reaches
+        the element which follows them. See SayAllPrefetcher.
         """
 
         self._sayAllIsInterrupted = False
@@ -3526,8 +3584,7 @@ class Script(script.Script):
         #
         done = False
         while not done:
-            eventsynthesizer.scrollIntoView(obj)
-            speech.speak(self.speechGenerator.generateContext(obj, priorObj=priorObj))
+            yield functools.partial(self._presentSayAllObject, obj, priorObj)
 
             lastEndOffset = -1
             while offset < length:
@@ -3599,12 +3656,21 @@ class Script(script.Script):
             if not moreLines:
                 done = True
 
-        self._inSayAll = False
-        self._sayAllContexts = []
+        def _complete():
+            self._inSayAll = False
+            self._sayAllContexts = []
 
-        msg = "DEFAULT: textLines complete. Verifying SayAll status"
-        debug.println(debug.LEVEL_INFO, msg, True)
-        self.inSayAll()
+            msg = "DEFAULT: textLines complete. Verifying SayAll status"
+            debug.println(debug.LEVEL_INFO, msg, True)
+            self.inSayAll()
+
+        yield _complete
+
+    def _presentSayAllObject(self, obj, priorObj):
+        """Called by textLines as SayAll reaches obj."""
+
+        eventsynthesizer.scrollIntoView(obj)
+        speech.speak(self.speechGenerator.generateContext(obj, priorObj=priorObj))
 
     def getTextLineAtCaret(self, obj, offset=None, startOffset=None, endOffset=None):
         """To-be-removed. Returns the string, caretOffset, startOffset."""
@@ -465,8 +465,8 @@ class Script(default.Script):
         if not self.utilities.isWebKitGtk(obj):
             return default.Script.sayAll(self, inputEvent, obj, offset)
 
-        speech.sayAll(self.textLines(obj, offset),
-                      self.__sayAllProgressCallback)
+        self._startSayAll(self.textLines(obj, offset),
+                          self.__sayAllProgressCallback)
 
         return True
 
@@ -572,6 +572,7 @@ class Script(default.Script):
 
             self._inSayAll = False
             self._sayAllContexts = []
+            self._cancelSayAllPrefetcher()
             if not self._lastCommandWasStructNav:
                 text.setCaretOffset(offset)
             return
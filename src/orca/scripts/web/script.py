@@ -28,6 +28,7 @@ __copyright__ = "Copyright (c) 2005-2009 Sun Microsystems Inc." \
 __license__   = "LGPL"
 
 from gi.repository import Gtk
+import functools
 import pyatspi
 import time
 
@@ -69,6 +70,7 @@ class Script(default.Script):
         self._sayAllContents = []
         self._inSayAll = False
         self._sayAllIsInterrupted = False
+        self._sayAllAncestors = {}
         self._loadingDocumentContent = False
         self._madeFindAnnouncement = False
         self._lastCommandWasCaretNav = False
@@ -111,6 +113,8 @@ class Script(default.Script):
         self._sayAllContents = []
         self._inSayAll = False
         self._sayAllIsInterrupted = False
+        self._cancelSayAllPrefetcher()
+        self._sayAllAncestors = {}
         self._loadingDocumentContent = False
         self._madeFindAnnouncement = False
         self._lastCommandWasCaretNav = False
@@ -590,13 +594,12 @@ class Script(default.Script):
                 contents = self.utilities.getSentenceContentsAtOffset(obj, characterOffset)
             else:
                 contents = self.utilities.getLineContentsAtOffset(obj, characterOffset)
-            self._sayAllContents = contents
+            yield functools.partial(self._presentSayAllContents, contents)
             for content in contents:
                 if self.utilities.isInferredLabelForContents(content, contents):
                     continue
 
                 obj, startOffset, endOffset, text = content
-                eventsynthesizer.scrollIntoView(obj)
                 utterances = self.speechGenerator.generateContents(
                     [content], eliminatePauses=True, priorObj=priorObj)
                 priorObj = obj
@@ -618,13 +621,25 @@ class Script(default.Script):
 
             done = obj is None
 
-        self._inSayAll = False
-        self._sayAllContents = []
-        self._sayAllContexts = []
+        def _complete():
+            self._inSayAll = False
+            self._sayAllContents = []
+            self._sayAllContexts = []
 
-        msg = "WEB: textLines complete. Verifying SayAll status"
-        debug.println(debug.LEVEL_INFO, msg, True)
-        self.inSayAll()
+            msg = "WEB: textLines complete. Verifying SayAll status"
+            debug.println(debug.LEVEL_INFO, msg, True)
+            self.inSayAll()
+
+        yield _complete
+
+    def _presentSayAllContents(self, contents):
+        """Called by textLines as SayAll reaches the line or sentence whose
+        contents are given."""
+
+        self._sayAllContents = contents
+        for content in contents:
+            if not self.utilities.isInferredLabelForContents(content, contents):
+                eventsynthesizer.scrollIntoView(content[0])
 
     def presentFindResults(self, obj, offset):
         """Updates the context and presents the find results if appropriate."""
@@ -672,9 +687,55 @@ class Script(default.Script):
         obj = obj or orca_state.locusOfFocus
         msg = "WEB: SayAll called for document content %s" % obj
         debug.println(debug.LEVEL_INFO, msg, True)
-        speech.sayAll(self.textLines(obj, offset), self.__sayAllProgressCallback)
+        restart = lambda x: self.textLines(x.obj, x.startOffset)
+        self._startSayAll(self.textLines(obj, offset),
+                          self.__sayAllProgressCallback, restart)
         return True
 
+    def _getSayAllAncestors(self, obj):
+        """Returns the hashes of obj and of its ancestors in the document."""
+
+        key = hash(obj)
+        ancestors = self._sayAllAncestors.get(key)
+        if ancestors is not None:
+            return ancestors
+
+        ancestors = set()
+        while obj:
+            ancestors.add(hash(obj))
+            if self.utilities.isDocument(obj):
+                break
+            obj = obj.parent
+
+        if len(self._sayAllAncestors) >= 500:
+            self._sayAllAncestors = {}
+        self._sayAllAncestors[key] = ancestors
+        return ancestors
+
+    def _invalidateSayAllPrefetcher(self, obj):
+        """Has the SayAll prefetcher produce its utterances again if obj, whose
+        contents changed, is or contains the source of one of them. Changes
+        elsewhere in the document, e.g. to a clock or a live region, leave
+        what was produced alone."""
+
+        if not (self._inSayAll and self._sayAllPrefetcher):
+            return
+
+        try:
+            key = hash(obj)
+            for context in self._sayAllPrefetcher.getContexts():
+                if key in self._getSayAllAncestors(context.obj):
+                    break
+            else:
+                return
+        except:
+            pass
+
+        msg = "WEB: Change to %s affects SayAll utterances produced in advance" % obj
+        debug.println(debug.LEVEL_INFO, msg, True)
+        self._sayAllPrefetcher.invalidate()
+        self._sayAllAncestors = {}
+
     def _rewindSayAll(self, context, minCharCount=10):
         if not self.utilities.inDocumentContent():
             return super()._rewindSayAll(context, minCharCount)
@@ -682,6 +743,17 @@ class Script(default.Script):
         if not _settingsManager.getSetting('rewindAndFastForwardInSayAll'):
             return False
 
+        if self._sayAllPrefetcher:
+            # The first start of a line we reach is that of the current line.
+            groupStarts = []
+            def isTarget(x, startsGroup):
+                if startsGroup:
+                    groupStarts.append(x)
+                return len(groupStarts) == 2
+
+            if self._resumeSayAll(self._sayAllPrefetcher.rewind(isTarget)):
+                return True
+
         try:
             obj, start, end, string = self._sayAllContents[0]
         except IndexError:
@@ -701,6 +773,11 @@ class Script(default.Script):
         if not _settingsManager.getSetting('rewindAndFastForwardInSayAll'):
             return False
 
+        if self._sayAllPrefetcher:
+            isTarget = lambda x, startsGroup: startsGroup
+            if self._resumeSayAll(self._sayAllPrefetcher.fastForward(isTarget)):
+                return True
+
         try:
             obj, start, end, string = self._sayAllContents[-1]
         except IndexError:
@@ -713,6 +790,18 @@ class Script(default.Script):
         self.sayAll(None, nextObj, nextOffset)
         return True
 
+    def _resumeSayAll(self, context):
+        if not self.utilities.inDocumentContent():
+            return super()._resumeSayAll(context)
+
+        if not context:
+            return False
+
+        orca.setLocusOfFocus(None, context.obj, notifyScript=False)
+        self.utilities.setCaretContext(context.obj, context.startOffset)
+        speech.sayAll(self._sayAllPrefetcher, self.__sayAllProgressCallback)
+        return True
+
     def __sayAllProgressCallback(self, context, progressType):
         if not self.utilities.inDocumentContent() or self._inFocusMode:
             super().__sayAllProgressCallback(context, progressType)
@@ -733,6 +822,7 @@ class Script(default.Script):
             self._inSayAll = False
             self._sayAllContents = []
             self._sayAllContexts = []
+            self._cancelSayAllPrefetcher()
             return
 
         orca.setLocusOfFocus(None, context.obj, notifyScript=False)
@@ -1274,6 +1364,7 @@ class Script(default.Script):
             return False
 
         self.structuralNavigation.clearCache()
+        self.utilities.clearLineCache()
 
         if self.utilities.getDocumentForObject(event.source.parent):
             msg = "WEB: Ignoring: Event source is nested document"
@@ -1580,9 +1671,12 @@ class Script(default.Script):
 
         document = self.utilities.getDocumentForObject(event.source)
         if document:
-            msg = "WEB: Clearing structural navigation cache for %s" % document
+            msg = "WEB: Updating structural navigation cache for %s" % document
             debug.println(debug.LEVEL_INFO, msg, True)
-            self.structuralNavigation.clearCache(document)
+            self.structuralNavigation.updateCache(event)
+            self.utilities.invalidateLineCache(event.source)
+            self.utilities.invalidateInferredLabels(event.source)
+            self._invalidateSayAllPrefetcher(event.source)
         else:
             msg = "WEB: Could not get document for event source"
             debug.println(debug.LEVEL_INFO, msg, True)
@@ -1921,6 +2015,17 @@ class Script(default.Script):
 
         return False
 
+    def onSensitiveChanged(self, event):
+        """Callback for object:state-changed:sensitive accessibility events."""
+
+        if not self.utilities.inDocumentContent(event.source):
+            msg = "WEB: Event source is not in document content"
+            debug.println(debug.LEVEL_INFO, msg, True)
+            return False
+
+        self.structuralNavigation.updateCache(event)
+        return False
+
     def onShowingChanged(self, event):
         """Callback for object:state-changed:showing accessibility events."""
 
@@ -1982,12 +2087,14 @@ class Script(default.Script):
         msg = "WEB: Clearing content cache due to text deletion"
         debug.println(debug.LEVEL_INFO, msg, True)
         self.utilities.clearContentCache()
+        self.utilities.invalidateLineCache(event.source)
 
         document = self.utilities.getDocumentForObject(event.source)
         if document:
-            msg = "WEB: Clearing structural navigation cache for %s" % document
+            msg = "WEB: Updating structural navigation cache for %s" % document
             debug.println(debug.LEVEL_INFO, msg, True)
-            self.structuralNavigation.clearCache(document)
+            self.structuralNavigation.updateCache(event)
+            self._invalidateSayAllPrefetcher(event.source)
 
         if not event.source.getState().contains(pyatspi.STATE_EDITABLE) \
            and not self.utilities.isContentEditableWithEmbeddedObjects(event.source):
@@ -2041,6 +2148,7 @@ class Script(default.Script):
         msg = "WEB: Clearing content cache due to text insertion"
         debug.println(debug.LEVEL_INFO, msg, True)
         self.utilities.clearContentCache()
+        self.utilities.invalidateLineCache(event.source)
 
         if self.utilities.handleAsLiveRegion(event):
             msg = "WEB: Event to be handled as live region"
@@ -2050,9 +2158,10 @@ class Script(default.Script):
 
         document = self.utilities.getDocumentForObject(event.source)
         if document:
-            msg = "WEB: Clearing structural navigation cache for %s" % document
+            msg = "WEB: Updating structural navigation cache for %s" % document
             debug.println(debug.LEVEL_INFO, msg, True)
-            self.structuralNavigation.clearCache(document)
+            self.structuralNavigation.updateCache(event)
+            self._invalidateSayAllPrefetcher(event.source)
 
         text = self.utilities.queryNonEmptyText(event.source)
         if not text:
@@ -25,10 +25,12 @@ __copyright__ = "Copyright (c) 2010 Joanmarie Diggs." \
                 "Copyright (c) 2014-2015 Igalia, S.L."
 __license__   = "LGPL"
 
+import bisect
 import pyatspi
 import re
 import urllib
 
+from orca import accessible_cache
 from orca import debug
 from orca import input_event
 from orca import messages
@@ -39,10 +41,164 @@ from orca import script_manager
 from orca import settings
 from orca import settings_manager
 
+_accessibleCache = accessible_cache.getCache()
 _scriptManager = script_manager.getManager()
 _settingsManager = settings_manager.getManager()
 
 
+class LineCache:
+    """Caches the layout-mode lines of document content, along with which
+    line follows which, so that moving by line over content which has been
+    visited does not mean finding the boundaries of each line again. Lines
+    are identified by the number with which they were added. Lines are also
+    indexed by the objects in them and by the ancestors of those objects, so
+    that when an object changes only the lines it is part of are dropped.
+    All lines are dropped when the size of a document they are in changes."""
+
+    # The maximum number of lines which are kept.
+    MAX_LINES = 500
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._lines = {}
+        self._numbers = {}
+        self._keys = {}
+        self._objects = {}
+        self._ancestors = {}
+        self._next = {}
+        self._previous = {}
+        self._documents = {}
+        self._documentSizes = {}
+        self._count = 0
+
+    def _getNumber(self, contents):
+        number = self._numbers.get(id(contents))
+        if number is not None and self._lines[number] is contents:
+            return number
+
+        return None
+
+    def getLine(self, obj, offset, findObjectInContents):
+        """Returns the cached line containing obj at offset, or None."""
+
+        try:
+            numbers = self._objects.get(hash(obj), ())
+        except:
+            return None
+
+        for number in numbers:
+            contents = self._lines[number]
+            if findObjectInContents(obj, offset, contents, usingCache=True) != -1:
+                return contents
+
+        return None
+
+    def addLine(self, contents, ancestors, document=None):
+        """Adds contents. ancestors holds the hashes of the ancestors of the
+        objects in it and document is the document it is in."""
+
+        if not contents or self._getNumber(contents) is not None:
+            return
+
+        if len(self._lines) >= self.MAX_LINES:
+            self._drop(next(iter(self._lines)))
+
+        number = self._count
+        self._count += 1
+        self._lines[number] = contents
+        self._numbers[id(contents)] = number
+        self._documents[number] = document
+        self._keys[number] = set(hash(x[0]) for x in contents), set(ancestors)
+        for key in self._keys[number][0]:
+            self._objects.setdefault(key, set()).add(number)
+        for key in self._keys[number][1]:
+            self._ancestors.setdefault(key, set()).add(number)
+
+    def setAdjacent(self, contents, nextContents):
+        """Records that nextContents is the line after contents."""
+
+        number = self._getNumber(contents)
+        nextNumber = self._getNumber(nextContents)
+        if number is None or nextNumber is None or number == nextNumber:
+            return
+
+        self._next[number] = nextNumber
+        self._previous[nextNumber] = number
+
+    def getDocument(self, contents):
+        return self._documents.get(self._getNumber(contents))
+
+    def checkDocumentSize(self, document, size):
+        """Records the size of document, from which its lines were added.
+        If it differs from the size last recorded, all lines are dropped and
+        False is returned."""
+
+        try:
+            key = hash(document)
+        except:
+            return True
+
+        lastSize = self._documentSizes.get(key)
+        if lastSize is not None and lastSize != size:
+            self.clear()
+            self._documentSizes[key] = size
+            return False
+
+        self._documentSizes[key] = size
+        return True
+
+    def getNext(self, contents):
+        number = self._next.get(self._getNumber(contents))
+        if number is None:
+            return None
+
+        return self._lines[number]
+
+    def getPrevious(self, contents):
+        number = self._previous.get(self._getNumber(contents))
+        if number is None:
+            return None
+
+        return self._lines[number]
+
+    def invalidate(self, obj):
+        """Drops the lines containing obj or any of its descendants."""
+
+        try:
+            key = hash(obj)
+        except:
+            return
+
+        numbers = self._objects.get(key, set()).union(self._ancestors.get(key, ()))
+        if not numbers:
+            return
+
+        msg = "WEB: Dropping %i cached lines for %s" % (len(numbers), obj)
+        debug.println(debug.LEVEL_INFO, msg, True)
+        for number in numbers:
+            self._drop(number)
+
+    def _drop(self, number):
+        contents = self._lines.pop(number)
+        self._numbers.pop(id(contents), None)
+        self._documents.pop(number, None)
+        objectKeys, ancestorKeys = self._keys.pop(number)
+        for index, keys in (self._objects, objectKeys), (self._ancestors, ancestorKeys):
+            for key in keys:
+                index[key].discard(number)
+                if not index[key]:
+                    del index[key]
+
+        nextNumber = self._next.pop(number, None)
+        if nextNumber is not None:
+            self._previous.pop(nextNumber, None)
+        previousNumber = self._previous.pop(number, None)
+        if previousNumber is not None:
+            self._next.pop(previousNumber, None)
+
+
 class Utilities(script_utilities.Utilities):
 
     def __init__(self, script):
@@ -75,8 +231,6 @@ class Utilities(script_utilities.Utilities):
         self._hasNoSize = {}
         self._hasLongDesc = {}
         self._hasUselessCanvasDescendant = {}
-        self._id = {}
-        self._displayStyle = {}
         self._isClickableElement = {}
         self._isAnchor = {}
         self._isEditableComboBox = {}
@@ -93,26 +247,23 @@ class Utilities(script_utilities.Utilities):
         self._isNonNavigableEmbeddedDocument = {}
         self._isParentOfNullChild = {}
         self._inferredLabels = {}
+        self._inferredLabelContainers = {}
         self._actualLabels = {}
         self._labelTargets = {}
         self._displayedLabelText = {}
         self._mimeType = {}
-        self._roleDescription = {}
         self._preferDescriptionOverName = {}
         self._shouldFilter = {}
         self._shouldInferLabelFor = {}
         self._shouldReadFullRow = {}
         self._text = {}
-        self._tag = {}
-        self._xmlRoles = {}
         self._treatAsDiv = {}
-        self._posinset = {}
-        self._setsize = {}
         self._currentObjectContents = None
         self._currentSentenceContents = None
         self._currentLineContents = None
         self._currentWordContents = None
         self._currentCharacterContents = None
+        self._lineCache = LineCache()
         self._lastQueuedLiveRegionEvent = None
 
         self._validChildRoles = {pyatspi.ROLE_LIST: [pyatspi.ROLE_LIST_ITEM]}
@@ -150,8 +301,6 @@ class Utilities(script_utilities.Utilities):
         self._hasNoSize = {}
         self._hasLongDesc = {}
         self._hasUselessCanvasDescendant = {}
-        self._id = {}
-        self._displayStyle = {}
         self._isClickableElement = {}
         self._isAnchor = {}
         self._isEditableComboBox = {}
@@ -168,25 +317,23 @@ class Utilities(script_utilities.Utilities):
         self._isNonNavigableEmbeddedDocument = {}
         self._isParentOfNullChild = {}
         self._inferredLabels = {}
+        self._inferredLabelContainers = {}
         self._actualLabels = {}
         self._labelTargets = {}
         self._displayedLabelText = {}
         self._mimeType = {}
-        self._roleDescription = {}
         self._preferDescriptionOverName = {}
         self._shouldFilter = {}
         self._shouldInferLabelFor = {}
         self._shouldReadFullRow = {}
-        self._tag = {}
-        self._xmlRoles = {}
         self._treatAsDiv = {}
-        self._posinset = {}
-        self._setsize = {}
         self._paths = {}
         self._contextPathsRolesAndNames = {}
         self._cleanupContexts()
         self._priorContexts = {}
         self._lastQueuedLiveRegionEvent = None
+        self._lineCache.clear()
+        _accessibleCache.clearAttributes()
 
     def clearContentCache(self):
         self._currentObjectContents = None
@@ -197,6 +344,84 @@ class Utilities(script_utilities.Utilities):
         self._currentAttrs = {}
         self._text = {}
 
+    def clearLineCache(self):
+        self._lineCache.clear()
+
+    def invalidateLineCache(self, obj):
+        """Drops the cached lines which contain obj or its descendants."""
+
+        self._lineCache.invalidate(obj)
+
+    def invalidateInferredLabels(self, obj):
+        """Drops the labels inferred in a single pass over the container obj
+        or over the container of which obj is a part."""
+
+        try:
+            containers = self._inferredLabelContainers.pop(hash(obj), ())
+        except:
+            return
+
+        for container in containers:
+            for key in self._inferredLabelContainers.pop(container, ()):
+                self._inferredLabels.pop(key, None)
+
+    def _getLineAncestors(self, contents):
+        ancestors = set()
+        for obj in set(x[0] for x in contents):
+            try:
+                parent = obj.parent
+                while parent and not hash(parent) in ancestors:
+                    ancestors.add(hash(parent))
+                    if self.isDocument(parent):
+                        break
+                    parent = parent.parent
+            except:
+                msg = "WEB: Exception getting ancestors of %s" % obj
+                debug.println(debug.LEVEL_INFO, msg, True)
+
+        return ancestors
+
+    @staticmethod
+    def _getSize(obj):
+        try:
+            return tuple(obj.queryComponent().getExtents(0))[2:]
+        except:
+            return None
+
+    def _cachedLineIsValid(self, contents):
+        # Toolkits do not tell us when content is reflowed. Most reflows are
+        # the result of the document being resized, after which no cached line
+        # can be trusted.
+        document = self._lineCache.getDocument(contents)
+        if not self._lineCache.checkDocumentSize(document, self._getSize(document)):
+            msg = "WEB: Size of %s changed. Cached lines dropped." % document
+            debug.println(debug.LEVEL_INFO, msg, True)
+            return False
+
+        # Otherwise a line which wraps differently than it did is unlikely to
+        # still start and end on the same line, or to be the only thing there.
+        firstObj, firstStart = contents[0][0], contents[0][1]
+        lastObj, lastStart, lastEnd = contents[-1][0], contents[-1][1], contents[-1][2]
+        firstExtents = self.getExtents(firstObj, firstStart, firstStart + 1)
+        if not (firstObj == lastObj and firstStart == lastStart):
+            lastExtents = self.getExtents(lastObj, lastStart, lastStart + 1)
+            if not self.extentsAreOnSameLine(firstExtents, lastExtents):
+                return False
+
+        prevObj, prevOffset = self.previousContext(firstObj, firstStart, True)
+        if prevObj and (prevObj, prevOffset) != (firstObj, firstStart):
+            prevExtents = self.getExtents(prevObj, prevOffset, prevOffset + 1)
+            if self.extentsAreOnSameLine(firstExtents, prevExtents):
+                return False
+
+        nextObj, nextOffset = self.nextContext(lastObj, max(lastStart, lastEnd - 1), True)
+        if nextObj and (nextObj, nextOffset) != (lastObj, lastStart):
+            nextExtents = self.getExtents(nextObj, nextOffset, nextOffset + 1)
+            if self.extentsAreOnSameLine(firstExtents, nextExtents):
+                return False
+
+        return True
+
     def isDocument(self, obj):
         roles = [pyatspi.ROLE_DOCUMENT_FRAME, pyatspi.ROLE_DOCUMENT_WEB, pyatspi.ROLE_EMBEDDED]
 
@@ -495,106 +720,68 @@ class Utilities(script_utilities.Utilities):
         return lastChild
 
     def getRoleDescription(self, obj):
-        rv = self._roleDescription.get(hash(obj))
-        if rv is not None:
-            return rv
-
         try:
-            attrs = dict([attr.split(':', 1) for attr in obj.getAttributes()])
+            attrs = _accessibleCache.getAttributes(obj)
         except:
             attrs = {}
 
-        rv = attrs.get('roledescription', '')
-        self._roleDescription[hash(obj)] = rv
-        return rv
+        return attrs.get('roledescription', '')
 
     def getPositionInSet(self, obj):
-        rv = self._posinset.get(hash(obj))
-        if rv is not None:
-            return rv
-
         try:
-            attrs = dict([attr.split(':', 1) for attr in obj.getAttributes()])
+            attrs = _accessibleCache.getAttributes(obj)
         except:
             attrs = {}
 
         position = attrs.get('posinset')
         if position is not None:
-            rv = int(position)
+            return int(position)
 
-        self._posinset[hash(obj)] = rv
-        return rv
+        return None
 
     def getSetSize(self, obj):
-        rv = self._setsize.get(hash(obj))
-        if rv is not None:
-            return rv
-
         try:
-            attrs = dict([attr.split(':', 1) for attr in obj.getAttributes()])
+            attrs = _accessibleCache.getAttributes(obj)
         except:
             attrs = {}
 
         setsize = attrs.get('setsize')
         if setsize is not None:
-            rv = int(setsize)
+            return int(setsize)
 
-        self._setsize[hash(obj)] = rv
-        return rv
+        return None
 
     def _getID(self, obj):
-        if hash(obj) in self._id:
-            return self._id.get(hash(obj))
-
         try:
-            attrs = dict([attr.split(':', 1) for attr in obj.getAttributes()])
+            attrs = _accessibleCache.getAttributes(obj)
         except:
             return None
 
-        rv = attrs.get('id')
-        self._id[hash(obj)] = rv
-        return rv
+        return attrs.get('id')
 
     def _getDisplayStyle(self, obj):
-        if hash(obj) in self._displayStyle:
-            return self._displayStyle.get(hash(obj))
-
         try:
-            attrs = dict([attr.split(':', 1) for attr in obj.getAttributes()])
+            attrs = _accessibleCache.getAttributes(obj)
         except:
             return None
 
-        rv = attrs.get('display')
-        self._displayStyle[hash(obj)] = rv
-        return rv
+        return attrs.get('display')
 
     def _getTag(self, obj):
-        rv = self._tag.get(hash(obj))
-        if rv is not None:
-            return rv
-
         try:
-            attrs = dict([attr.split(':', 1) for attr in obj.getAttributes()])
+            attrs = _accessibleCache.getAttributes(obj)
         except:
             return None
 
-        rv = attrs.get('tag')
-        self._tag[hash(obj)] = rv
-        return rv
+        return attrs.get('tag')
 
     def _getXMLRoles(self, obj):
-        rv = self._xmlRoles.get(hash(obj))
-        if rv:
-            return rv
-
         try:
-            attrs = dict([attr.split(':', 1) for attr in obj.getAttributes()])
+            attrs = _accessibleCache.getAttributes(obj)
         except:
             return []
 
-        rv = attrs.get('xml-roles', '').split()
-        self._xmlRoles[hash(obj)] = rv
-        return rv
+        return attrs.get('xml-roles', '').split()
 
     def inFindToolbar(self, obj=None):
         if not obj:
@@ -1058,25 +1245,33 @@ class Utilities(script_utilities.Utilities):
 
     def _getTextAtOffset(self, obj, offset, boundary):
         if not obj:
-            msg = "WEB: Results for text at offset %i for %s using %s:\n" \
-                  "     String: '', Start: 0, End: 0. (obj is None)" % (offset, obj, boundary)
-            debug.println(debug.LEVEL_INFO, msg, True)
+            debug.printMessage(debug.LEVEL_INFO, "WEB",
+                               "Results for text at offset %i for %s using %s:\n"
+                               "     String: '', Start: 0, End: 0. (obj is None)",
+                               offset, obj, boundary)
             return '', 0, 0
 
         text = self.queryNonEmptyText(obj)
         if not text:
-            msg = "WEB: Results for text at offset %i for %s using %s:\n" \
-                  "     String: '', Start: 0, End: 1. (queryNonEmptyText() returned None)" \
-                  % (offset, obj, boundary)
-            debug.println(debug.LEVEL_INFO, msg, True)
+            debug.printMessage(debug.LEVEL_INFO, "WEB",
+                               "Results for text at offset %i for %s using %s:\n"
+                               "     String: '', Start: 0, End: 1. "
+                               "(queryNonEmptyText() returned None)",
+                               offset, obj, boundary)
             return '', 0, 1
 
+        # The results are logged for each call, so avoid the cost of doing so
+        # when debugging is off.
+        def _printResults(string, start, end, note=""):
+            s = lambda: string.replace("\n", "\\n")
+            debug.printMessage(debug.LEVEL_INFO, "WEB",
+                               "Results for text at offset %i for %s using %s:\n"
+                               "     String: '%s', Start: %i, End: %i.%s",
+                               offset, obj, boundary, s, start, end, note)
+
         if boundary is None:
             string, start, end = text.getText(offset, -1), offset, text.characterCount
-            s = string.replace(self.EMBEDDED_OBJECT_CHARACTER, "[OBJ]").replace("\n", "\\n")
-            msg = "WEB: Results for text at offset %i for %s using %s:\n" \
-                  "     String: '%s', Start: %i, End: %i." % (offset, obj, boundary, s, start, end)
-            debug.println(debug.LEVEL_INFO, msg, True)
+            _printResults(string, start, end)
             return string, start, end
 
         if boundary == pyatspi.TEXT_BOUNDARY_SENTENCE_START \
@@ -1085,10 +1280,7 @@ class Utilities(script_utilities.Utilities):
             if obj.getRole() in [pyatspi.ROLE_LIST_ITEM, pyatspi.ROLE_HEADING] \
                or not (re.search(r"\w", allText) and self.isTextBlockElement(obj)):
                 string, start, end = allText, 0, text.characterCount
-                s = string.replace(self.EMBEDDED_OBJECT_CHARACTER, "[OBJ]").replace("\n", "\\n")
-                msg = "WEB: Results for text at offset %i for %s using %s:\n" \
-                      "     String: '%s', Start: %i, End: %i." % (offset, obj, boundary, s, start, end)
-                debug.println(debug.LEVEL_INFO, msg, True)
+                _printResults(string, start, end)
                 return string, start, end
 
         offset = max(0, offset)
@@ -1096,11 +1288,7 @@ class Utilities(script_utilities.Utilities):
 
         # The above should be all that we need to do, but....
         if not self._attemptBrokenTextRecovery(obj, boundary=boundary):
-            s = string.replace(self.EMBEDDED_OBJECT_CHARACTER, "[OBJ]").replace("\n", "\\n")
-            msg = "WEB: Results for text at offset %i for %s using %s:\n" \
-                  "     String: '%s', Start: %i, End: %i.\n" \
-                  "     Not checking for broken text." % (offset, obj, boundary, s, start, end)
-            debug.println(debug.LEVEL_INFO, msg, True)
+            _printResults(string, start, end, "\n     Not checking for broken text.")
             return string, start, end
 
         needSadHack = False
@@ -1162,10 +1350,7 @@ class Utilities(script_utilities.Utilities):
             debug.println(debug.LEVEL_INFO, msg, True)
             return sadString, sadStart, sadEnd
 
-        s = string.replace(self.EMBEDDED_OBJECT_CHARACTER, "[OBJ]").replace("\n", "\\n")
-        msg = "WEB: Results for text at offset %i for %s using %s:\n" \
-              "     String: '%s', Start: %i, End: %i." % (offset, obj, boundary, s, start, end)
-        debug.println(debug.LEVEL_INFO, msg, True)
+        _printResults(string, start, end)
         return string, start, end
 
     def _getContentsForObj(self, obj, offset, boundary):
@@ -1182,14 +1367,14 @@ class Utilities(script_utilities.Utilities):
 
             # Because user agents will give us this text word at a time.
             if self.isOffScreenLink(obj) and self.queryNonEmptyText(obj) and obj.name:
-                msg = "WEB: Returning name as contents for %s (is off-screen)" % obj
-                debug.println(debug.LEVEL_INFO, msg, True)
+                debug.printMessage(debug.LEVEL_INFO, "WEB",
+                                   "Returning name as contents for %s (is off-screen)", obj)
                 return [[obj, 0, len(obj.name), obj.name]]
 
             # Because user agents will give us this text word at a time.
             if self.isOffScreenTextBlockElement(obj) and self.queryNonEmptyText(obj):
-                msg = "WEB: Returning all text as contents for %s (is off-screen)" % obj
-                debug.println(debug.LEVEL_INFO, msg, True)
+                debug.printMessage(debug.LEVEL_INFO, "WEB",
+                                   "Returning all text as contents for %s (is off-screen)", obj)
                 boundary = None
 
         role = obj.getRole()
@@ -1454,6 +1639,14 @@ class Utilities(script_utilities.Utilities):
         if layoutMode is None:
             layoutMode = _settingsManager.getSetting('layoutMode') or self._script.inFocusMode()
 
+        if useCache and layoutMode:
+            objects = self._lineCache.getLine(obj, offset, self.findObjectInContents)
+            if objects and self._cachedLineIsValid(objects):
+                self._currentLineContents = objects
+                return objects
+            if objects:
+                self._lineCache.invalidate(objects[0][0])
+
         objects = []
         extents = self.getExtents(obj, offset, offset + 1)
         if self.isInlineListDescendant(obj):
@@ -1540,6 +1733,9 @@ class Utilities(script_utilities.Utilities):
 
         if useCache:
             self._currentLineContents = objects
+            document = self.getDocumentForObject(firstObj)
+            self._lineCache.checkDocumentSize(document, self._getSize(document))
+            self._lineCache.addLine(objects, self._getLineAncestors(objects), document)
 
         return objects
 
@@ -1547,6 +1743,9 @@ class Utilities(script_utilities.Utilities):
         if obj is None:
             obj, offset = self.getCaretContext()
 
+        if layoutMode is None:
+            layoutMode = _settingsManager.getSetting('layoutMode') or self._script.inFocusMode()
+
         msg = "WEB: Current context is: %s, %i (focus: %s)" \
               % (obj, offset, orca_state.locusOfFocus)
         debug.println(debug.LEVEL_INFO, msg, True)
@@ -1567,6 +1766,14 @@ class Utilities(script_utilities.Utilities):
         if not (line and line[0]):
             return []
 
+        if useCache and layoutMode:
+            contents = self._lineCache.getPrevious(line)
+            if contents and self._cachedLineIsValid(contents):
+                msg = "WEB: Previous line is cached: %s" % contents
+                debug.println(debug.LEVEL_INFO, msg, True)
+                self._currentLineContents = contents
+                return contents
+
         firstObj, firstOffset = line[0][0], line[0][1]
         msg = "WEB: First context on line is: %s, %i" % (firstObj, firstOffset)
         debug.println(debug.LEVEL_INFO, msg, True)
@@ -1587,12 +1794,18 @@ class Utilities(script_utilities.Utilities):
             debug.println(debug.LEVEL_INFO, msg, True)
             return []
 
+        if useCache and layoutMode:
+            self._lineCache.setAdjacent(contents, line)
+
         return contents
 
     def getNextLineContents(self, obj=None, offset=-1, layoutMode=None, useCache=True):
         if obj is None:
             obj, offset = self.getCaretContext()
 
+        if layoutMode is None:
+            layoutMode = _settingsManager.getSetting('layoutMode') or self._script.inFocusMode()
+
         msg = "WEB: Current context is: %s, %i (focus: %s)" \
               % (obj, offset, orca_state.locusOfFocus)
         debug.println(debug.LEVEL_INFO, msg, True)
@@ -1613,6 +1826,14 @@ class Utilities(script_utilities.Utilities):
         if not (line and line[0]):
             return []
 
+        if useCache and layoutMode:
+            contents = self._lineCache.getNext(line)
+            if contents and self._cachedLineIsValid(contents):
+                msg = "WEB: Next line is cached: %s" % contents
+                debug.println(debug.LEVEL_INFO, msg, True)
+                self._currentLineContents = contents
+                return contents
+
         lastObj, lastOffset = line[-1][0], line[-1][2] - 1
         math = self.getMathAncestor(lastObj)
         if math:
@@ -1643,6 +1864,9 @@ class Utilities(script_utilities.Utilities):
             debug.println(debug.LEVEL_INFO, msg, True)
             return []
 
+        if useCache and layoutMode and line != contents:
+            self._lineCache.setAdjacent(line, contents)
+
         return contents
 
     def hasPresentableText(self, obj):
@@ -2628,6 +2852,7 @@ class Utilities(script_utilities.Utilities):
         if not objs:
             return None
 
+        self.inferLabelsFor(objs)
         for o in objs:
             label, sources = self.inferLabelFor(o)
             if obj in sources and label.strip() == string.strip():
@@ -3204,10 +3429,63 @@ class Utilities(script_utilities.Utilities):
         if rv is not None:
             return rv
 
+        self._inferLabelsInContainer(obj)
+        rv = self._inferredLabels.get(hash(obj))
+        if rv is not None:
+            return rv
+
         rv = self._script.labelInference.infer(obj, False)
         self._inferredLabels[hash(obj)] = rv
         return rv
 
+    def inferLabelsFor(self, objs):
+        """Infers the labels of those objs which need it in a single pass,
+        so that the geometry they share is only looked at once."""
+
+        objs = [x for x in objs if self.shouldInferLabelFor(x) \
+                and hash(x) not in self._inferredLabels]
+        if len(objs) < 2:
+            return {}
+
+        rv = self._script.labelInference.inferAll(objs)
+        self._inferredLabels.update(rv)
+        return rv
+
+    def _inferLabelsInContainer(self, obj):
+        """Infers the labels of all the widgets in the form containing obj, or
+        in its parent if it is not in a form, in a single pass. The labels are
+        kept until the container, or the parent of one of the widgets, has
+        children added or removed."""
+
+        isForm = lambda x: x and x.getRole() == pyatspi.ROLE_FORM
+        container = pyatspi.findAncestor(obj, isForm) or obj.parent
+        if not container or self.isDocument(container):
+            return
+
+        # The options of combo boxes and list boxes are not looked at.
+        def isOption(x):
+            try:
+                return x.parent.getRole() in [pyatspi.ROLE_COMBO_BOX, pyatspi.ROLE_LIST_BOX]
+            except:
+                return True
+
+        objs = self.findAllDescendants(container, self.shouldInferLabelFor, isOption)
+        labels = self.inferLabelsFor(objs)
+        if not labels:
+            return
+
+        msg = "WEB: Inferred %i labels in %s" % (len(labels), container)
+        debug.println(debug.LEVEL_INFO, msg, True)
+
+        containerKey = hash(container)
+        self._inferredLabelContainers.setdefault(containerKey, set()).update(labels)
+        for x in [container] + [x.parent for x in objs]:
+            try:
+                key = hash(x)
+            except:
+                continue
+            self._inferredLabelContainers.setdefault(key, set()).add(containerKey)
+
     def shouldInferLabelFor(self, obj):
         if not self.inDocumentContent() or self.inTopLevelWebApp():
             return False
@@ -3523,32 +3801,40 @@ class Utilities(script_utilities.Utilities):
         if not text:
             return -1, -1, 0
 
-        start, end = self.getHyperlinkRange(obj)
+        try:
+            hyperlinks = _accessibleCache.getHyperlinks(obj.parent)
+        except:
+            hyperlinks = None
+
+        if hyperlinks and hash(obj) in hyperlinks[2]:
+            start, end = hyperlinks[2][hash(obj)]
+        else:
+            start, end = self.getHyperlinkRange(obj)
+
         return start, end, text.characterCount
 
     def getChildAtOffset(self, obj, offset):
         try:
-            hypertext = obj.queryHypertext()
-        except NotImplementedError:
-            msg = "WEB: %s does not implement the hypertext interface" % obj
-            debug.println(debug.LEVEL_INFO, msg, True)
-            return None
+            hyperlinks = _accessibleCache.getHyperlinks(obj)
         except:
             msg = "WEB: Exception querying hypertext interface for %s" % obj
             debug.println(debug.LEVEL_INFO, msg, True)
             return None
 
-        index = hypertext.getLinkIndex(offset)
+        if hyperlinks is None:
+            msg = "WEB: %s does not implement the hypertext interface" % obj
+            debug.println(debug.LEVEL_INFO, msg, True)
+            return None
+
+        startOffsets, hyperlinks = hyperlinks[:2]
+        index = bisect.bisect_right(startOffsets, offset) - 1
         if index == -1:
             return None
 
-        hyperlink = hypertext.getLink(index)
-        if not hyperlink:
-            msg = "ERROR: No hyperlink object at index %i for %s" % (index, obj)
-            debug.println(debug.LEVEL_INFO, msg, True)
+        start, end, child = hyperlinks[index]
+        if not start <= offset < end:
             return None
 
-        child = hyperlink.getObject(0)
         msg = "WEB: Hyperlink object at index %i for %s is %s" % (index, obj, child)
         debug.println(debug.LEVEL_INFO, msg, True)
         return child
@@ -3766,6 +4052,7 @@ class Utilities(script_utilities.Utilities):
 
     def clearCaretContext(self, documentFrame=None):
         self.clearContentCache()
+        self.clearLineCache()
         documentFrame = documentFrame or self.documentFrame()
         if not documentFrame:
             return
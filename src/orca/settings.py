@@ -96,6 +96,7 @@ userCustomizableSettings = [
     "enableContractedBraille",
     "brailleContractionTable",
     "enableMouseReview",
+    "mouseReviewInterval",
     "speakCellCoordinates",
     "speakSpreadsheetCoordinates",
     "alwaysSpeakSelectedSpreadsheetRange",
@@ -302,6 +303,7 @@ presentLockingKeys           = None
 
 # Mouse review
 enableMouseReview          = False
+mouseReviewInterval        = 0.1
 
 # Progressbars
 speakProgressBarUpdates    = True
@@ -380,7 +380,7 @@ class SettingsManager(object):
             setattr(settings, str(key), value)
 
     def _setPronunciationsRuntime(self, pronunciationsDict):
-        pronunciation_dict.pronunciation_dict = {}
+        pronunciation_dict.clearPronunciations()
         for key, value in pronunciationsDict.values():
             if key and value:
                 pronunciation_dict.setPronunciation(key, value)
@@ -510,6 +510,12 @@ class SettingsManager(object):
 
         return scriptKeyBindings
 
+    def flush(self):
+        """Writes any settings changes the backend has yet to save to disk."""
+        flush = getattr(self._backend, 'flush', None)
+        if flush:
+            flush()
+
     def isFirstStart(self):
         """Check if the firstStart key is True or false"""
         return self._backend.isFirstStart()
@@ -0,0 +1,104 @@
+# Orca
+#
+# Copyright 2019. Orca Team.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., Franklin Street, Fifth Floor,
+# Boston MA  02110-1301 USA.
+
+"""Provides an index of on-screen items, e.g. flat review zones, by their
+extents, so that finding the items at a point or in a region of the screen
+does not require looking at all of them."""
+
+__id__        = "$Id$"
+__version__   = "$Revision$"
+__date__      = "$Date$"
+__copyright__ = "Copyright (c) 2019. Orca Team."
+__license__   = "LGPL"
+
+import bisect
+
+def getExtents(item):
+    """The default function for getting the extents of an item."""
+
+    return item.x, item.y, item.width, item.height
+
+class SpatialIndex:
+    """Indexes items by their extents. The items are kept sorted by their
+    top and by their left edge. Along with the tallest and widest extents,
+    this bounds the items which need to be looked at for a query to those
+    in the rows or columns concerned."""
+
+    def __init__(self, items, getExtents=getExtents):
+        self._byTop = []
+        self._byLeft = []
+        self._maxHeight = 0
+        self._maxWidth = 0
+
+        for i, item in enumerate(items):
+            try:
+                x, y, width, height = getExtents(item)
+            except:
+                continue
+
+            self._byTop.append((y, i, x, width, height, item))
+            self._byLeft.append((x, i, y, width, height, item))
+            self._maxHeight = max(self._maxHeight, height)
+            self._maxWidth = max(self._maxWidth, width)
+
+        self._byTop.sort(key=lambda entry: entry[:2])
+        self._byLeft.sort(key=lambda entry: entry[:2])
+        self._tops = [entry[0] for entry in self._byTop]
+        self._lefts = [entry[0] for entry in self._byLeft]
+
+    def __len__(self):
+        return len(self._byTop)
+
+    def getItemsInRows(self, y, height):
+        """Returns the items which intersect the rows from y to y + height,
+        sorted by their top and then by their order when indexed."""
+
+        start = bisect.bisect_left(self._tops, y - self._maxHeight)
+        end = bisect.bisect_right(self._tops, y + height)
+        return [entry[-1] for entry in self._byTop[start:end] \
+                if entry[0] + entry[4] > y or entry[0] == y]
+
+    def getItemsInColumns(self, x, width):
+        """Returns the items which intersect the columns from x to x + width,
+        sorted by their left edge and then by their order when indexed."""
+
+        start = bisect.bisect_left(self._lefts, x - self._maxWidth)
+        end = bisect.bisect_right(self._lefts, x + width)
+        return [entry[-1] for entry in self._byLeft[start:end] \
+                if entry[0] + entry[3] > x or entry[0] == x]
+
+    def getItemsInRect(self, x, y, width, height):
+        """Returns the items which intersect the given rectangle, sorted by
+        their top and then by their order when indexed."""
+
+        start = bisect.bisect_left(self._tops, y - self._maxHeight)
+        end = bisect.bisect_right(self._tops, y + height)
+        result = []
+        for top, i, left, itemWidth, itemHeight, item in self._byTop[start:end]:
+            if not (top + itemHeight > y or top == y):
+                continue
+            if left + itemWidth > x and left <= x + width:
+                result.append(item)
+
+        return result
+
+    def getItemsAtPoint(self, x, y):
+        """Returns the items whose extents contain the point x, y."""
+
+        return self.getItemsInRect(x, y, 0, 0)
@@ -1473,7 +1473,10 @@ class SpeechGenerator(generator.Generator):
         result = []
         acss = self.voice(SYSTEM)
         childCount = container.childCount
-        selectedCount = len(self._script.utilities.selectedChildren(container))
+        # Unlike selectedChildren, selectedChildCount does not fetch each
+        # selected child, so it also counts any defunct ones the container
+        # still reports. The whereAmI count has always done the same.
+        selectedCount = self._script.utilities.selectedChildCount(container)
         result.append(messages.selectedItemsCount(selectedCount, childCount))
         result.extend(acss)
         result.append(self._script.formatting.getString(
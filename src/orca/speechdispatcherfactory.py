@@ -42,7 +42,9 @@ import time
 from . import chnames
 from . import debug
 from . import guilabels
+from . import mathsymbols
 from . import messages
+from . import pronunciation_dict
 from . import speechserver
 from . import settings
 from . import orca_state
@@ -68,6 +70,19 @@ else:
 PUNCTUATION = re.compile(r'[^\w\s]', re.UNICODE)
 ELLIPSIS = re.compile('(\342\200\246|(?<!\\.)\\.{3,4}(?=(\\s|\\Z)))')
 
+# The text to be spoken is split into these tokens, in a single pass. Each
+# distinct token is adjusted for speech once, with the result being reused
+# until the settings which affect it change. A word is adjusted as a whole,
+# so it must not take the character a combining character combines with.
+#
+MARK = r'(?P<mark>\ue000)'
+WORD_SEPARATOR = r'(?P<separator>[ \u00a0](?=[^ \u00a0]))'
+ELLIPSIS_TOKEN = r'(?P<ellipsis>%s)' % ELLIPSIS.pattern
+COMBINING = r'(?P<combining>.[%s])'
+WORD = r'(?P<word>\w+)'
+COMBINED_WORD = r'(?P<word>(?:\w(?![%s]))+)'
+SYMBOL = r'(?P<symbol>[^\w\s])'
+
 class SpeechServer(speechserver.SpeechServer):
     # See the parent class for documentation.
 
@@ -76,6 +91,9 @@ class SpeechServer(speechserver.SpeechServer):
     DEFAULT_SERVER_ID = 'default'
     _SERVER_NAMES = {DEFAULT_SERVER_ID: guilabels.DEFAULT_SYNTHESIZER}
 
+    # The maximum number of tokens whose adjusted text we keep.
+    MAX_ADJUSTED_TOKENS = 10000
+
     @staticmethod
     def getFactoryName():
         return guilabels.SPEECH_DISPATCHER
@@ -122,6 +140,9 @@ class SpeechServer(speechserver.SpeechServer):
         self._id = serverId
         self._client = None
         self._current_voice_properties = {}
+        self._tokenizer = None
+        self._tokenizerSignature = None
+        self._adjustedTokens = {}
         self._acss_manipulators = (
             (ACSS.RATE, self._set_rate),
             (ACSS.AVERAGE_PITCH, self._set_pitch),
@@ -319,60 +340,120 @@ class SpeechServer(speechserver.SpeechServer):
 
         spokenEllipsis = messages.SPOKEN_ELLIPSIS + " "
         newText = re.sub(ELLIPSIS, spokenEllipsis, oldText)
-        symbols = set(re.findall(PUNCTUATION, newText))
-        for symbol in symbols:
+
+        def _replace(match):
+            symbol = match.group()
             try:
                 level, action = punctuation_settings.getPunctuationInfo(symbol)
             except:
-                continue
+                return symbol
 
             if level != punctuation_settings.LEVEL_NONE:
                 # Speech Dispatcher should handle it.
                 #
-                continue
+                return symbol
 
             charName = " %s " % chnames.getCharacterName(symbol)
             if action == punctuation_settings.PUNCTUATION_INSERT:
                 charName += symbol
-            newText = re.sub(symbol, charName, newText)
+            return charName
+
+        newText = re.sub(PUNCTUATION, _replace, newText)
 
         if orca_state.activeScript:
             newText = orca_state.activeScript.utilities.adjustForDigits(newText)
 
         return newText
 
+    def __getTokenizer(self, speakMath):
+        """Returns the compiled regular expression which splits text into
+        the tokens to be adjusted for speech. If any of the settings on which
+        the adjusted tokens depend have changed, they are discarded."""
+
+        style = _settingsManager.getSetting("verbalizePunctuationStyle")
+        signature = (style,
+                     speakMath,
+                     mathsymbols.speakStyle,
+                     mathsymbols.fallbackOnUnicodeData,
+                     settings.speakMultiCaseStringsAsWords,
+                     settings.speakNumbersAsDigits,
+                     settings.usePronunciationDictionary,
+                     pronunciation_dict.getGeneration())
+        if signature == self._tokenizerSignature:
+            return self._tokenizer
+
+        patterns = [MARK, WORD_SEPARATOR]
+        if style != settings.PUNCTUATION_STYLE_NONE:
+            patterns.append(ELLIPSIS_TOKEN)
+
+        combining = speakMath and mathsymbols.getCombiningCharacters()
+        if combining:
+            patterns.extend([COMBINING % combining, COMBINED_WORD % combining])
+        else:
+            patterns.append(WORD)
+        patterns.append(SYMBOL)
+
+        self._tokenizer = re.compile('|'.join(patterns), re.UNICODE)
+        self._tokenizerSignature = signature
+        self._adjustedTokens = {}
+        return self._tokenizer
+
+    @staticmethod
+    def __escape(text):
+        # Disable quotes for now, until speech dispatcher properly parses them
+        # (version 0.8.9 or later)
+        return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+    def __adjustToken(self, token, speakMath):
+        """Returns token adjusted for speech and escaped for SSML."""
+
+        token = self.__addVerbalizedPunctuation(token)
+        script = orca_state.activeScript
+        if script:
+            if speakMath:
+                token = mathsymbols.adjustForSpeech(token)
+            token = script.utilities.adjustWordsForPronunciation(token)
+
+        return self.__escape(token)
+
     def _speak(self, text, acss, **kwargs):
         if isinstance(text, ACSS):
             text = ''
 
-        # Mark beginning of words with U+E000 (private use) and record the
-        # string offsets
-        # Note: we need to do this before disturbing the text offsets
-        # Note2: we assume that text mangling below leave U+E000 untouched
-        marks_offsets = []
-        marked_text = ""
-
-        for i in range(len(text)):
-            c = text[i]
-            if c == '\ue000':
-                # Original text already contains U+E000. But syntheses will not
-                # know what to do of it anyway, so discard it
-                continue
-            marked_text += c
-
-            if (c == ' ' or c == '\u00a0') \
-               and i < len(text) - 1 \
-               and text[i + 1] != ' ' and text[i + 1] != '\u00a0':
-                # Word separation, add a mark
-                marks_offsets.append(i + 1)
-                marked_text += '\ue000'
-
-        text = marked_text
-
-        text = self.__addVerbalizedPunctuation(text)
-        if orca_state.activeScript:
-            text = orca_state.activeScript.\
-                utilities.adjustForPronunciation(text)
+        # A single character is spoken by name if it has one, which is not
+        # the case for the same character within a longer string.
+        if len(text) == 1:
+            text = self.__addVerbalizedPunctuation(text.replace('\ue000', ''))
+            if orca_state.activeScript:
+                text = orca_state.activeScript.\
+                    utilities.adjustForPronunciation(text)
+            text = self.__escape(text)
+        else:
+            script = orca_state.activeScript
+            speakMath = bool(script and script.utilities.speakMathSymbolNames())
+            tokenizer = self.__getTokenizer(speakMath)
+            adjustedTokens = self._adjustedTokens
+
+            # Mark the beginning of each word with its offset in the original
+            # text, which say all uses to track progress.
+            def _replace(match):
+                kind = match.lastgroup
+                if kind == 'mark':
+                    # Synthesizers would not know what to do with U+E000.
+                    return ''
+                if kind == 'separator':
+                    return '%s<mark name="%u"/>' % (match.group(), match.end())
+
+                token = match.group()
+                adjusted = adjustedTokens.get(token)
+                if adjusted is None:
+                    if len(adjustedTokens) >= self.MAX_ADJUSTED_TOKENS:
+                        adjustedTokens.clear()
+                    adjusted = self.__adjustToken(token, speakMath)
+                    adjustedTokens[token] = adjusted
+                return adjusted
+
+            text = re.sub(tokenizer, _replace, text)
 
         # Replace no break space characters with plain spaces since some
         # synthesizers cannot handle them.  See bug #591734.
@@ -384,34 +465,7 @@ class SpeechServer(speechserver.SpeechServer):
         #
         text = text.replace('\n.', '\n')
 
-        # Transcribe to SSML, translating U+E000 into marks
-        # Note: we need to do this after all mangling otherwise the ssml markup
-        # would get mangled too
-        ssml = "<speak>"
-        i = 0
-        for c in text:
-            if c == '\ue000':
-                if i >= len(marks_offsets):
-                    # This is really not supposed to happen
-                    msg = "%uth U+E000 does not have corresponding index" % i
-                    debug.println(debug.LEVEL_WARNING, msg, True)
-                else:
-                    ssml += '<mark name="%u"/>' % marks_offsets[i]
-                i += 1
-            # Disable for now, until speech dispatcher properly parses them (version 0.8.9 or later)
-            #elif c == '"':
-            #  ssml += '&quot;'
-            #elif c == "'":
-            #  ssml += '&apos;'
-            elif c == '<':
-              ssml += '&lt;'
-            elif c == '>':
-              ssml += '&gt;'
-            elif c == '&':
-              ssml += '&amp;'
-            else:
-              ssml += c
-        ssml += "</speak>"
+        ssml = "<speak>%s</speak>" % text
 
         self._apply_acss(acss)
         self._debug_sd_values("Speaking '%s' " % ssml)
@@ -28,7 +28,9 @@ __copyright__ = "Copyright (c) 2005-2009 Sun Microsystems Inc." \
 __license__   = "LGPL"
 
 import pyatspi
+import sys
 
+from . import accessible_cache
 from . import cmdnames
 from . import debug
 from . import eventsynthesizer
@@ -44,6 +46,7 @@ from . import settings
 from . import settings_manager
 from . import speech
 
+_accessibleCache = accessible_cache.getCache()
 _settingsManager = settings_manager.getManager()
 #############################################################################
 #                                                                           #
@@ -117,6 +120,248 @@ class MatchCriteria:
         for state in states:
             self.states.add(state)
 
+    @staticmethod
+    def _applyMatchType(collection, matchType, results):
+        if matchType == collection.MATCH_ALL:
+            return all(results)
+        if matchType == collection.MATCH_ANY:
+            return not results or any(results)
+        if matchType == collection.MATCH_NONE:
+            return not any(results)
+        if matchType == collection.MATCH_EMPTY:
+            return not results
+
+        return None
+
+    def matches(self, role, state, attrs):
+        """Returns True if an object with the given role, state set and dict
+        of object attributes meets these criteria, False if it does not, and
+        None if that can only be determined by the collection."""
+
+        if self.invert or self.interfaces:
+            return None
+
+        collection = self.collection
+        results = [r == role for r in self.roles]
+        rv = self._applyMatchType(collection, self.matchRoles, results)
+        if not rv:
+            return rv
+
+        results = [state.contains(s) for s in self.states.getStates()]
+        rv = self._applyMatchType(collection, self.matchStates, results)
+        if not rv:
+            return rv
+
+        results = []
+        for attr in self.objAttrs:
+            name, value = attr.split(':', 1)
+            results.append(value in attrs.get(name, '').split())
+
+        return self._applyMatchType(collection, self.matchObjAttrs, results)
+
+#############################################################################
+#                                                                           #
+# StructuralNavigationIndex                                                 #
+#                                                                           #
+#############################################################################
+
+class StructuralNavigationIndex:
+    """Contains the objects in a document which match each kind of
+    StructuralNavigationObject, in document order. Rather than being
+    rebuilt from scratch when the document changes, the index is patched
+    with the objects described by the events reporting the change.
+    Objects are ordered by their path; since paths change as siblings
+    come and go, they are computed when needed rather than stored.
+    """
+
+    def __init__(self):
+        self._matches = {}
+        self._members = {}
+        self._criteria = {}
+
+    def getMatches(self, key):
+        """Returns a copy of the list of objects for key, or None."""
+
+        matches = self._matches.get(key)
+        if matches is None:
+            return None
+
+        return matches.copy()
+
+    def getCriteria(self, key):
+        return self._criteria.get(key)
+
+    def setMatches(self, key, matches, criteria):
+        self._matches[key] = list(matches)
+        self._members[key] = set(map(hash, matches))
+        self._criteria[key] = criteria
+
+    def contains(self, key, obj):
+        return hash(obj) in self._members.get(key, ())
+
+    def _drop(self, key):
+        self._matches.pop(key, None)
+        self._members.pop(key, None)
+        self._criteria.pop(key, None)
+
+    @staticmethod
+    def _getPath(obj):
+        try:
+            path = pyatspi.utils.getPath(obj)
+        except:
+            return None
+
+        if -1 in path:
+            return None
+
+        return path
+
+    def bisect(self, key, path):
+        """Returns the index of the first object for key which is not before
+        path in the document. Objects which are no longer in the document
+        are removed as they are encountered."""
+
+        matches = self._matches[key]
+        lo, hi = 0, len(matches)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            midPath = self._getPath(matches[mid])
+            if midPath is None:
+                self._members[key].discard(hash(matches.pop(mid)))
+                hi -= 1
+            elif midPath < path:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def _insert(self, key, obj, path):
+        if hash(obj) in self._members[key]:
+            return
+
+        self._matches[key].insert(self.bisect(key, path), obj)
+        self._members[key].add(hash(obj))
+
+    def _remove(self, key, obj):
+        if hash(obj) not in self._members[key]:
+            return
+
+        self._members[key].discard(hash(obj))
+        matches = self._matches[key]
+        for i, match in enumerate(matches):
+            if match == obj:
+                matches.pop(i)
+                break
+
+    @staticmethod
+    def _getProperties(obj):
+        """Returns the (role, state, attrs) of obj which the criteria are
+        matched against, or None. They are fetched once for all the lists."""
+
+        try:
+            role = _accessibleCache.getRole(obj)
+            state = _accessibleCache.getState(obj)
+            attrs = _accessibleCache.getAttributes(obj)
+        except:
+            return None
+
+        return role, state, attrs
+
+    @staticmethod
+    def _isMatch(criteria, properties):
+        if properties is None:
+            return False
+
+        return criteria.matches(*properties)
+
+    def update(self, obj):
+        """Adds obj to, or removes it from, each list as needed. A list to
+        which obj should be added, but for which where it belongs in the
+        document cannot be determined, is dropped so that it is rebuilt."""
+
+        properties = self._getProperties(obj)
+        path = None
+        for key, criteria in list(self._criteria.items()):
+            isMatch = self._isMatch(criteria, properties)
+            if isMatch is None:
+                self._drop(key)
+            elif not isMatch:
+                self._remove(key, obj)
+            else:
+                path = path or self._getPath(obj)
+                if path is None:
+                    self._drop(key)
+                else:
+                    self._insert(key, obj, path)
+
+    def remove(self, obj):
+        """Removes obj from each list. Its descendants are removed once
+        they are found to no longer be in the document."""
+
+        for key in list(self._criteria):
+            self._remove(key, obj)
+
+    def addSubtree(self, root, maxSize):
+        """Adds root and its descendants to each list as needed. Returns
+        False, doing nothing, if the subtree has more than maxSize objects.
+        A list to which objects should be added, but for which where they
+        belong in the document cannot be determined, is dropped so that it
+        is rebuilt."""
+
+        objects = []
+        stack = [root]
+        while stack:
+            obj = stack.pop()
+            if not obj:
+                continue
+            objects.append(obj)
+            if len(objects) > maxSize:
+                return False
+            try:
+                stack.extend(reversed([child for child in obj]))
+            except:
+                continue
+
+        # The subtree is contiguous in document order, and objects were
+        # gathered in that order. So the new matches for each list can be
+        # inserted together where the root belongs, rather than one by one.
+        allProperties = list(map(self._getProperties, objects))
+        rootPath = None
+        for key, criteria in list(self._criteria.items()):
+            newMatches = []
+            for obj, properties in zip(objects, allProperties):
+                isMatch = self._isMatch(criteria, properties)
+                if isMatch is None:
+                    self._drop(key)
+                    break
+                if isMatch:
+                    newMatches.append(obj)
+            else:
+                if not newMatches:
+                    continue
+
+                members = self._members[key]
+                if any(hash(obj) in members for obj in newMatches):
+                    for obj in newMatches:
+                        path = self._getPath(obj)
+                        if path is None:
+                            self._drop(key)
+                            break
+                        self._insert(key, obj, path)
+                    continue
+
+                rootPath = rootPath or self._getPath(root)
+                if rootPath is None:
+                    self._drop(key)
+                    continue
+
+                i = self.bisect(key, rootPath)
+                self._matches[key][i:i] = newMatches
+                members.update(map(hash, newMatches))
+
+        return True
+
 ###########################################################################
 #                                                                         #
 # StructuralNavigationObject                                              #
@@ -634,6 +879,11 @@ class StructuralNavigation:
     IMAGE_ROLES = [pyatspi.ROLE_IMAGE,
                    pyatspi.ROLE_IMAGE_MAP]
 
+    # If more objects than this are added to a document at once, we throw
+    # away its index and let the collection find the matches again.
+    #
+    MAX_INDEX_PATCH_SIZE = 500
+
     def __init__(self, script, enabledTypes, enabled=False):
         """Creates an instance of the StructuralNavigation class.
 
@@ -676,10 +926,32 @@ class StructuralNavigation:
 
     def clearCache(self, document=None):
         if document:
-            self._objectCache[hash(document)] = {}
+            self._objectCache.pop(hash(document), None)
         else:
             self._objectCache = {}
 
+    def updateCache(self, event):
+        """Patches the index of the document containing the source of event,
+        which describes a change to that document's contents."""
+
+        document = self._script.utilities.getDocumentForObject(event.source)
+        index = self._objectCache.get(hash(document))
+        if not index:
+            return
+
+        if event.type.startswith("object:children-changed:add"):
+            if not index.addSubtree(event.any_data, self.MAX_INDEX_PATCH_SIZE):
+                msg = "STRUCTURAL NAVIGATION: Too many additions. Clearing %s" % document
+                debug.println(debug.LEVEL_INFO, msg, True)
+                self.clearCache(document)
+            return
+
+        if event.type.startswith("object:children-changed:remove"):
+            index.remove(event.any_data)
+            return
+
+        index.update(event.source)
+
     def structuralNavigationObjectCreator(self, name):
         """This convenience method creates a StructuralNavigationObject
         with the specified name and associated characteristics. (See the
@@ -864,17 +1136,19 @@ class StructuralNavigation:
             arg = [rowDiff, colDiff, oldRowHeaders, oldColHeaders]
             structuralNavigationObject.present(cell, arg)
 
-    def _getAll(self, structuralNavigationObject, arg=None):
-        """Returns all the instances of structuralNavigationObject."""
-        if not structuralNavigationObject.criteria:
-            return [], None
+    def _getIndex(self, structuralNavigationObject, arg=None):
+        """Returns the index for the current document along with the key
+        under which the instances of structuralNavigationObject are found,
+        finding those instances first if needed."""
 
         document = self._script.utilities.documentFrame()
-        cache = self._objectCache.get(hash(document), {})
+        index = self._objectCache.get(hash(document))
+        if index is None:
+            index = self._objectCache[hash(document)] = StructuralNavigationIndex()
+
         key = "%s:%s" % (structuralNavigationObject.objType, arg)
-        matches, criteria = cache.get(key, ([], None))
-        if matches:
-            return matches.copy(), criteria
+        if index.getCriteria(key):
+            return index, key
 
         col = document.queryCollection()
         criteria = structuralNavigationObject.criteria(col, arg)
@@ -890,10 +1164,16 @@ class StructuralNavigation:
         matches = col.getMatches(rule, col.SORT_ORDER_CANONICAL, 0, True)
         col.freeMatchRule(rule)
 
-        rv = matches.copy(), criteria
-        cache[key] = matches, criteria
-        self._objectCache[hash(document)] = cache
-        return rv
+        index.setMatches(key, matches, criteria)
+        return index, key
+
+    def _getAll(self, structuralNavigationObject, arg=None):
+        """Returns all the instances of structuralNavigationObject."""
+        if not structuralNavigationObject.criteria:
+            return [], None
+
+        index, key = self._getIndex(structuralNavigationObject, arg)
+        return index.getMatches(key), index.getCriteria(key)
 
     def goEdge(self, structuralNavigationObject, isStart, container=None, arg=None):
         if container is None:
@@ -942,37 +1222,54 @@ class StructuralNavigation:
           is needed and passed in as arg.
         """
 
-        matches, criteria = list(self._getAll(structuralNavigationObject, arg))
-        if not matches:
+        if not structuralNavigationObject.criteria:
             structuralNavigationObject.present(None, arg)
             return
 
-        if not isNext:
-            matches.reverse()
+        index, key = self._getIndex(structuralNavigationObject, arg)
+        criteria = index.getCriteria(key)
+        if not index.getMatches(key):
+            structuralNavigationObject.present(None, arg)
+            return
 
         def _isValidMatch(obj):
+            if self._script.utilities.isZombie(obj):
+                return False
             if self._script.utilities.isHidden(obj) or self._script.utilities.isEmpty(obj):
                 return False
             if not criteria.applyPredicate:
                 return True
             return structuralNavigationObject.predicate(obj)
 
-        def _getMatchingObjAndIndex(obj):
+        def _getMatchingObj(obj):
             while obj:
-                if obj in matches:
-                    return obj, matches.index(obj)
+                if index.contains(key, obj):
+                    return obj
                 obj = obj.parent
 
-            return None, -1
+            return None
 
         if not obj:
             obj, offset = self._script.utilities.getCaretContext()
-        thisObj, index = _getMatchingObjAndIndex(obj)
+        thisObj = _getMatchingObj(obj)
         if thisObj:
-            matches = matches[index:]
             obj = thisObj
 
+        # Matches which are descendants of obj come after it in document
+        # order, but may be before the caret. If obj is not itself a match,
+        # they are candidates in both directions.
         currentPath = pyatspi.utils.getPath(obj)
+        if isNext:
+            start = index.bisect(key, currentPath)
+            matches = index.getMatches(key)[start:]
+        else:
+            if thisObj:
+                end = index.bisect(key, currentPath) + 1
+            else:
+                end = index.bisect(key, currentPath + [sys.maxsize])
+            matches = index.getMatches(key)[:end]
+            matches.reverse()
+
         for i, match in enumerate(matches):
             if not _isValidMatch(match):
                 continue
@@ -995,7 +1292,7 @@ class StructuralNavigation:
         else:
             self._script.presentMessage(messages.WRAPPING_TO_TOP)
 
-        matches, criteria = list(self._getAll(structuralNavigationObject, arg))
+        matches = index.getMatches(key)
         if not isNext:
             matches.reverse()
 
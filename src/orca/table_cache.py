@@ -0,0 +1,321 @@
+# Orca
+#
+# Copyright 2019. Orca Team.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., Franklin Street, Fifth Floor,
+# Boston MA  02110-1301 USA.
+
+"""Caches what we learn about the layout of tables: their dimensions, their
+cells and the coordinates of those, their column headers, and which of
+their cells are on screen. Reading full rows and flat reviewing large
+tables, e.g. tree views with thousands of rows, otherwise means asking for
+each cell again on every move. The cached layout is updated as the AT-SPI
+events describing changes to the table arrive. The events which scripts are
+not already listening for are only listened for while some table is
+cached."""
+
+__id__        = "$Id$"
+__version__   = "$Revision$"
+__date__      = "$Date$"
+__copyright__ = "Copyright (c) 2019. Orca Team."
+__license__   = "LGPL"
+
+from . import debug
+
+class _TableModel:
+    """The cached layout of a single table."""
+
+    def __init__(self, table):
+        self.table = table
+        self.nRows = -1
+        self.nColumns = -1
+        self.readDimensions()
+        self.cells = {}
+        self.coordinates = {}
+        self.columnHeaders = {}
+        self.visibleKey = None
+        self.visibleRows = None
+        self.visibleCells = None
+
+    def readDimensions(self):
+        self.nRows = self.table.nRows
+        self.nColumns = self.table.nColumns
+
+    def clearVisible(self):
+        self.visibleKey = None
+        self.visibleRows = None
+        self.visibleCells = None
+
+    def dropCells(self, row=0, column=0):
+        """Drops the cells at or below row and at or after column. Since any
+        of the remaining cells may be at new coordinates, those are dropped."""
+
+        self.cells = {k: v for k, v in self.cells.items() \
+                      if k[0] < row or k[1] < column}
+        self.coordinates = {}
+        self.clearVisible()
+
+
+class TableCache:
+
+    # The maximum number of tables, and of cells per table, which are kept.
+    MAX_TABLES = 20
+    MAX_CELLS = 10000
+
+    # Events describing changes to the layout of tables which no script
+    # listens for. We listen for them only while some table is cached. The
+    # event manager passes us the others, e.g. children-changed, as they
+    # arrive.
+    LISTENED_EVENTS = ['object:row-inserted',
+                       'object:row-deleted',
+                       'object:column-inserted',
+                       'object:column-deleted',
+                       'object:model-changed',
+                       'object:state-changed:defunct']
+
+    def __init__(self):
+        self._tables = {}
+        self._listening = False
+
+    def getListeners(self):
+        """Returns the accessible-event listeners for the cache."""
+
+        return {eventType: self.invalidate for eventType in self.LISTENED_EVENTS}
+
+    def _setListening(self, listening):
+        if listening == self._listening:
+            return
+
+        # The event manager uses this module, so it is imported only once
+        # both have been loaded.
+        from . import event_manager
+        if listening:
+            event_manager.getManager().registerModuleListeners(self.getListeners())
+        else:
+            event_manager.getManager().deregisterModuleListeners(self.getListeners())
+
+        self._listening = listening
+        msg = "TABLE CACHE: Listening for table changes: %s" % listening
+        debug.println(debug.LEVEL_INFO, msg, True)
+
+    def clear(self):
+        """Drops all the cached tables."""
+
+        self._tables = {}
+        self._setListening(False)
+
+    def _dropModel(self, key):
+        self._tables.pop(key, None)
+        if not self._tables:
+            self._setListening(False)
+
+    def invalidate(self, event):
+        """Updates the cached layout of the event source for event."""
+
+        if not self._tables:
+            return
+
+        eventType = event.type
+        try:
+            key = hash(event.source)
+            model = self._tables.get(key)
+            if model is None and eventType.startswith('object:children-changed'):
+                # The cells of a table may be the children of its rows.
+                key = hash(event.source.parent)
+                model = self._tables.get(key)
+                if model is not None:
+                    model.dropCells()
+                return
+        except:
+            return
+
+        if model is None:
+            return
+
+        if eventType.startswith('object:row-reordered') \
+           or eventType.startswith('object:column-reordered') \
+           or eventType.startswith('object:state-changed:defunct'):
+            msg = "TABLE CACHE: Dropping %s for %s" % (event.source, eventType)
+            debug.println(debug.LEVEL_INFO, msg, True)
+            self._dropModel(key)
+            return
+
+        try:
+            if eventType.startswith('object:row-inserted') \
+               or eventType.startswith('object:row-deleted'):
+                model.readDimensions()
+                model.dropCells(row=event.detail1)
+            elif eventType.startswith('object:column-inserted') \
+                 or eventType.startswith('object:column-deleted'):
+                model.readDimensions()
+                model.columnHeaders = {}
+                model.dropCells(column=event.detail1)
+            elif eventType.startswith('object:children-changed'):
+                model.readDimensions()
+                model.dropCells()
+            elif eventType.startswith('object:model-changed'):
+                model.readDimensions()
+                model.columnHeaders = {}
+                model.dropCells()
+        except:
+            msg = "TABLE CACHE: Exception updating %s for %s" % (event.source, eventType)
+            debug.println(debug.LEVEL_INFO, msg, True)
+            self._dropModel(key)
+
+    def _getModel(self, obj):
+        try:
+            key = hash(obj)
+        except:
+            return None
+
+        model = self._tables.get(key)
+        if model is not None:
+            return model
+
+        try:
+            model = _TableModel(obj.queryTable())
+        except:
+            return None
+
+        if len(self._tables) >= self.MAX_TABLES:
+            self._tables.pop(next(iter(self._tables)))
+
+        self._tables[key] = model
+        self._setListening(True)
+        return model
+
+    def getDimensions(self, obj):
+        """Returns the (rows, columns) of table obj, or (-1, -1)."""
+
+        model = self._getModel(obj)
+        if model is None:
+            return -1, -1
+
+        return model.nRows, model.nColumns
+
+    def getCellAt(self, obj, row, column):
+        """Returns the cell of table obj at row, column, or None."""
+
+        model = self._getModel(obj)
+        if model is None:
+            return None
+
+        cell = model.cells.get((row, column))
+        if cell is not None:
+            return cell
+
+        try:
+            cell = model.table.getAccessibleAt(row, column)
+        except:
+            msg = "TABLE CACHE: Exception getting cell (%i, %i) of %s" % (row, column, obj)
+            debug.println(debug.LEVEL_INFO, msg, True)
+            return None
+
+        if cell is not None:
+            if len(model.cells) >= self.MAX_CELLS:
+                model.cells = {}
+            model.cells[(row, column)] = cell
+
+        return cell
+
+    def getCellCoordinates(self, obj, cell):
+        """Returns the (row, column) of cell in table obj last set with
+        setCellCoordinates, or None."""
+
+        model = self._getModel(obj)
+        if model is None:
+            return None
+
+        try:
+            return model.coordinates.get(hash(cell))
+        except:
+            return None
+
+    def setCellCoordinates(self, obj, cell, row, column):
+        model = self._getModel(obj)
+        if model is None:
+            return
+
+        try:
+            key = hash(cell)
+        except:
+            return
+
+        if len(model.coordinates) >= self.MAX_CELLS:
+            model.coordinates = {}
+        model.coordinates[key] = row, column
+
+    def getColumnHeader(self, obj, column):
+        """Returns the header of column of table obj, or None."""
+
+        model = self._getModel(obj)
+        if model is None:
+            return None
+
+        if column in model.columnHeaders:
+            return model.columnHeaders[column]
+
+        try:
+            header = model.table.getColumnHeader(column)
+        except:
+            msg = "TABLE CACHE: Exception getting header %i of %s" % (column, obj)
+            debug.println(debug.LEVEL_INFO, msg, True)
+            return None
+
+        model.columnHeaders[column] = header
+        return header
+
+    def getVisibleRows(self, obj, key):
+        """Returns the visible rows of table obj last set with key, or None.
+        key identifies the part of the table being shown, e.g. its extents
+        along with the cell in its top-left corner."""
+
+        model = self._getModel(obj)
+        if model is None or model.visibleKey != key:
+            return None
+
+        return model.visibleRows
+
+    def getVisibleCells(self, obj):
+        """Returns the on-screen cells of table obj for the visible rows last
+        set, or None."""
+
+        model = self._getModel(obj)
+        if model is None or model.visibleKey is None:
+            return None
+
+        return model.visibleCells
+
+    def setVisibleRows(self, obj, key, rows):
+        model = self._getModel(obj)
+        if model is None:
+            return
+
+        if model.visibleKey != key:
+            model.clearVisible()
+            model.visibleKey = key
+        model.visibleRows = rows
+
+    def setVisibleCells(self, obj, cells):
+        model = self._getModel(obj)
+        if model is None or model.visibleKey is None:
+            return
+
+        model.visibleCells = cells
+
+_cache = TableCache()
+
+def getCache():
+    return _cache
@@ -0,0 +1,82 @@
+"""Compares the time taken by colornames.rgbToName to name colors which are
+not among the CSS colors with that of the implementation it replaced, which
+parsed every CSS color and built a dict of distances for each lookup, and
+checks that both give the same names.
+
+Run with the orca sources on PYTHONPATH, e.g. from the top of the tree:
+
+    PYTHONPATH=src python3 test/harness/colornames_benchmark.py
+"""
+
+import random
+import time
+
+from orca import colornames
+
+NUM_COLORS = 5000
+
+def oldRgbToName(red, green, blue):
+    """rgbToName as it was before the parsed colors were kept."""
+
+    cssNames = colornames.cssNames
+    rgb = "#%02x%02x%02x" % (red, green, blue)
+    cssName = cssNames.get(rgb)
+    if cssName:
+        return cssName
+
+    colors = {}
+    for key, value in cssNames.items():
+        r, g, b = [int(s, 16) for s in (key[1:3], key[3:5], key[5:7])]
+        rd = abs(r - red) ** 2
+        gd = abs(g - green) ** 2
+        bd = abs(b - blue) ** 2
+        colors[(rd + gd + bd)] = key
+
+    d1 = min(colors.keys())
+    match = colors.pop(d1)
+    if not match in ["#000000", "#ffffff"]:
+        return cssNames.get(match)
+
+    d2 = min(colors.keys())
+    if d2 - d1 < d1:
+        match = colors.pop(d2)
+
+    return cssNames.get(match)
+
+def randomColors(n):
+    colors = []
+    while len(colors) < n:
+        color = tuple(random.randrange(256) for i in range(3))
+        if "#%02x%02x%02x" % color not in colornames.cssNames:
+            colors.append(color)
+    return colors
+
+def timeIt(function, colors):
+    start = time.perf_counter()
+    for color in colors:
+        function(*color)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    random.seed(0)
+    colors = randomColors(NUM_COLORS)
+    uncached = colornames.rgbToName.__wrapped__
+
+    for color in colors:
+        assert oldRgbToName(*color) == uncached(*color), \
+            'names differ for #%02x%02x%02x' % color
+
+    # A page typically uses a handful of colors, over and over.
+    repeated = colors[:20] * (NUM_COLORS // 20)
+    colornames.rgbToName.cache_clear()
+
+    old = timeIt(oldRgbToName, colors)
+    new = timeIt(uncached, colors)
+    oldRepeated = timeIt(oldRgbToName, repeated)
+    newRepeated = timeIt(colornames.rgbToName, repeated)
+
+    print('%i colors not among the CSS colors' % NUM_COLORS)
+    print('distinct colors, old:    %8.2f ms' % (old * 1000))
+    print('distinct colors, new:    %8.2f ms' % (new * 1000))
+    print('20 colors repeated, old: %8.2f ms' % (oldRepeated * 1000))
+    print('20 colors repeated, new: %8.2f ms' % (newRepeated * 1000))
@@ -0,0 +1,88 @@
+"""Measures how many events per second a loop resembling the event
+manager's can get through, depending on how it logs and on whether
+debugging is on:
+
+- eager: println with the message formatted by the caller, as before;
+- lazy: printMessage, which formats the message only if it is printed.
+
+Each event logs the messages the event manager logs for it. The events'
+sources are mock accessibles whose conversion to a string takes as long
+as an AT-SPI round trip would (ACCESSIBLE_STR_COST seconds).
+
+Run with the orca sources on PYTHONPATH, e.g. from the top of the tree:
+
+    PYTHONPATH=src python3 test/harness/debug_benchmark.py
+"""
+
+import os
+import time
+
+from orca import debug
+
+# An estimate of the cost of getting the name and role of an accessible.
+ACCESSIBLE_STR_COST = 0.00005
+
+NUM_EVENTS = 5000
+
+class MockAccessible:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        end = time.perf_counter() + ACCESSIBLE_STR_COST
+        while time.perf_counter() < end:
+            pass
+        return '[push button | %s]' % self.name
+
+class MockEvent:
+
+    def __init__(self, i):
+        self.type = 'object:state-changed:focused'
+        self.source = MockAccessible('button %i' % i)
+        self.host_application = MockAccessible('application')
+        self.detail1 = 1
+        self.detail2 = 0
+        self.any_data = None
+
+def eagerLogging(event):
+    debug.println(debug.LEVEL_INFO,
+                  'EVENT MANAGER: %s for %s in %s (%s, %s, %s)' \
+                  % (event.type, event.source, event.host_application,
+                     event.detail1, event.detail2, event.any_data), True)
+    debug.println(debug.LEVEL_INFO,
+                  'EVENT MANAGER: Getting script for %s' % event.host_application, True)
+    debug.println(debug.LEVEL_INFO,
+                  'EVENT MANAGER: Processing %s' % event.source, True)
+
+def lazyLogging(event):
+    debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER', '%s for %s in %s (%s, %s, %s)',
+                       event.type, event.source, event.host_application,
+                       event.detail1, event.detail2, event.any_data)
+    debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER',
+                       'Getting script for %s', event.host_application)
+    debug.printMessage(debug.LEVEL_INFO, 'EVENT MANAGER',
+                       'Processing %s', event.source)
+
+def throughput(log, events):
+    start = time.perf_counter()
+    for event in events:
+        log(event)
+    return len(events) / (time.perf_counter() - start)
+
+def run(label, level, subsystemLevels=None):
+    debug.debugLevel = level
+    debug.subsystemLevels = subsystemLevels or {}
+    events = [MockEvent(i) for i in range(NUM_EVENTS)]
+    print('%-36s eager: %8.0f events/s   lazy: %8.0f events/s' \
+          % (label, throughput(eagerLogging, events), throughput(lazyLogging, events)))
+
+if __name__ == '__main__':
+    debug.debugFile = open(os.devnull, 'w')
+    try:
+        run('debugging off', debug.LEVEL_SEVERE)
+        run('only WEB enabled', debug.LEVEL_OFF, {'WEB': debug.LEVEL_ALL})
+        run('debugging on', debug.LEVEL_ALL)
+    finally:
+        debug.debugFile.close()
+        debug.debugFile = None
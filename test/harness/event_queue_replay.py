@@ -0,0 +1,211 @@
+"""Replays recorded mixes of events through the event manager's queue and
+checks the order in which they come out: input first, focus changes ahead
+of the backlog of their application, each application's other events in
+the order in which they were queued, and nothing lost which is not stale.
+It also checks that repeated events from the same source collapse into
+the newest one, but only within the coalescing window.
+
+Run with the orca sources on PYTHONPATH, e.g. from the top of the tree:
+
+    PYTHONPATH=src python3 test/harness/event_queue_replay.py
+"""
+
+import pyatspi
+import time
+
+from orca import event_manager
+from orca import orca_state
+
+# (application, event type, priority) as queued during a session in which
+# a background application floods the bus while the user moves the focus
+# in the active one.
+RECORDING = [
+    ('gedit', 'object:children-changed:add', event_manager.PRIORITY_DEFAULT),
+    ('clock', 'object:text-changed:insert', event_manager.PRIORITY_DEFAULT),
+    ('gedit', 'object:state-changed:showing', event_manager.PRIORITY_DEFAULT),
+    ('clock', 'object:text-changed:delete', event_manager.PRIORITY_DEFAULT),
+    ('gedit', 'object:text-changed:insert', event_manager.PRIORITY_ACTIVE_APP),
+    (None, 'keyboard:press', event_manager.PRIORITY_INPUT),
+    ('clock', 'object:text-changed:insert', event_manager.PRIORITY_DEFAULT),
+    ('gedit', 'object:text-caret-moved', event_manager.PRIORITY_ACTIVE_APP),
+    ('firefox', 'object:state-changed:focused', event_manager.PRIORITY_FOCUS),
+    ('gedit', 'object:state-changed:focused', event_manager.PRIORITY_FOCUS),
+]
+
+# (application, event type, detail1) as sent by a web page which adds
+# content to a background tab while the user tabs through its links. The
+# page is in the active application.
+FLOODED_FOCUS_RECORDING = \
+    [('firefox', 'object:children-changed:add', 0)] * 200 \
+    + [('firefox', 'object:text-changed:insert', 0),
+       ('gedit', 'object:children-changed:add', 0),
+       ('firefox', 'object:state-changed:focused', 1),
+       ('firefox', 'object:text-caret-moved', 0)]
+
+# (application, event type, detail1) of repeated events from a single
+# object, e.g. a busy indicator of a chat client toggling while messages
+# arrive in its list.
+DUPLICATES_RECORDING = \
+    [('chat', 'object:state-changed:busy', i % 2) for i in range(100)] \
+    + [('chat', 'object:children-changed:add', 0) for i in range(100)]
+
+def replay(recording, starvationTimeout=0):
+    eventQueue = event_manager.EventQueue(event_manager.PRIORITY_DEFAULT + 1,
+                                          starvationTimeout,
+                                          event_manager.PRIORITY_ACTIVE_APP)
+    for i, (app, eventType, priority) in enumerate(recording):
+        eventQueue.put(((i, app, eventType), 0), priority, app)
+
+    result = []
+    while not eventQueue.empty():
+        event, timestamp = eventQueue.get_nowait()
+        result.append(event)
+
+    return result
+
+def check(recording, result):
+    assert sorted(i for i, app, eventType in result) == list(range(len(recording))), \
+        'events were lost or duplicated'
+
+    lastIndex = {}
+    for i, app, eventType in result:
+        if app is None or recording[i][2] < event_manager.PRIORITY_ACTIVE_APP:
+            continue
+        assert lastIndex.get(app, -1) < i, \
+            '%s event %i (%s) was dequeued out of order' % (app, i, eventType)
+        lastIndex[app] = i
+
+    firstInput = min(i for i, (app, eventType, priority) in enumerate(recording)
+                     if app is None)
+    assert result[0][0] == firstInput, 'input was not dequeued first'
+
+class StandInRegistry:
+    """Stands in for pyatspi.Registry, so that the event manager can be
+    created without an accessibility bus."""
+
+    def getDesktop(self, i):
+        return None
+
+class MockAccessible:
+
+    def __init__(self, name, app=None):
+        self.name = name
+        self.app = app
+
+    def getApplication(self):
+        return self.app
+
+class MockEvent:
+
+    def __init__(self, i, eventType, source, detail1=0, anyData=None):
+        self.index = i
+        self.type = eventType
+        self.source = source
+        self.host_application = source.app
+        self.detail1 = detail1
+        self.detail2 = 0
+        self.any_data = anyData
+
+class MockScript:
+
+    def __init__(self, app):
+        self.app = app
+
+def makeManager():
+    """Returns an event manager whose processed events are recorded in its
+    processed list rather than handed to scripts."""
+
+    pyatspi.Registry = StandInRegistry()
+    manager = event_manager.EventManager(asyncMode=False)
+    manager.processed = []
+    manager._processObjectEvent = manager.processed.append
+    return manager
+
+def replayThroughManager(manager, recording, sources=None):
+    """Queues the events of recording, as (application, event type, detail1)
+    tuples, with the event manager and returns those it then processes. If
+    given, sources holds the index of each event's source."""
+
+    apps = {}
+    objects = {}
+    for i, (appName, eventType, detail1) in enumerate(recording):
+        app = apps.setdefault(appName, MockAccessible(appName))
+        sourceIndex = sources[i] if sources else i
+        source = objects.setdefault((appName, sourceIndex),
+                                    MockAccessible('%s object %i' % (appName, sourceIndex), app))
+        manager._addToQueue(MockEvent(i, eventType, source, detail1), False, app)
+
+    while not manager._eventQueue.empty():
+        manager._dequeue()
+
+    return manager.processed
+
+def checkFloodedFocus():
+    manager = makeManager()
+    orca_state.activeScript = MockScript(None)
+    processed = replayThroughManager(manager, FLOODED_FOCUS_RECORDING)
+    orca_state.activeScript = None
+
+    focus = [e for e in processed if e.type == 'object:state-changed:focused']
+    assert focus, 'the focus event was lost'
+    firefox = [e for e in processed if e.host_application.name == 'firefox']
+    assert firefox[0] is focus[0], \
+        'the focus event was dequeued behind %s' % firefox[0].type
+    assert not [e for e in firefox if e.type.startswith('object:children-changed')], \
+        'the stale children-changed backlog was not dropped'
+    assert [e.type for e in firefox[1:]] == ['object:text-changed:insert',
+                                             'object:text-caret-moved'], \
+        'the remaining firefox events were lost or dequeued out of order'
+    assert [e for e in processed if e.host_application.name == 'gedit'], \
+        'the events of another application were dropped'
+
+    return processed
+
+def checkCoalescing():
+    manager = makeManager()
+    sources = [0] * len(DUPLICATES_RECORDING)
+    processed = replayThroughManager(manager, DUPLICATES_RECORDING, sources)
+
+    for eventType in set(eventType for app, eventType, detail1 in DUPLICATES_RECORDING):
+        survivors = [e for e in processed if e.type == eventType]
+        newest = max(i for i, (app, t, detail1) in enumerate(DUPLICATES_RECORDING)
+                     if t == eventType)
+        assert [e.index for e in survivors] == [newest], \
+            '%s: %s survived instead of only %i' \
+            % (eventType, [e.index for e in survivors], newest)
+
+    counts = manager.getCollapsedEventCounts()
+    assert counts == {'object:state-changed:busy': 99,
+                      'object:children-changed:add': 99}, \
+        'unexpected counts of collapsed events: %s' % counts
+
+    # Events further apart than the coalescing window are all kept.
+    manager = makeManager()
+    manager._coalescingWindow = 0.05
+    recording = DUPLICATES_RECORDING[:1] * 3
+    app = MockAccessible('chat')
+    source = MockAccessible('chat object', app)
+    for i, (appName, eventType, detail1) in enumerate(recording):
+        manager._addToQueue(MockEvent(i, eventType, source, detail1), False, app)
+        time.sleep(0.1)
+    while not manager._eventQueue.empty():
+        manager._dequeue()
+    assert [e.index for e in manager.processed] == [0, 1, 2], \
+        'events outside the coalescing window were collapsed'
+
+    return processed
+
+if __name__ == '__main__':
+    result = replay(RECORDING)
+    for i, app, eventType in result:
+        print('%2i %-8s %s' % (i, app, eventType))
+    check(RECORDING, result)
+    print('\nOK: %i events dequeued' % len(result))
+
+    processed = checkFloodedFocus()
+    print('OK: focus event from a flooded application dequeued first; '
+          '%i of %i events processed' % (len(processed), len(FLOODED_FOCUS_RECORDING)))
+
+    processed = checkCoalescing()
+    print('OK: %i repeated events collapsed into %i' \
+          % (len(DUPLICATES_RECORDING), len(processed)))
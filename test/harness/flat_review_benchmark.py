@@ -0,0 +1,88 @@
+"""Measures the memory used by, and the time taken to navigate, the flat
+review zones of a synthetic window of 5,000 zones (e.g. push buttons and
+table cells), along with their words and characters.
+
+Run with the orca sources on PYTHONPATH, e.g. from the top of the tree:
+
+    PYTHONPATH=src python3 test/harness/flat_review_benchmark.py
+
+Pointing PYTHONPATH at an older checkout gives the figures to compare.
+"""
+
+import time
+import tracemalloc
+
+import pyatspi
+
+from orca import flat_review
+
+NUM_ZONES = 5000
+ZONES_PER_LINE = 10
+
+class MockAccessible:
+    """A push button. Like most widgets, it does not implement the text
+    interface, so flat review fakes the words and characters of its zone."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def getRole(self):
+        return pyatspi.ROLE_PUSH_BUTTON
+
+    def queryText(self):
+        raise NotImplementedError
+
+def makeZones():
+    zones = []
+    for i in range(NUM_ZONES):
+        row, column = divmod(i, ZONES_PER_LINE)
+        string = 'Button number %i' % i
+        zones.append(flat_review.Zone(MockAccessible(string), string,
+                                      column * 120, row * 20, 110, 18))
+    return zones
+
+def navigate(zones):
+    """Visits every character of every word of every zone, as reviewing the
+    whole window by character would, and returns the number visited."""
+
+    count = 0
+    for zone in zones:
+        zone.x, zone.y, zone.width, zone.height
+        for word in zone.words:
+            for char in word.chars:
+                char.x, char.string
+                count += 1
+    return count
+
+def measureTime():
+    start = time.perf_counter()
+    zones = makeZones()
+    created = time.perf_counter() - start
+
+    start = time.perf_counter()
+    numChars = navigate(zones)
+    firstPass = time.perf_counter() - start
+
+    start = time.perf_counter()
+    navigate(zones)
+    secondPass = time.perf_counter() - start
+
+    return numChars, created, firstPass, secondPass
+
+def measureMemory():
+    tracemalloc.start()
+    zones = makeZones()
+    navigate(zones)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory
+
+if __name__ == '__main__':
+    numChars, created, firstPass, secondPass = measureTime()
+    memory = measureMemory()
+
+    print('%i zones, %i characters' % (NUM_ZONES, numChars))
+    print('creating the zones:       %8.1f ms' % (created * 1000))
+    print('first pass by character:  %8.1f ms' % (firstPass * 1000))
+    print('second pass by character: %8.1f ms' % (secondPass * 1000))
+    print('memory after a pass:      %8.1f MB' % (memory / 2**20))
@@ -0,0 +1,113 @@
+"""Compares the time taken to evaluate the speech formatting strings the way
+Generator.generate used to, re-evaluating the whole string after each
+NameError, with the compiled strings it now uses.
+
+The generator methods are replaced by functions returning a fixed result
+for each object of a mock accessible tree, so that only the cost of
+evaluating the formatting strings is measured.
+
+Run with the orca sources on PYTHONPATH, e.g. from the top of the tree:
+
+    PYTHONPATH=src python3 test/harness/generator_benchmark.py
+"""
+
+import sys
+import time
+import traceback
+
+from orca import formatting
+from orca import generator
+
+class Result(list):
+    """The result of a mock generator. It can also be called, e.g. as the
+    asString(...) or Text(...) of a formatting string, and returns itself."""
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+class MockAccessible:
+
+    def __init__(self, name, role, children=()):
+        self.name = name
+        self.role = role
+        self.children = list(children)
+
+def mockTree(depth=3, width=10):
+    """Returns the objects of a tree of mock accessibles."""
+
+    roles = list(formatting.formatting['speech'].keys())
+    objects = []
+    def add(level, index):
+        children = [add(level + 1, i) for i in range(width)] if level < depth else []
+        obj = MockAccessible('item %i.%i' % (level, index),
+                             roles[(level * width + index) % len(roles)],
+                             children)
+        objects.append(obj)
+        return obj
+    add(0, 0)
+    return objects
+
+def formattingStrings():
+    strings = set()
+    for role, formats in formatting.formatting['speech'].items():
+        if not isinstance(formats, dict):
+            continue
+        for formatType, string in formats.items():
+            if string:
+                strings.add(string)
+
+    return sorted(strings)
+
+def methodsFor(strings):
+    names = set()
+    for string in strings:
+        names.update(compile(string, '<formatting>', 'eval').co_names)
+
+    return {name: (lambda obj, name=name, **args: Result([name, obj.name]))
+            for name in names}
+
+def oldGenerate(formattingString, methodsDict, obj):
+    globalsDict = {'obj': obj, 'role': obj.role}
+    while True:
+        try:
+            return eval(formattingString, globalsDict)
+        except NameError:
+            info = sys.exc_info()[1].args[0]
+            arg = info.replace("name '", "").replace("' is not defined", "")
+            if arg not in methodsDict:
+                traceback.print_exc()
+                return []
+            globalsDict[arg] = methodsDict[arg](obj)
+
+def newGenerate(formattingString, methodsDict, obj):
+    globalsDict = {'obj': obj, 'role': obj.role}
+    results = generator._GeneratorResults(methodsDict, globalsDict, obj, {}, {})
+    return eval(generator._compileFormat(formattingString), globalsDict, results)
+
+def timeIt(function, strings, methodsDict, objects, repeat=3):
+    best = None
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        for i, obj in enumerate(objects):
+            function(strings[i % len(strings)], methodsDict, obj)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+if __name__ == '__main__':
+    strings = formattingStrings()
+    methodsDict = methodsFor(strings)
+    objects = mockTree()
+
+    for string in strings:
+        obj = objects[0]
+        assert oldGenerate(string, methodsDict, obj) == newGenerate(string, methodsDict, obj), \
+            'results differ for %s' % string
+
+    old = timeIt(oldGenerate, strings, methodsDict, objects)
+    new = timeIt(newGenerate, strings, methodsDict, objects)
+    print('%i formatting strings, %i objects' % (len(strings), len(objects)))
+    print('eval and catch NameError: %8.2f ms' % (old * 1000))
+    print('compiled:                 %8.2f ms' % (new * 1000))
+    print('speedup:                  %8.1fx' % (old / new))